@@ -1,35 +1,64 @@
-from flask import Flask, request, jsonify, session, send_from_directory, Blueprint
+from flask import Flask, request, jsonify, session, send_from_directory, send_file, Blueprint
 from flask_cors import CORS
 import jwt
 from pymongo import MongoClient
+from pymongo import UpdateOne, ReturnDocument
+from pymongo.errors import DuplicateKeyError
+import click
+import multiprocessing
 from bson import ObjectId
-import bcrypt
 from dotenv import load_dotenv
 import os
 import datetime
-import smtplib
-from email.mime.multipart import MIMEMultipart
-from email.mime.text import MIMEText
-from email.mime.base import MIMEBase
-from email import encoders
 from datetime import datetime, timedelta, timezone
 import uuid
-from werkzeug.utils import secure_filename
-from PIL import Image
+import re
 import io
+import hashlib
+from werkzeug.utils import secure_filename
+from werkzeug.security import safe_join
 from itsdangerous import URLSafeTimedSerializer
-from flask_mail import Mail, Message
 from routes.db import doctor_profiles_collection, doctor_availability_collection
 from routes.doctor_schedule_settings import schedule_settings
 from routes.doctor_schedule import doctor_schedule
 from routes.google_calendar import google_calendar
 from routes.doctor_public_route import doctor_routes
-from routes.notifications import notifications, schedule_appointment_reminders
+from routes.notifications import notifications, schedule_appointment_reminders, run_in_background, scheduler
+from services.auth import (
+    token_required, get_cached_user, invalidate_cached_user, bump_token_version,
+    get_token_version, build_claims, issue_access_token, cache_stats,
+    issue_refresh_token, rotate_refresh_token, revoke_refresh_token, RefreshTokenError
+)
+from services.doctor_refs import resolve_doctor_user_id, backfill_doctor_user_ids
+from services.indexes import ensure_indexes, check_indexes
+from services.reservations import hold_slot, release_slot, book_slot, held_times, SlotUnavailable, SlotIndexMissing, SLOT_INDEXES
+from services.outbox import enqueue_email, start_outbox_sender
+from services.loaders import request_loader
+from services.pagination import paginate, paginate_pipeline, page_headers, InvalidCursor
+from services.realtime import socketio, publish_message, publish_read
+from services.doctor_index import doctor_index
+from services.roster import record_visit, sync_patient, rebuild_roster
+from services.doctor_stats import (
+    record_appointment, record_message, record_read, get_doctor_stats,
+    appointments_on, appointments_since, rebuild_doctor_stats
+)
+from services.conditional import conditional, bump_version, bump_version_of, get_version, DOCTOR_DIRECTORY_VERSION
+from services.json_provider import MongoJSONProvider
+from services.compression import init_compression
+from services.passwords import hash_password, check_password, needs_rehash, PasswordHasherBusy
+from services.image_jobs import submit_upload, get_upload_job, job_response, ImageQueueFull
+from services.images import IMAGE_DERIVATIVES, FILE_MAX_AGE, derivative_folder, cached_derivative, file_etag
 import traceback
 
 load_dotenv()
 app = Flask(__name__)
-CORS(app)
+app.json = MongoJSONProvider(app)
+# Comma-separated origins allowed to call the API; the Socket.IO handshake uses the same list
+cors_origins = os.getenv('CORS_ORIGINS', '*')
+CORS_ORIGINS = '*' if cors_origins.strip() == '*' else [origin.strip() for origin in cors_origins.split(',') if origin.strip()]
+# Bare-list endpoints send their page info as headers (services/pagination.py)
+CORS(app, origins=CORS_ORIGINS, expose_headers=["X-Has-More", "X-Next-Cursor", "X-Prev-Cursor"])
+init_compression(app)
 
 secret_key = os.getenv('SECRET_KEY')
 app.config['SECRET_KEY'] = secret_key
@@ -40,17 +69,15 @@ app.config['MAX_CONTENT_LENGTH'] = 16 * 1024 * 1024  # 16MB max file size
 
 serializer = URLSafeTimedSerializer(app.config["SECRET_KEY"])
 
-# Add this to Flask app config
-app.config['MAIL_SERVER'] = 'smtp.gmail.com'
-app.config['MAIL_PORT'] = 587
-app.config['MAIL_USE_TLS'] = True
+# Outgoing mail settings, used by the email outbox sender (services/outbox.py).
+# Point MAIL_SERVER/MAIL_PORT at a local SMTP stand-in and set MAIL_USE_TLS=false for testing.
+app.config['MAIL_SERVER'] = os.getenv('MAIL_SERVER', 'smtp.gmail.com')
+app.config['MAIL_PORT'] = int(os.getenv('MAIL_PORT', 587))
+app.config['MAIL_USE_TLS'] = os.getenv('MAIL_USE_TLS', 'true').lower() == 'true'
 app.config['MAIL_USERNAME'] = os.getenv('SENDER_EMAIL')
 app.config['MAIL_PASSWORD'] = os.getenv('SENDER_PASSWORD')
 app.config['MAIL_DEFAULT_SENDER'] = os.getenv('SENDER_EMAIL')
 
-mail = Mail(app)
-app.mail = mail
-
 # Allowed image extensions only
 ALLOWED_EXTENSIONS = {'png', 'jpg', 'jpeg', 'gif'}
 
@@ -58,82 +85,6 @@ def allowed_file(filename):
     return '.' in filename and \
         filename.rsplit('.', 1)[1].lower() in ALLOWED_EXTENSIONS
 
-def compress_image(image_file, max_size_mb=2, quality=85, max_dimension=1920):
-    """
-    Compress image file to reduce size while maintaining reasonable quality
-
-    Args:
-        image_file: File object from request.files
-        max_size_mb: Maximum file size in MB (default: 2MB)
-        quality: JPEG quality (1-95, default: 85)
-        max_dimension: Maximum width or height (default: 1920px)
-
-    Returns:
-        Compressed image as BytesIO object, file extension
-    """
-    try:
-        # Open the image
-        image = Image.open(image_file)
-
-        # Convert RGBA to RGB if necessary (for JPEG compatibility)
-        if image.mode in ('RGBA', 'LA', 'P'):
-            # Create a white background
-            background = Image.new('RGB', image.size, (255, 255, 255))
-            if image.mode == 'P':
-                image = image.convert('RGBA')
-            background.paste(image, mask=image.split()[-1] if image.mode == 'RGBA' else None)
-            image = background
-        elif image.mode != 'RGB':
-            image = image.convert('RGB')
-
-        # Resize if image is too large
-        if max(image.size) > max_dimension:
-            # Calculate new size maintaining aspect ratio
-            ratio = max_dimension / max(image.size)
-            new_size = tuple(int(dim * ratio) for dim in image.size)
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-        # Try different compression levels to achieve target size
-        for q in [quality, 75, 60, 45, 30]:
-            output = io.BytesIO()
-
-            # Always save as JPEG for better compression
-            image.save(output, format='JPEG', quality=q, optimize=True)
-            output.seek(0)
-
-            # Check if size is acceptable
-            size_mb = len(output.getvalue()) / (1024 * 1024)
-
-            if size_mb <= max_size_mb:
-                output.seek(0)
-                return output, 'jpg'
-
-            output.close()
-
-        # If still too large, resize further
-        if max(image.size) > 1280:
-            ratio = 1280 / max(image.size)
-            new_size = tuple(int(dim * ratio) for dim in image.size)
-            image = image.resize(new_size, Image.Resampling.LANCZOS)
-
-            output = io.BytesIO()
-            image.save(output, format='JPEG', quality=60, optimize=True)
-            output.seek(0)
-            return output, 'jpg'
-
-        # Last resort - very aggressive compression
-        output = io.BytesIO()
-        image.save(output, format='JPEG', quality=30, optimize=True)
-        output.seek(0)
-        return output, 'jpg'
-
-    except Exception as e:
-        print(f"Error compressing image: {e}")
-        # Return original file if compression fails
-        image_file.seek(0)
-        original_extension = image_file.filename.rsplit('.', 1)[1].lower()
-        return image_file, original_extension
-
 MONGO_URI = os.getenv('MONGO_URI')
 client = MongoClient(MONGO_URI)
 db = client.mediconnect
@@ -149,6 +100,42 @@ doctor_availability_collection = db.doctor_availability
 medical_history_collection = db.medical_history
 prescriptions_collection = db.prescriptions
 visit_notes_collection = db.visit_notes
+refresh_tokens_collection = db.refresh_tokens
+
+# Image pool workers (services/image_jobs.py) import this module again when the
+# server is started with `python app.py`; they must not start any background work
+IS_POOL_WORKER = multiprocessing.parent_process() is not None
+
+# Indexes are declared in services/indexes.py; creating them is idempotent
+if os.getenv('ENSURE_INDEXES_ON_BOOT', 'true').lower() == 'true' and not IS_POOL_WORKER:
+    try:
+        ensure_indexes(db)
+    except Exception as e:
+        print(f"Index bootstrap failed: {e}")
+
+    # Bookings are refused (503) until these exist; make that visible at boot
+    try:
+        slot_index_report = check_indexes(db)
+        for collection_name, index_name in SLOT_INDEXES.items():
+            if index_name in slot_index_report.get(collection_name, {}).get("missing", []):
+                print(f"WARNING: {collection_name}.{index_name} is missing; bookings will be refused until `flask ensure-indexes` succeeds")
+    except Exception as e:
+        print(f"Index check failed: {e}")
+
+if not IS_POOL_WORKER:
+    start_outbox_sender(db, app.config)
+
+# Log this worker's auth cache counters every CACHE_STATS_LOG_SECONDS (0 disables)
+CACHE_STATS_LOG_SECONDS = int(os.getenv('CACHE_STATS_LOG_SECONDS', 600))
+if CACHE_STATS_LOG_SECONDS > 0 and scheduler.running:
+    scheduler.add_job(
+        lambda: print(f"Auth cache stats (pid {os.getpid()}): {cache_stats()}"),
+        'interval',
+        seconds=CACHE_STATS_LOG_SECONDS,
+        id='auth_cache_stats',
+        replace_existing=True
+    )
+socketio.init_app(app, cors_allowed_origins=CORS_ORIGINS)
 
 # Register custom blueprints
 app.register_blueprint(doctor_schedule)
@@ -158,6 +145,25 @@ app.register_blueprint(doctor_routes)
 app.register_blueprint(notifications)
 
 
+@app.errorhandler(PasswordHasherBusy)
+def handle_password_hasher_busy(e):
+    response = jsonify({"message": "Server is busy, please try again shortly."})
+    response.headers["Retry-After"] = "2"
+    return response, 503
+
+
+@app.errorhandler(SlotIndexMissing)
+def handle_slot_index_missing(e):
+    print(f"Refusing booking: {e}")
+    return jsonify({"error": "Booking is temporarily unavailable, please try again later."}), 503
+
+
+@app.errorhandler(ImageQueueFull)
+def handle_image_queue_full(e):
+    response = jsonify({"error": "Too many images are being processed, please try again shortly."})
+    response.headers["Retry-After"] = "5"
+    return response, 503
+
 # Signup route
 @app.route("/api/signup", methods=["POST"])
 def signup():
@@ -171,16 +177,23 @@ def signup():
             "message": "User already exists!"
         }), 400
 
-    hashed_password = bcrypt.hashpw(data.get("password").encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_password(data.get("password"))
     user = {
         "firstName": data.get("firstName"),
         "lastName": data.get("lastName"),
         "email": email,
         "password": hashed_password,
-        "role": data.get("role")
+        "role": data.get("role"),
+        "tokenVersion": 0
     }
 
-    users_collection.insert_one(user)
+    try:
+        users_collection.insert_one(user)
+    except DuplicateKeyError:
+        return jsonify({
+            "message": "User already exists!"
+        }), 400
+    invalidate_cached_user(email)
     return jsonify({
         "message": "Signup successful!"
     }), 201
@@ -194,25 +207,66 @@ def login():
 
     user = users_collection.find_one({"email": email})
 
-    if not user or not bcrypt.checkpw(password.encode('utf-8'), user["password"]):
+    if not user or not check_password(password, user["password"]):
         return jsonify({"message": "Invalid Credentials"}), 401
 
-    # Include role and doctorId in the token
-    token = jwt.encode({
-        "email": email,
-        "role": user.get("role"),
-        "doctorId": str(user["_id"]),
-        "exp": datetime.now(timezone.utc) + timedelta(hours=1)
-    }, app.config['SECRET_KEY'], algorithm="HS256")
+    # Transparently upgrade hashes made with an older work factor
+    if needs_rehash(user["password"]):
+        try:
+            users_collection.update_one(
+                {"_id": user["_id"], "password": user["password"]},
+                {"$set": {"password": hash_password(password)}}
+            )
+        except PasswordHasherBusy:
+            pass
+
+    # Include everything handlers need in the token so they can skip the users lookup
+    doctor_profile = None
+    if user.get("role") == "doctor":
+        doctor_profile = doctor_profiles_collection.find_one({"userId": str(user["_id"])}, {"_id": 1})
+    claims = build_claims(user, doctor_profile["_id"] if doctor_profile else None)
+    token = issue_access_token(claims)
 
     return jsonify({
         "token": token,
+        "refreshToken": issue_refresh_token(claims),
         "role": user.get("role"),
         "doctorId": str(user["_id"]),
         "name": f"{user.get('firstName', '')} {user.get('lastName', '')}".strip(),
         "email": user.get("email")
     })
 
+@app.route("/api/token/refresh", methods=["POST"])
+def refresh_token():
+    data = request.json or {}
+    token = data.get("refreshToken")
+    if not token:
+        return jsonify({"message": "Refresh token is missing"}), 400
+
+    try:
+        access_token, new_refresh_token = rotate_refresh_token(token)
+    except (jwt.InvalidTokenError, RefreshTokenError):
+        return jsonify({"message": "Invalid or expired refresh token."}), 401
+
+    return jsonify({
+        "token": access_token,
+        "refreshToken": new_refresh_token
+    })
+
+@app.route("/api/token/revoke", methods=["POST"])
+def revoke_token():
+    data = request.json or {}
+    token = data.get("refreshToken")
+    if not token:
+        return jsonify({"message": "Refresh token is missing"}), 400
+
+    try:
+        revoke_refresh_token(token)
+    except (jwt.InvalidTokenError, RefreshTokenError):
+        return jsonify({"message": "Invalid refresh token."}), 400
+
+    return jsonify({"message": "Refresh token revoked."})
+
 @app.route("/api/request-reset", methods=["POST"])
 def request_password_reset():
     data = request.json
@@ -226,9 +280,12 @@ def request_password_reset():
     reset_link = f"https://dal-mediconnect.netlify.app/reset-password?token={token}"
 
     try:
-        msg = Message("Password Reset Request", recipients=[email])
-        msg.body = f"Hi {user.get('firstName', '')},\n\nTo reset your password, click the following link:\n\n{reset_link}\n\nIf you did not request this, please ignore this email.\n\nThanks!"
-        mail.send(msg)
+        enqueue_email(
+            db,
+            email,
+            "Password Reset Request",
+            f"Hi {user.get('firstName', '')},\n\nTo reset your password, click the following link:\n\n{reset_link}\n\nIf you did not request this, please ignore this email.\n\nThanks!"
+        )
     except Exception as e:
         print(f"Email sending failed: {e}")
         return jsonify({"message": "Failed to send reset email."}), 500
@@ -249,12 +306,14 @@ def reset_password():
     except Exception as e:
         return jsonify({"message": "Invalid or expired token."}), 400
 
-    hashed_password = bcrypt.hashpw(new_password.encode('utf-8'), bcrypt.gensalt())
+    hashed_password = hash_password(new_password)
 
     result = users_collection.update_one(
         {"email": email},
         {"$set": {"password": hashed_password}}
     )
+    # Revoke every token issued before the reset
+    bump_token_version(email)
 
     if result.modified_count == 1:
         return jsonify({"message": "Password updated successfully."})
@@ -262,21 +321,7 @@ def reset_password():
         return jsonify({"message": "Something went wrong."}), 500
 
 def send_email_with_ics(name, recipient_email, doctor_name, date_str, time_str):
-    import smtplib
-    from email.mime.multipart import MIMEMultipart
-    from email.mime.text import MIMEText
-    from email.mime.base import MIMEBase
-    from email import encoders
-    from datetime import datetime, timedelta
-    import os
-
-    # Load sender credentials from .env
-    sender_email = os.environ.get('SENDER_EMAIL')
-    sender_password = os.environ.get('SENDER_PASSWORD')
-
-    if not sender_email or not sender_password:
-        raise Exception("Missing sender email credentials in environment variables")
-
+    """Queue the booking confirmation with an .ics invitation attached"""
     # Convert date and time strings to datetime objects
     start_dt = datetime.strptime(f"{date_str} {time_str}", "%Y-%m-%d %H:%M")
     end_dt = start_dt + timedelta(minutes=30)
@@ -303,12 +348,6 @@ END:VEVENT
 END:VCALENDAR
 """
 
-    # Create email
-    message = MIMEMultipart()
-    message['From'] = sender_email
-    message['To'] = recipient_email
-    message['Subject'] = 'Appointment Confirmation – MediConnect'
-
     body = f"""Hi {name},
 
 Your appointment with {doctor_name} is confirmed.
@@ -322,47 +361,49 @@ An invitation has been attached to add this to your calendar. Stay Relaxed! We w
 Thank you,  
 MediConnect Team
 """
-    message.attach(MIMEText(body, 'plain'))
 
-    # Attach ICS file
-    ics_part = MIMEBase('text', 'calendar', method="REQUEST", name="appointment.ics")
-    ics_part.set_payload(ics_content)
-    encoders.encode_base64(ics_part)
-    ics_part.add_header('Content-Disposition', 'attachment; filename="appointment.ics"')
-    message.attach(ics_part)
+    enqueue_email(
+        db,
+        recipient_email,
+        'Appointment Confirmation – MediConnect',
+        body,
+        attachments=[{
+            "filename": "appointment.ics",
+            "maintype": "text",
+            "subtype": "calendar",
+            "params": {"method": "REQUEST"},
+            "content": ics_content
+        }]
+    )
 
-    # Send the email
-    try:
-        server = smtplib.SMTP('smtp.gmail.com', 587)
-        server.starttls()
-        server.login(sender_email, sender_password)
-        server.send_message(message)
-        server.quit()
-    except Exception as e:
-        raise Exception(f"Failed to send email: {e}")
 
+@app.route('/api/appointments/hold', methods=['POST', 'DELETE'])
+@token_required
+def hold_appointment_slot(current_user):
+    """Hold a slot for a few minutes while the patient confirms the booking"""
+    data = request.get_json() or {}
 
-from functools import wraps
+    date = data.get('date')  # Format: 'YYYY-MM-DD'
+    time = data.get('time')  # Format: 'HH:MM'
+    doctor_id = data.get('doctorId')
 
-#Verifying the token
-def token_required(f):
-    @wraps(f)
-    def decorated(*args, **kwargs):
-        token = request.headers.get('Authorization')
-        if not token:
-            return jsonify({'message': 'Token is missing'}), 403
-        try:
-            token = token.split(" ")[1]  # Bearer <token>
-            data = jwt.decode(token, app.config['SECRET_KEY'], algorithms=["HS256"])
-            current_user = users_collection.find_one({"email": data['email']})
-            if not current_user:
-                return jsonify({'message': 'User not found'}), 404
-        except Exception as e:
-            print(e)
-            return jsonify({'message': 'Token is invalid'}), 403
-        return f(current_user, *args, **kwargs)
-    return decorated
+    if not all([date, time, doctor_id]):
+        return jsonify({"error": "Missing required fields"}), 400
 
+    doctor_user_id = resolve_doctor_user_id(doctor_id)
+    if not doctor_user_id:
+        return jsonify({"error": "Doctor not found"}), 404
+
+    if request.method == 'DELETE':
+        release_slot(db, doctor_user_id, date, time, current_user.get('email'))
+        return jsonify({"message": "Hold released"}), 200
+
+    try:
+        expires_at = hold_slot(db, doctor_user_id, date, time, current_user.get('email'))
+    except SlotUnavailable:
+        return jsonify({"error": "This appointment slot is already booked."}), 409
+
+    return jsonify({"message": "Slot held", "expiresAt": expires_at.isoformat()}), 200
 
 @app.route('/api/book', methods=['POST'])
 @token_required
@@ -377,63 +418,92 @@ def book_appointment(current_user):
     if not all([date, time, doctor_id, doctor_name]):
         return jsonify({"error": "Missing required fields"}), 400
 
+    doctor_user_id = resolve_doctor_user_id(doctor_id)
+    if not doctor_user_id:
+        return jsonify({"error": "Doctor not found"}), 404
+
     # Patient info from token
     name = f"{current_user.get('firstName', '')} {current_user.get('lastName', '')}".strip()
     email = current_user.get('email')
 
-    # ❗ Check if the slot is already booked
-    existing = appointments_collection.find_one({
+    appointment_doc = {
+        "patientName": name,
+        "patientEmail": email,
         "doctorId": doctor_id,
+        "doctorUserId": doctor_user_id,
+        "doctorName": doctor_name,
         "date": date,
-        "time": time
-    })
+        "time": time,
+        "bookedAt": datetime.now(timezone.utc)
+    }
 
-    if existing:
+    # The unique slot indexes make the hold claim and insert the commit point
+    try:
+        appointment_id = book_slot(db, appointment_doc, email)
+    except SlotUnavailable:
         return jsonify({"error": "This appointment slot is already booked."}), 409
+    except SlotIndexMissing:
+        raise
+    except Exception as e:
+        print(f"Error: {e}")
+        return jsonify({"error": "Failed to book appointment"}), 500
 
     try:
-        # Send confirmation email
-        send_email_with_ics(name, email, doctor_name, date, time)
-
-        # Insert new appointment
-        appointment_doc = {
-            "patientName": name,
-            "patientEmail": email,
-            "doctorId": doctor_id,
-            "doctorName": doctor_name,
-            "date": date,
-            "time": time,
-            "bookedAt": datetime.now(timezone.utc)
-        }
-        result = appointments_collection.insert_one(appointment_doc)
+        first_visit = record_visit(db, doctor_user_id, email, name, date)
+        record_appointment(db, doctor_user_id, date, first_visit)
+    except Exception as e:
+        print(f"Failed to update doctor roster/stats: {e}")
 
-        # Send confirmation email with ICS
+    # Confirmation email and reminders run after the commit, off the request path
+    try:
         send_email_with_ics(name, email, doctor_name, date, time)
-
-        # Schedule reminders
-        schedule_appointment_reminders(
-            str(result.inserted_id),
-            email,
-            doctor_name,
-            name,
-            date,
-            time
-        )
-        return jsonify({"message": "Appointment booked, confirmation sent, and reminders scheduled"}), 200
     except Exception as e:
-        print(f"Error: {e}")
-        return jsonify({"error": "Failed to book appointment or send email"}), 500
+        print(f"Failed to queue confirmation email: {e}")
+    run_in_background(
+        schedule_appointment_reminders,
+        str(appointment_id),
+        email,
+        doctor_name,
+        name,
+        date,
+        time
+    )
+    return jsonify({"message": "Appointment booked, confirmation sent, and reminders scheduled"}), 200
 
 @app.route("/api/appointments/<doctor_id>/<date>", methods=["GET"])
 def get_booked_slots(doctor_id, date):
+    # Bookings are keyed by the doctor's user id (served by doctor_slot_unique);
+    # callers may pass either that or the profile id
+    doctor_user_id = resolve_doctor_user_id(doctor_id)
+    if not doctor_user_id:
+        return jsonify({"bookedSlots": []})
+
     booked = appointments_collection.find({
-        "doctorId": doctor_id,
+        "doctorUserId": doctor_user_id,
         "date": date
-    })
+    }, {"time": 1})
 
     times = [slot["time"] for slot in booked]
+    # Held slots would be refused by book_slot as well
+    times += [time for time in held_times(db, doctor_user_id, date) if time not in times]
     return jsonify({"bookedSlots": times})
 
+def clinic_location(data):
+    """
+    The clinic's position from a profile form as a GeoJSON point for the
+    clinic_location 2dsphere index. Accepts {"lat": .., "lng": ..} or "lat,lng".
+    Returns None when not given; raises ValueError when malformed.
+    """
+    value = data.get("clinicLocation")
+    if value in (None, ""):
+        return None
+    if isinstance(value, dict):
+        value = f"{value.get('lat')},{value.get('lng')}"
+    coordinates = parse_coordinates(value)
+    if coordinates is None:
+        raise ValueError("clinicLocation must be a latitude/longitude pair")
+    return {"type": "Point", "coordinates": coordinates}
+
 @app.route("/api/doctor/profile", methods=["POST"])
 @token_required
 def create_doctor_profile(current_user):
@@ -446,6 +516,11 @@ def create_doctor_profile(current_user):
     if existing_profile:
         return jsonify({"message": "Doctor profile already exists"}), 400
 
+    try:
+        location = clinic_location(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     profile = {
         "userId": str(current_user["_id"]),
         "email": current_user.get("email"),
@@ -462,9 +537,18 @@ def create_doctor_profile(current_user):
         "profilePhoto": data.get("profilePhoto"),
         "createdAt": datetime.now(timezone.utc)
     }
+    if location:
+        profile["clinicLocation"] = location
 
-    doctor_profiles_collection.insert_one(profile)
-    return jsonify({"message": "Doctor profile created successfully"}), 201
+    result = doctor_profiles_collection.insert_one(profile)
+    doctor_index.upsert(profile, bump_version_of(db, DOCTOR_DIRECTORY_VERSION))
+
+    # Hand back a token that carries the new doctorProfileId claim
+    user = {**current_user, "tokenVersion": get_token_version(current_user["email"]) or 0}
+    return jsonify({
+        "message": "Doctor profile created successfully",
+        "token": issue_access_token(build_claims(user, result.inserted_id))
+    }), 201
 
 
 # Route to get patient basic info by email
@@ -508,11 +592,14 @@ def get_medical_history(current_user, patient_email):
         if current_user.get('role') != 'doctor':
             return jsonify({'error': 'Access denied'}), 403
 
-        history = list(medical_history_collection.find({"patientEmail": patient_email}))
-        for item in history:
-            item['_id'] = str(item['_id'])
-        return jsonify(history), 200
+        history, page = paginate(
+            medical_history_collection, {"patientEmail": patient_email}, [("_id", 1)],
+            default_limit=100, from_end=True
+        )
+        return page_headers(jsonify(history), page), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error fetching medical history: {e}")
         return jsonify({'error': 'Failed to fetch medical history'}), 500
@@ -537,10 +624,11 @@ def handle_prescriptions(current_user, patient_email):
             return jsonify({'error': 'Patient not found'}), 404
 
         if request.method == "GET":
-            prescriptions = list(prescriptions_collection.find({"patientEmail": patient_email}))
-            for item in prescriptions:
-                item['_id'] = str(item['_id'])
-            return jsonify(prescriptions), 200
+            prescriptions, page = paginate(
+                prescriptions_collection, {"patientEmail": patient_email}, [("_id", 1)],
+                default_limit=100, from_end=True
+            )
+            return page_headers(jsonify(prescriptions), page), 200
 
         elif request.method == "POST":
             data = request.get_json()
@@ -562,6 +650,8 @@ def handle_prescriptions(current_user, patient_email):
                 "prescriptionId": str(result.inserted_id)
             }), 201
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error handling prescriptions: {e}")
         return jsonify({'error': 'Failed to handle prescriptions'}), 500
@@ -577,10 +667,11 @@ def handle_visit_notes(current_user, patient_email):
             return jsonify({'error': 'Access denied'}), 403
 
         if request.method == "GET":
-            notes = list(visit_notes_collection.find({"patientEmail": patient_email}))
-            for item in notes:
-                item['_id'] = str(item['_id'])
-            return jsonify(notes), 200
+            notes, page = paginate(
+                visit_notes_collection, {"patientEmail": patient_email}, [("_id", 1)],
+                default_limit=100, from_end=True
+            )
+            return page_headers(jsonify(notes), page), 200
 
         elif request.method == "POST":
             data = request.get_json()
@@ -602,6 +693,8 @@ def handle_visit_notes(current_user, patient_email):
                 "noteId": str(result.inserted_id)
             }), 201
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error handling visit notes: {e}")
         return jsonify({'error': 'Failed to handle visit notes'}), 500
@@ -619,6 +712,16 @@ def update_doctor_profile(current_user):
     if not existing_profile:
         return jsonify({"message": "Doctor profile not found"}), 404
 
+    try:
+        name_update = name_fields(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
+    try:
+        location = clinic_location(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     updated_profile = {
         "clinicName": data.get("clinicName"),
         "specialization": data.get("specialization"),
@@ -633,15 +736,34 @@ def update_doctor_profile(current_user):
 
     if data.get("profilePhoto"):
         updated_profile["profilePhoto"] = data.get("profilePhoto")
+    if location:
+        updated_profile["clinicLocation"] = location
+
+    updated_profile.update(name_update)
 
     doctor_profiles_collection.update_one(
         {"userId": str(current_user["_id"])},
         {"$set": updated_profile}
     )
-    return jsonify({"message": "Doctor profile updated successfully"}), 200
+    invalidate_cached_user(current_user.get("email"))
+    doctor_index.upsert({**existing_profile, **updated_profile}, bump_version_of(db, DOCTOR_DIRECTORY_VERSION))
+
+    response = {"message": "Doctor profile updated successfully"}
+    if name_update:
+        response["token"] = propagate_name_change(current_user, name_update, "doctor", existing_profile["_id"])
+    return jsonify(response), 200
+
+def profile_version(collection, current_user):
+    # updatedAt/createdAt change on every profile write, so they version the profile
+    profile = collection.find_one({"userId": str(current_user["_id"])}, {"updatedAt": 1, "createdAt": 1})
+    if not profile:
+        return None
+    return f"{profile['_id']}:{profile.get('updatedAt') or profile.get('createdAt')}"
 
 @app.route("/api/doctor/profile", methods=["GET"])
 @token_required
+@conditional(lambda current_user: profile_version(doctor_profiles_collection, current_user)
+             if current_user.get("role") == "doctor" else None)
 def get_doctor_profile(current_user):
     if current_user.get("role") != "doctor":
         return jsonify({"message": "Access denied"}), 403
@@ -650,7 +772,6 @@ def get_doctor_profile(current_user):
     if not profile:
         return jsonify({"message": "Profile not found"}), 404
 
-    profile["_id"] = str(profile["_id"])
     return jsonify(profile)
 
 @app.route("/api/patient/profile", methods=["POST"])
@@ -685,6 +806,7 @@ def create_patient_profile(current_user):
 
     try:
         result = patient_profiles_collection.insert_one(profile)
+        sync_patient(db, current_user.get("email"), profile)
         return jsonify({"message": "Patient profile created successfully"}), 201
     except Exception as e:
         return jsonify({"message": f"Error creating profile: {str(e)}"}), 500
@@ -701,6 +823,11 @@ def update_patient_profile(current_user):
     if not existing_profile:
         return jsonify({"message": "Patient profile not found"}), 404
 
+    try:
+        name_update = name_fields(data)
+    except ValueError as e:
+        return jsonify({"message": str(e)}), 400
+
     updated_profile = {
         "dateOfBirth": data.get("dateOfBirth"),
         "gender": data.get("gender"),
@@ -717,14 +844,24 @@ def update_patient_profile(current_user):
     if data.get("profilePhoto"):
         updated_profile["profilePhoto"] = data.get("profilePhoto")
 
+    updated_profile.update(name_update)
+
     patient_profiles_collection.update_one(
         {"userId": str(current_user["_id"])},
         {"$set": updated_profile}
     )
-    return jsonify({"message": "Patient profile updated successfully"}), 200
+    invalidate_cached_user(current_user.get("email"))
+    sync_patient(db, current_user.get("email"), updated_profile)
+
+    response = {"message": "Patient profile updated successfully"}
+    if name_update:
+        response["token"] = propagate_name_change(current_user, name_update, "patient")
+    return jsonify(response), 200
 
 @app.route("/api/patient/profile", methods=["GET"])
 @token_required
+@conditional(lambda current_user: profile_version(patient_profiles_collection, current_user)
+             if current_user.get("role") == "patient" else None)
 def get_patient_profile(current_user):
     if current_user.get("role") != "patient":
         return jsonify({"message": "Access denied"}), 403
@@ -733,76 +870,148 @@ def get_patient_profile(current_user):
     if not profile:
         return jsonify({"message": "Profile not found"}), 404
 
-    profile["_id"] = str(profile["_id"])
     return jsonify(profile)
 
-@app.route("/api/doctors", methods=["GET"])
-@token_required
-def get_doctors(current_user):
-    # Allow only patients to access this endpoint (optional)
-    if current_user.get("role") != "patient":
-        return jsonify({"message": "Access denied"}), 403
+PARTICIPANT_ROLES = ('doctor', 'patient')
+
+def name_fields(data):
+    """Stripped firstName/lastName present in a profile update. Raises ValueError if one is not a string."""
+    name_update = {}
+    for field in ("firstName", "lastName"):
+        value = data.get(field)
+        if value is None or value == "":
+            continue
+        if not isinstance(value, str):
+            raise ValueError(f"{field} must be a string")
+        if value.strip():
+            name_update[field] = value.strip()
+    return name_update
+
+def display_name(user):
+    return f"{user.get('firstName', '')} {user.get('lastName', '')}".strip()
+
+def fill_participant_names(conversations):
+    """
+    Conversations store doctor_name/patient_name when created. Older ones are
+    filled in here from the users collection (one batched query) and written back.
+    """
+    missing = [
+        (conv, role) for conv in conversations for role in PARTICIPANT_ROLES
+        if conv.get(f'{role}_name') is None and conv.get(f'{role}_email')
+    ]
+    if not missing:
+        return
+
+    users = request_loader(users_collection, "email", {"firstName": 1, "lastName": 1})
+    users.prime(conv.get(f'{role}_email') for conv, role in missing)
+
+    updates = []
+    for conv, role in missing:
+        user = users.load(conv.get(f'{role}_email'))
+        if user:
+            conv[f'{role}_name'] = display_name(user)
+            updates.append(UpdateOne({"_id": conv["_id"]}, {"$set": {f'{role}_name': conv[f'{role}_name']}}))
+    if updates:
+        conversations_collection.bulk_write(updates, ordered=False)
+
+def propagate_name_change(current_user, name_update, role, doctor_profile_id=None):
+    """
+    Copy a changed first/last name to the users record and to every conversation
+    that displays it. Returns a fresh access token carrying the new name.
+    """
+    email = current_user.get('email')
+    users_collection.update_one({"email": email}, {"$set": name_update})
+    invalidate_cached_user(email)
+
+    user = {**current_user, **name_update, "tokenVersion": get_token_version(email) or 0}
+    if role in PARTICIPANT_ROLES:
+        conversations_collection.update_many(
+            {f"{role}_email": email},
+            {"$set": {f"{role}_name": display_name(user)}}
+        )
+        if role == 'patient':
+            sync_patient(db, email, patient_name=display_name(user))
+        # The name shows up in the other participants' inboxes
+        other_role = 'patient' if role == 'doctor' else 'doctor'
+        counterparts = conversations_collection.distinct(f"{other_role}_email", {f"{role}_email": email})
+        bump_version(db, *[inbox_version_key(other) for other in counterparts])
+    return issue_access_token(build_claims(user, doctor_profile_id or current_user.get("doctorProfileId")))
+
+def serialize_message(msg, sender_name):
+    message_item = {
+        "id": str(msg.get('_id')),
+        "sender_email": msg.get('sender_email'),
+        "sender_name": sender_name,
+        "sender_role": msg.get('sender_role'),
+        # Return message text only (no encryption)
+        "message": msg.get('message', ''),
+        "timestamp": msg.get('timestamp'),
+        "read": msg.get('read', False),
+        "message_type": msg.get('message_type', 'text')
+    }
 
-    doctors_cursor = doctor_profiles_collection.find(
-        {},
-        {
-            "_id": 1,
-            "firstName": 1,
-            "lastName": 1,
-            "specialization": 1,
-            "experience": 1,
-            "profilePhoto": 1,
-            "email": 1,
-            "qualification": 1
-        }
-    )
+    # Add image attachment info if present
+    if msg.get('image_attachment'):
+        message_item["image_attachment"] = msg.get('image_attachment')
 
-    doctors = []
-    for doc in doctors_cursor:
-        doctors.append({
-            "id": str(doc["_id"]),
-            "name": f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
-            "specialization": doc.get("specialization", ""),
-            "experience": doc.get("experience", ""),
-            "profilePhoto": f"https://mediconnect-backend-xe6f.onrender.com/api/files/{doc['profilePhoto']}" if doc.get("profilePhoto") else None,
-            "email": doc.get("email",""),
-            "qualification": doc.get("qualification","")
-        })
-    return jsonify(doctors)
+    return message_item
+
+def inbox_version_key(email):
+    # Bumped whenever anything in this user's conversation list changes
+    return f"inbox:{email}"
 
 @app.route('/api/conversations', methods=['GET'])
 @token_required
+@conditional(lambda current_user: f"{current_user.get('email')}:{current_user.get('role')}:"
+                                  f"{get_version(db, inbox_version_key(current_user.get('email')))}")
 def get_conversations(current_user):
     user_email = current_user.get('email')
     user_role = current_user.get('role')
 
-    conversations = conversations_collection.find({
-        "$or": [
-            {"doctor_email": user_email},
-            {"patient_email": user_email}
-        ]
-    }).sort("last_message_time", -1)
+    # Doctors only ever appear as doctor_email and patients as patient_email
+    if user_role in PARTICIPANT_ROLES:
+        query = {f"{user_role}_email": user_email}
+    else:
+        query = {"$or": [{"doctor_email": user_email}, {"patient_email": user_email}]}
+
+    try:
+        conversations, page = paginate(conversations_collection, query, [("last_message_time", -1), ("_id", -1)], {
+            "doctor_email": 1,
+            "patient_email": 1,
+            "doctor_name": 1,
+            "patient_name": 1,
+            "last_message": 1,
+            "last_message_time": 1,
+            "last_message_sender_email": 1,
+            f"unread_count_{user_role}": 1
+        })
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
+
+    fill_participant_names(conversations)
+
+    other_role = 'patient' if user_role == 'doctor' else 'doctor'
 
     result = []
     for conv in conversations:
-        other_user_email = conv.get('patient_email') if user_role == 'doctor' else conv.get('doctor_email')
-        other_user = users_collection.find_one({"email": other_user_email})
-
-        if other_user:
-            full_name = f"{other_user.get('firstName', '')} {other_user.get('lastName', '')}".strip()
-            result.append({
-                "id": str(conv.get('_id')),
-                "conversation_id": str(conv.get('_id')),
-                "other_user_name": full_name,
-                "other_user_email": other_user_email,
-                "other_user_role": other_user.get('role'),
-                "last_message": conv.get('last_message', ''),
-                "last_message_time": conv.get('last_message_time'),
-                "last_message_sender_email": conv.get('last_message_sender_email', ''),
-                "unread_count": conv.get(f'unread_count_{user_role}', 0)
-            })
+        other_user_name = conv.get(f'{other_role}_name')
+        if other_user_name is None:
+            # The other participant's account no longer exists
+            continue
+
+        result.append({
+            "id": str(conv.get('_id')),
+            "conversation_id": str(conv.get('_id')),
+            "other_user_name": other_user_name,
+            "other_user_email": conv.get(f'{other_role}_email'),
+            "other_user_role": other_role,
+            "last_message": conv.get('last_message', ''),
+            "last_message_time": conv.get('last_message_time'),
+            "last_message_sender_email": conv.get('last_message_sender_email', ''),
+            "unread_count": conv.get(f'unread_count_{user_role}', 0)
+        })
 
-    return jsonify({"conversations": result})
+    return jsonify({"conversations": result, "page": page})
 
 @app.route('/api/conversations/<conversation_id>/messages', methods=['GET'])
 @token_required
@@ -818,43 +1027,44 @@ def get_messages(current_user, conversation_id):
         if user_email not in [conversation.get('doctor_email'), conversation.get('patient_email')]:
             return jsonify({"error": "Unauthorized"}), 403
 
-        messages = messages_collection.find({
-            "conversation_id": ObjectId(conversation_id)
-        }).sort("timestamp", 1)
-
-        result = []
-        for msg in messages:
-            sender = users_collection.find_one({"email": msg.get('sender_email')})
-            sender_name = f"{sender.get('firstName', '')} {sender.get('lastName', '')}".strip() if sender else "Unknown"
-
-            # Return message text only (no encryption)
-            message_data = msg.get('message', '')
-
-            message_item = {
-                "id": str(msg.get('_id')),
-                "sender_email": msg.get('sender_email'),
-                "sender_name": sender_name,
-                "sender_role": msg.get('sender_role'),
-                "message": message_data,
-                "timestamp": msg.get('timestamp'),
-                "read": msg.get('read', False),
-                "message_type": msg.get('message_type', 'text')
-            }
+        # Latest page by default; before=<cursor> pages back through older messages
+        messages, page = paginate(
+            messages_collection,
+            {"conversation_id": ObjectId(conversation_id)},
+            [("timestamp", 1), ("_id", 1)],
+            from_end=True
+        )
 
-            # Add image attachment info if present
-            if msg.get('image_attachment'):
-                message_item["image_attachment"] = msg.get('image_attachment')
+        # Sender names come from the conversation's participant copies
+        fill_participant_names([conversation])
+        sender_names = {
+            conversation.get(f'{role}_email'): conversation.get(f'{role}_name')
+            for role in PARTICIPANT_ROLES
+        }
 
-            result.append(message_item)
+        result = [
+            serialize_message(msg, sender_names.get(msg.get('sender_email')) or "Unknown")
+            for msg in messages
+        ]
 
         # Mark messages as read for current user
         user_role = current_user.get('role')
-        conversations_collection.update_one(
+        before = conversations_collection.find_one_and_update(
             {"_id": ObjectId(conversation_id)},
-            {"$set": {f"unread_count_{user_role}": 0}}
+            {"$set": {f"unread_count_{user_role}": 0}},
+            projection={f"unread_count_{user_role}": 1}
         )
+        unread = (before or {}).get(f"unread_count_{user_role}", 0)
+        if unread:
+            bump_version(db, inbox_version_key(user_email))
+            if user_role == 'doctor':
+                record_read(db, str(current_user['_id']), unread)
+            try:
+                publish_read(conversation_id, user_email)
+            except Exception as e:
+                print(f"Realtime publish failed: {e}")
 
-        return jsonify({"messages": result})
+        return jsonify({"messages": result, "page": page})
 
     except Exception as e:
         return jsonify({"error": str(e)}), 400
@@ -909,7 +1119,7 @@ def send_message(current_user, conversation_id):
         other_role = 'patient' if user_role == 'doctor' else 'doctor'
         last_message = message_text if message_text else f"🖼️ {file_attachment.get('original_name', 'Image')}"
 
-        conversations_collection.update_one(
+        updated_conversation = conversations_collection.find_one_and_update(
             {"_id": ObjectId(conversation_id)},
             {
                 "$set": {
@@ -918,8 +1128,36 @@ def send_message(current_user, conversation_id):
                     "last_message_sender_email": user_email
                 },
                 "$inc": {f"unread_count_{other_role}": 1}
-            }
+            },
+            projection={"doctor_email": 1, "patient_email": 1, "doctor_name": 1, "patient_name": 1,
+                        "last_message": 1, "last_message_time": 1, "last_message_sender_email": 1,
+                        f"unread_count_{other_role}": 1},
+            return_document=ReturnDocument.AFTER
         )
+        bump_version(db, *[inbox_version_key(updated_conversation.get(f"{role}_email")) for role in PARTICIPANT_ROLES])
+
+        try:
+            if user_role == 'doctor':
+                doctor_user_id = str(current_user['_id'])
+            else:
+                doctor = get_cached_user(updated_conversation.get('doctor_email'))
+                doctor_user_id = str(doctor['_id']) if doctor else None
+            if doctor_user_id:
+                record_message(db, doctor_user_id, user_role == 'doctor', message_doc['timestamp'])
+        except Exception as e:
+            print(f"Failed to update doctor stats: {e}")
+
+        # Push to clients listening on the conversation and both inboxes
+        try:
+            sender_name = updated_conversation.get(f"{user_role}_name") or display_name(current_user)
+            publish_message(
+                updated_conversation,
+                serialize_message(message_doc, sender_name),
+                updated_conversation.get(f"{other_role}_email"),
+                updated_conversation.get(f"unread_count_{other_role}", 0)
+            )
+        except Exception as e:
+            print(f"Realtime publish failed: {e}")
 
         return jsonify({"message": "Message sent successfully"}), 201
 
@@ -965,9 +1203,14 @@ def start_conversation(current_user):
     doctor_email = user_email if user_role == 'doctor' else other_user_email
     patient_email = other_user_email if user_role == 'doctor' else user_email
 
+    doctor_user = current_user if user_role == 'doctor' else other_user
+    patient_user = other_user if user_role == 'doctor' else current_user
+
     conversation_doc = {
         "doctor_email": doctor_email,
         "patient_email": patient_email,
+        "doctor_name": display_name(doctor_user),
+        "patient_name": display_name(patient_user),
         "created_at": datetime.now(timezone.utc),
         "last_message": "",
         "last_message_time": datetime.now(timezone.utc),
@@ -975,7 +1218,18 @@ def start_conversation(current_user):
         "unread_count_patient": 0
     }
 
-    result = conversations_collection.insert_one(conversation_doc)
+    try:
+        result = conversations_collection.insert_one(conversation_doc)
+        bump_version(db, inbox_version_key(doctor_email), inbox_version_key(patient_email))
+    except DuplicateKeyError:
+        # Created concurrently by the other participant
+        existing_conv = conversations_collection.find_one(
+            {"doctor_email": doctor_email, "patient_email": patient_email}, {"_id": 1}
+        )
+        return jsonify({
+            "conversation_id": str(existing_conv.get('_id')),
+            "message": "Conversation already exists"
+        })
 
     return jsonify({
         "conversation_id": str(result.inserted_id),
@@ -1087,7 +1341,7 @@ def complete_key_exchange(current_user, conversation_id):
 @app.route('/api/upload', methods=['POST'])
 @token_required
 def upload_image(current_user):
-    """Upload image for messaging"""
+    """Accept an image for messaging; it is compressed in the background (see services/image_jobs.py)"""
     try:
         if 'file' not in request.files:
             return jsonify({"error": "No image provided"}), 400
@@ -1097,63 +1351,62 @@ def upload_image(current_user):
             return jsonify({"error": "No image selected"}), 400
 
         if file and allowed_file(file.filename):
-            # Get original file info
             original_filename = secure_filename(file.filename)
             file_content = file.read()
-            original_size = len(file_content)
-            file.seek(0)  # Reset file pointer
-
-            # Compress the image
-            print(f"Compressing image: {original_filename}, original size: {original_size / 1024 / 1024:.2f} MB")
-            compressed_file, compressed_extension = compress_image(file)
-
-            # Generate unique filename with compressed extension
-            unique_filename = f"{uuid.uuid4().hex}_{original_filename.rsplit('.', 1)[0]}.{compressed_extension}"
-
-            # Ensure upload directory exists
-            os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
 
-            # Save compressed file
-            filepath = os.path.join(app.config['UPLOAD_FOLDER'], unique_filename)
-
-            if hasattr(compressed_file, 'read'):
-                # It's a BytesIO object from compression
-                with open(filepath, 'wb') as f:
-                    f.write(compressed_file.read())
-                compressed_file.close()
-            else:
-                # It's the original file (compression failed)
-                compressed_file.save(filepath)
-
-            # Get compressed file info
-            compressed_size = os.path.getsize(filepath)
-            compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
-
-            print(f"Compression complete: {compressed_size / 1024 / 1024:.2f} MB, saved {compression_ratio:.1f}%")
+            job = submit_upload(db, current_user['email'], file_content, original_filename, app.config['UPLOAD_FOLDER'])
 
             return jsonify({
-                "message": "Image uploaded and compressed successfully",
-                "file_id": unique_filename,
-                "original_name": original_filename,
-                "file_size": compressed_size,
-                "file_type": compressed_extension,
-                "compression_stats": {
-                    "original_size": original_size,
-                    "compressed_size": compressed_size,
-                    "compression_ratio": f"{compression_ratio:.1f}%"
-                }
-            }), 201
+                "message": "Image accepted for processing",
+                **job_response(job),
+                "status_url": f"/api/upload/{job['_id']}"
+            }), 202
         else:
             return jsonify({"error": "Only image files (PNG, JPG, JPEG, GIF) are allowed"}), 400
 
+    except ImageQueueFull:
+        raise
     except Exception as e:
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/upload/<job_id>', methods=['GET'])
+@token_required
+def get_upload_status(current_user, job_id):
+    """Status of an image upload; once ready it includes the file_id"""
+    job = get_upload_job(db, job_id, current_user['email'])
+    if not job:
+        return jsonify({"error": "Upload not found"}), 404
+    return jsonify(job_response(job)), 200
+
 @app.route('/api/files/<filename>')
 def serve_image(filename):
-    """Serve uploaded images"""
+    """Serve uploaded images; ?size=thumb or ?size=medium serves a smaller copy"""
+    size = request.args.get('size', 'full')
+    if size != 'full' and size not in IMAGE_DERIVATIVES:
+        return jsonify({"error": f"size must be one of: full, {', '.join(IMAGE_DERIVATIVES)}"}), 400
+
     try:
-        return send_from_directory(app.config['UPLOAD_FOLDER'], filename)
+        if size != 'full':
+            folder = derivative_folder(app.config['UPLOAD_FOLDER'], size)
+            if os.path.isfile(safe_join(folder, filename) or ''):
+                response = send_from_directory(folder, filename, mimetype='image/jpeg',
+                                               etag=file_etag(filename, size), max_age=FILE_MAX_AGE)
+                response.cache_control.immutable = True
+                return response
+            derivative = cached_derivative(app.config['UPLOAD_FOLDER'], filename, size)
+            if derivative is not None:
+                # No mtime to derive a validator from; hash the bytes for older uploads
+                etag = file_etag(filename, size)
+                if etag is True:
+                    etag = hashlib.sha1(derivative).hexdigest()
+                response = send_file(io.BytesIO(derivative), mimetype='image/jpeg', etag=etag, max_age=FILE_MAX_AGE)
+                response.cache_control.immutable = True
+                return response
+            # Not an image we can scale; fall back to the file itself
+        response = send_from_directory(app.config['UPLOAD_FOLDER'], filename,
+                                       etag=file_etag(filename), max_age=FILE_MAX_AGE)
+        response.cache_control.immutable = True
+        return response
     except Exception as e:
         return jsonify({"error": "File not found"}), 404
 
@@ -1180,7 +1433,7 @@ def create_video_session(current_user):
 
         # Check if user has access to this appointment
         has_access = False
-        if user_role == 'doctor' and appointment.get('doctorName') in [f"Dr. {current_user.get('firstName')} {current_user.get('lastName')}", f"{current_user.get('firstName')} {current_user.get('lastName')}"]:
+        if user_role == 'doctor' and appointment.get('doctorUserId') == str(current_user['_id']):
             has_access = True
         elif user_role == 'patient' and appointment.get('patientEmail') == user_email:
             has_access = True
@@ -1204,6 +1457,7 @@ def create_video_session(current_user):
             "appointment_id": appointment_id,
             "room_id": room_id,
             "doctor_email": appointment.get('doctorName', '').lower().replace(' ', '.') + '@mediconnect.com',  # Placeholder
+            "doctor_user_id": appointment.get('doctorUserId'),
             "patient_email": appointment.get('patientEmail'),
             "status": "active",
             "created_at": datetime.now(timezone.utc),
@@ -1396,25 +1650,32 @@ def get_appointments(current_user):
         user_role = current_user.get('role')
 
         if user_role == 'patient':
-            appointments = list(appointments_collection.find({"patientEmail": user_email}))
+            appointments, page = paginate(
+                appointments_collection, {"patientEmail": user_email},
+                [("date", -1), ("time", -1), ("_id", -1)], default_limit=100
+            )
         elif user_role == 'doctor':
-            doctor_name = f"Dr. {current_user.get('firstName', '')} {current_user.get('lastName', '')}".strip()
-            appointments = list(appointments_collection.find({"doctorName": doctor_name}))
+            # (date, time) is unique per doctor, so it is a complete keyset on its own
+            appointments, page = paginate(
+                appointments_collection, {"doctorUserId": str(current_user['_id'])},
+                [("date", -1), ("time", -1)], default_limit=100
+            )
         else:
             return jsonify({"error": "Invalid user role"}), 400
 
+        doctor_profiles = request_loader(doctor_profiles_collection, "userId", {"profilePhoto": 1, "specialization": 1})
+        doctor_profiles.prime(appt.get('doctorUserId') for appt in appointments)
+
         for appt in appointments:
-            appt['_id'] = str(appt['_id'])
             appointment_datetime = datetime.strptime(f"{appt['date']} {appt['time']}", "%Y-%m-%d %H:%M")
             current_datetime = datetime.now()
             appt['status'] = 'upcoming' if appointment_datetime > current_datetime else 'completed'
 
-            doctor_id = appt.get('doctorId')
+            doctor_user_id = appt.get('doctorUserId')
 
-            if doctor_id:
+            if doctor_user_id:
                 try:
-                    doctor_obj_id = ObjectId(doctor_id)
-                    doctor_profile = doctor_profiles_collection.find_one({"_id": doctor_obj_id})
+                    doctor_profile = doctor_profiles.load(doctor_user_id)
 
                     if doctor_profile and 'profilePhoto' in doctor_profile:
                         appt['avatar'] = doctor_profile['profilePhoto']
@@ -1430,8 +1691,10 @@ def get_appointments(current_user):
             if user_role == 'doctor':
                 appt['specialization'] = current_user.get('specialization', 'Not specified')
 
-        return jsonify({"appointments": appointments}), 200
+        return jsonify({"appointments": appointments, "page": page}), 200
 
+    except InvalidCursor as e:
+        return jsonify({"error": str(e)}), 400
     except Exception as e:
         print(f"Error fetching appointments: {e}")
         return jsonify({"error": "Failed to fetch appointments"}), 500
@@ -1452,71 +1715,19 @@ def get_doctor_today_appointments(current_user, doctor_id):
         today = datetime.now().date()
         today_str = today.strftime('%Y-%m-%d')
 
-        # Get doctor profile to find the correct doctor name
-        doctor_profile = doctor_profiles_collection.find_one({"userId": doctor_id})
-        if not doctor_profile:
-            doctor_profile = doctor_profiles_collection.find_one({"_id": ObjectId(doctor_id)})
-
-        # Try multiple ways to match appointments
-        doctor_name_variations = []
-        if doctor_profile:
-            first_name = doctor_profile.get('firstName', '')
-            last_name = doctor_profile.get('lastName', '')
-            doctor_name_variations.extend([
-                f"Dr. {first_name} {last_name}".strip(),
-                f"{first_name} {last_name}".strip(),
-                f"Dr {first_name} {last_name}".strip(),
-                f"Dr.{first_name} {last_name}".strip()
-            ])
-
-        # Also try with current user info
-        user_first = current_user.get('firstName', '')
-        user_last = current_user.get('lastName', '')
-        if user_first or user_last:
-            doctor_name_variations.extend([
-                f"Dr. {user_first} {user_last}".strip(),
-                f"{user_first} {user_last}".strip(),
-                f"Dr {user_first} {user_last}".strip()
-            ])
-
-        print(f"Searching for appointments with doctor variations: {doctor_name_variations}")
-        print(f"Doctor ID: {doctor_id}")
-
-        # Query appointments for today using multiple criteria
-        today_query = {
-            '$and': [
-                {'date': today_str},
-                {
-                    '$or': [
-                        {'doctorId': doctor_id},
-                        {'doctorId': str(doctor_id)},
-                        {'doctorName': {'$in': doctor_name_variations}}
-                    ]
-                }
-            ]
-        }
-
-        today_appointments = list(appointments_collection.find(today_query).sort('time', 1))
-
-        # Query upcoming appointments (next 7 days)
-        upcoming_query = {
-            '$and': [
-                {'date': {'$gt': today_str}},
-                {
-                    '$or': [
-                        {'doctorId': doctor_id},
-                        {'doctorId': str(doctor_id)},
-                        {'doctorName': {'$in': doctor_name_variations}}
-                    ]
-                }
-            ]
-        }
+        # Accept either the doctor's user id or profile id
+        doctor_user_id = resolve_doctor_user_id(doctor_id) or doctor_id
 
-        upcoming_appointments = list(appointments_collection.find(upcoming_query).sort([('date', 1), ('time', 1)]).limit(10))
+        today_appointments = list(appointments_collection.find({
+            'doctorUserId': doctor_user_id,
+            'date': today_str
+        }).sort('time', 1))
 
-        # Convert ObjectIds to strings
-        for apt in today_appointments + upcoming_appointments:
-            apt['_id'] = str(apt['_id'])
+        # Upcoming appointments after today
+        upcoming_appointments = list(appointments_collection.find({
+            'doctorUserId': doctor_user_id,
+            'date': {'$gt': today_str}
+        }).sort([('date', 1), ('time', 1)]).limit(10))
 
         print(f"Found {len(today_appointments)} today appointments and {len(upcoming_appointments)} upcoming appointments")
 
@@ -1525,7 +1736,7 @@ def get_doctor_today_appointments(current_user, doctor_id):
             'upcoming': upcoming_appointments,
             'debug': {
                 'doctor_id': doctor_id,
-                'doctor_names_searched': doctor_name_variations,
+                'doctor_user_id': doctor_user_id,
                 'today_date': today_str
             }
         }), 200
@@ -1537,6 +1748,11 @@ def get_doctor_today_appointments(current_user, doctor_id):
         return jsonify({'error': 'Failed to fetch appointments'}), 500
 
 # 2. Doctor patients endpoint
+ROSTER_SORTS = {
+    'lastVisit': [('lastVisit', -1), ('patientEmail', -1)],
+    'name': [('patientName', 1), ('patientEmail', 1)],
+}
+
 @app.route('/api/doctor/<doctor_id>/patients', methods=['GET'])
 @token_required
 def get_doctor_patients(current_user, doctor_id):
@@ -1545,88 +1761,41 @@ def get_doctor_patients(current_user, doctor_id):
         if current_user.get('role') != 'doctor':
             return jsonify({'error': 'Access denied'}), 403
 
-        # Get doctor profile to find the correct doctor name
-        doctor_profile = doctor_profiles_collection.find_one({"userId": doctor_id})
-        if not doctor_profile:
-            doctor_profile = doctor_profiles_collection.find_one({"_id": ObjectId(doctor_id)})
-
-        # Build doctor name variations
-        doctor_name_variations = []
-        if doctor_profile:
-            first_name = doctor_profile.get('firstName', '')
-            last_name = doctor_profile.get('lastName', '')
-            doctor_name_variations.extend([
-                f"Dr. {first_name} {last_name}".strip(),
-                f"{first_name} {last_name}".strip(),
-                f"Dr {first_name} {last_name}".strip(),
-                f"Dr.{first_name} {last_name}".strip()
-            ])
-
-        # Also try with current user info
-        user_first = current_user.get('firstName', '')
-        user_last = current_user.get('lastName', '')
-        if user_first or user_last:
-            doctor_name_variations.extend([
-                f"Dr. {user_first} {user_last}".strip(),
-                f"{user_first} {user_last}".strip(),
-                f"Dr {user_first} {user_last}".strip()
-            ])
-
-        # Get unique patient emails from appointments using aggregation
-        pipeline = [
-            {
-                '$match': {
-                    '$or': [
-                        {'doctorId': doctor_id},
-                        {'doctorId': str(doctor_id)},
-                        {'doctorName': {'$in': doctor_name_variations}}
-                    ]
-                }
-            },
-            {
-                '$group': {
-                    '_id': '$patientEmail',
-                    'patientName': {'$first': '$patientName'},
-                    'lastVisit': {'$max': '$date'},
-                    'totalVisits': {'$sum': 1}
-                }
-            },
-            {'$sort': {'lastVisit': -1}}
-        ]
+        doctor_user_id = resolve_doctor_user_id(doctor_id) or doctor_id
 
-        patients_data = list(appointments_collection.aggregate(pipeline))
+        # One roster row per patient, kept up to date by booking and profile writes
+        sort = ROSTER_SORTS.get(request.args.get('sort', 'lastVisit'))
+        if sort is None:
+            return jsonify({'error': f"sort must be one of {', '.join(ROSTER_SORTS)}"}), 400
+        rows, page = paginate(db.doctor_patients, {'doctorUserId': doctor_user_id}, sort, default_limit=100, max_limit=500)
 
-        # Format response and get additional patient info
+        today = datetime.now().date()
         patients = []
-        for patient in patients_data:
-            # Try to get patient profile for additional info
-            patient_profile = patient_profiles_collection.find_one({
-                'email': patient['_id']
-            })
-
+        for row in rows:
             # Calculate age if birth date is available
             age = None
-            if patient_profile and patient_profile.get('dateOfBirth'):
+            if row.get('dateOfBirth'):
                 try:
-                    birth_date = datetime.strptime(patient_profile['dateOfBirth'], '%Y-%m-%d').date()
-                    today = datetime.now().date()
+                    birth_date = datetime.strptime(row['dateOfBirth'], '%Y-%m-%d').date()
                     age = today.year - birth_date.year - ((today.month, today.day) < (birth_date.month, birth_date.day))
-                except:
+                except (TypeError, ValueError):
                     age = None
 
             patients.append({
-                'email': patient['_id'],
-                'name': patient['patientName'],
-                'lastVisit': patient['lastVisit'],
-                'totalVisits': patient['totalVisits'],
-                'phone': patient_profile.get('contactNumber') if patient_profile else None,
+                'email': row['patientEmail'],
+                'name': row.get('patientName'),
+                'lastVisit': row.get('lastVisit'),
+                'totalVisits': row.get('totalVisits', 0),
+                'phone': row.get('phone'),
                 'age': age,
-                'bloodGroup': patient_profile.get('bloodGroup') if patient_profile else None
+                'bloodGroup': row.get('bloodGroup')
             })
 
         print(f"Found {len(patients)} patients for doctor {doctor_id}")
-        return jsonify(patients), 200
+        return page_headers(jsonify(patients), page), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error fetching doctor patients: {e}")
         import traceback
@@ -1635,53 +1804,120 @@ def get_doctor_patients(current_user, doctor_id):
 
 
 # Enhanced doctor search endpoint
+SEARCH_RADIUS_KM = float(os.getenv('SEARCH_RADIUS_KM', 25))
+# Matches the collation of the doctor_profiles.specialization index, which the
+# specialty range query needs to use it
+CASE_INSENSITIVE = {"locale": "en", "strength": 2}
+SEARCH_SORTS = {
+    "rating": [("ratingValue", -1), ("_id", -1)],
+    "fee": [("feeValue", 1), ("_id", 1)],
+    "distance": [("distanceMeters", 1), ("_id", 1)],
+}
+
+def parse_coordinates(value):
+    """'lat,lng' -> [lng, lat] (GeoJSON order), or None when it is not a coordinate pair"""
+    try:
+        lat, lng = (float(part) for part in value.split(','))
+    except (AttributeError, ValueError):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return [lng, lat]
+
 @app.route('/api/doctors/search', methods=['GET'])
 @token_required
 def search_doctors(current_user):
-    """Search doctors with filters"""
+    """
+    Search doctors with filters: specialty, date (has availability that day),
+    location ('lat,lng' within radiusKm, or text matched against the address),
+    sort (rating, fee or distance). Paginated with limit/after like other lists.
+    """
     try:
         specialty = request.args.get('specialty')
         location = request.args.get('location')
         availability_date = request.args.get('date')
+        sort_by = request.args.get('sort', 'rating')
 
-        # Build query
-        query = {}
+        if sort_by not in SEARCH_SORTS:
+            return jsonify({'error': f"sort must be one of {', '.join(SEARCH_SORTS)}"}), 400
+
+        match = {}
         if specialty and specialty.lower() != 'all':
-            query['specialization'] = {'$regex': specialty, '$options': 'i'}
+            # Prefix match ("cardio" finds Cardiology) as a range under the
+            # query's case-insensitive collation, so the specialization index
+            # bounds it; U+FFFF sorts after every character in that collation
+            match['specialization'] = {'$gte': specialty, '$lt': specialty + '\uffff'}
+
+        coordinates = parse_coordinates(location)
+        if location and coordinates is None:
+            match['address'] = {'$regex': re.escape(location), '$options': 'i'}
+        if sort_by == 'distance' and coordinates is None:
+            return jsonify({'error': 'sort=distance requires location=lat,lng'}), 400
+
+        if coordinates:
+            radius_km = float(request.args.get('radiusKm', SEARCH_RADIUS_KM))
+            pipeline = [{'$geoNear': {
+                'near': {'type': 'Point', 'coordinates': coordinates},
+                'distanceField': 'distanceMeters',
+                'maxDistance': radius_km * 1000,
+                'query': match,
+                'spherical': True
+            }}]
+        else:
+            pipeline = [{'$match': match}]
+
+        if availability_date:
+            day = datetime.fromisoformat(availability_date)
+            pipeline += [
+                {'$lookup': {
+                    'from': doctor_availability_collection.name,
+                    'let': {'doctorId': {'$convert': {'input': '$userId', 'to': 'objectId', 'onError': None}}},
+                    'pipeline': [
+                        {'$match': {'$expr': {'$and': [
+                            {'$eq': ['$doctorId', '$$doctorId']},
+                            {'$gte': ['$startTime', day]},
+                            {'$lt': ['$startTime', day + timedelta(days=1)]}
+                        ]}}},
+                        {'$limit': 1},
+                        {'$project': {'_id': 1}}
+                    ],
+                    'as': 'availableOnDate'
+                }},
+                {'$match': {'availableOnDate.0': {'$exists': True}}}
+            ]
+
+        # Numeric sort keys; fees are stored as entered and missing ones sort last
+        pipeline.append({'$addFields': {
+            'ratingValue': {'$convert': {'input': '$rating', 'to': 'double', 'onError': 0, 'onNull': 0}},
+            'feeValue': {'$convert': {'input': '$consultationFee', 'to': 'double', 'onError': 1e12, 'onNull': 1e12}}
+        }})
+
+        docs, page = paginate_pipeline(
+            doctor_profiles_collection, pipeline, SEARCH_SORTS[sort_by], collation=CASE_INSENSITIVE
+        )
 
-        # Find doctors matching criteria
-        doctors_cursor = doctor_profiles_collection.find(query)
         doctors = []
+        for doc in docs:
+            doctor = {
+                '_id': str(doc['_id']),
+                'userId': doc['userId'],
+                'name': f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
+                'email': doc.get('email', ''),
+                'specialization': doc.get('specialization', ''),
+                'experience': doc.get('experience', ''),
+                'qualification': doc.get('qualification', ''),
+                'profilePhoto': f"https://mediconnect-backend-xe6f.onrender.com/uploads/{doc['profilePhoto']}" if doc.get('profilePhoto') else '',
+                'consultationFee': doc.get('consultationFee', ''),
+                'rating': doc.get('rating', 0)
+            }
+            if 'distanceMeters' in doc:
+                doctor['distanceKm'] = round(doc['distanceMeters'] / 1000, 1)
+            doctors.append(doctor)
 
-        for doc in doctors_cursor:
-            # Check availability if date specified
-            available = True
-            if availability_date:
-                availability_count = doctor_availability_collection.count_documents({
-                    'doctorId': ObjectId(doc['userId']),
-                    'startTime': {
-                        '$gte': datetime.fromisoformat(availability_date),
-                        '$lt': datetime.fromisoformat(availability_date) + timedelta(days=1)
-                    }
-                })
-                available = availability_count > 0
-
-            if available:
-                doctors.append({
-                    '_id': str(doc['_id']),
-                    'userId': doc['userId'],
-                    'name': f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
-                    'email': doc.get('email', ''),
-                    'specialization': doc.get('specialization', ''),
-                    'experience': doc.get('experience', ''),
-                    'qualification': doc.get('qualification', ''),
-                    'profilePhoto': f"https://mediconnect-backend-xe6f.onrender.com/uploads/{doc['profilePhoto']}" if doc.get('profilePhoto') else '',
-                    'consultationFee': doc.get('consultationFee', ''),
-                    'rating': doc.get('rating', 0)
-                })
-
-        return jsonify(doctors), 200
+        return page_headers(jsonify(doctors), page), 200
 
+    except (InvalidCursor, ValueError) as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error searching doctors: {e}")
         return jsonify({'error': 'Failed to search doctors'}), 500
@@ -1698,24 +1934,26 @@ def get_patient_appointments(current_user):
         patient_email = current_user.get('email')
 
         # Get all appointments for this patient
-        appointments = list(appointments_collection.find({
-            'patientEmail': patient_email
-        }).sort([('date', -1), ('time', -1)]))
+        appointments, page = paginate(
+            appointments_collection, {'patientEmail': patient_email},
+            [('date', -1), ('time', -1), ('_id', -1)], default_limit=100
+        )
 
-        # Convert ObjectIds to strings and add additional info
-        for apt in appointments:
-            apt['_id'] = str(apt['_id'])
+        doctor_profiles = request_loader(doctor_profiles_collection, "userId", {"profilePhoto": 1, "specialization": 1})
+        doctor_profiles.prime(apt.get('doctorUserId') for apt in appointments)
 
+        # Add doctor info
+        for apt in appointments:
             # Try to get doctor info
-            doctor_profile = doctor_profiles_collection.find_one({
-                'userId': apt.get('doctorId')
-            })
+            doctor_profile = doctor_profiles.load(apt.get('doctorUserId'))
             if doctor_profile:
                 apt['doctorSpecialty'] = doctor_profile.get('specialization', '')
                 apt['doctorPhoto'] = doctor_profile.get('profilePhoto', '')
 
-        return jsonify({'appointments': appointments}), 200
+        return jsonify({'appointments': appointments, 'page': page}), 200
 
+    except InvalidCursor as e:
+        return jsonify({'error': str(e)}), 400
     except Exception as e:
         print(f"Error fetching patient appointments: {e}")
         return jsonify({'error': 'Failed to fetch appointments'}), 500
@@ -1739,7 +1977,7 @@ def get_doctor_details(current_user, doctor_id):
 
         # Get additional stats
         total_appointments = appointments_collection.count_documents({
-            'doctorId': doctor['userId']
+            'doctorUserId': str(doctor['userId'])
         })
 
         # Calculate average rating (placeholder - implement rating system)
@@ -1779,49 +2017,21 @@ def get_doctor_dashboard_stats(current_user):
         if current_user.get('role') != 'doctor':
             return jsonify({'error': 'Access denied'}), 403
 
-        doctor_id = current_user.get('doctorId') or str(current_user['_id'])
-
-        # Get doctor profile
-        doctor_profile = doctor_profiles_collection.find_one({"userId": doctor_id})
-        if not doctor_profile:
-            doctor_profile = doctor_profiles_collection.find_one({"_id": ObjectId(doctor_id)})
-
-        # Build doctor name variations
-        doctor_name_variations = []
-        if doctor_profile:
-            first_name = doctor_profile.get('firstName', '')
-            last_name = doctor_profile.get('lastName', '')
-            doctor_name_variations.extend([
-                f"Dr. {first_name} {last_name}".strip(),
-                f"{first_name} {last_name}".strip(),
-                f"Dr {first_name} {last_name}".strip()
-            ])
-
-        # Calculate various stats
+        doctor_id = str(current_user['_id'])
+
+        doctor_profile = doctor_profiles_collection.find_one({"userId": doctor_id}, {"rating": 1})
+
+        # Counters maintained by booking and messaging (see services/doctor_stats.py)
         today = datetime.now().date().strftime('%Y-%m-%d')
         this_month = datetime.now().replace(day=1).strftime('%Y-%m-%d')
-
-        # Build query for appointments
-        appointment_query = {
-            '$or': [
-                {'doctorId': doctor_id},
-                {'doctorId': str(doctor_id)},
-                {'doctorName': {'$in': doctor_name_variations}}
-            ]
-        }
+        totals = get_doctor_stats(db, doctor_id)
 
         stats = {
-            'todayAppointments': appointments_collection.count_documents({
-                **appointment_query,
-                'date': today
-            }),
-            'totalPatients': len(appointments_collection.distinct('patientEmail', appointment_query)),
-            'thisMonthAppointments': appointments_collection.count_documents({
-                **appointment_query,
-                'date': {'$gte': this_month}
-            }),
-            'totalAppointments': appointments_collection.count_documents(appointment_query),
-            'unreadMessages': 0,  # Implement based on messaging system
+            'todayAppointments': appointments_on(db, doctor_id, today),
+            'totalPatients': totals.get('totalPatients', 0),
+            'thisMonthAppointments': appointments_since(db, doctor_id, this_month),
+            'totalAppointments': totals.get('totalAppointments', 0),
+            'unreadMessages': max(totals.get('unreadMessages', 0), 0),
             'avgRating': doctor_profile.get('rating', 4.5) if doctor_profile else 4.5
         }
 
@@ -1844,5 +2054,46 @@ def handle_api_error(func):
             return jsonify({'error': 'Internal server error'}), 500
     return wrapper
 
+@app.cli.command("backfill-doctor-refs")
+def backfill_doctor_refs_command():
+    """Set doctorUserId on existing appointments (safe to re-run)."""
+    result = backfill_doctor_user_ids(db, batch_size=int(os.getenv('BACKFILL_BATCH_SIZE', 500)))
+    print(f"Done: {result['updated']} appointments updated, {result['unresolved']} could not be resolved")
+
+@app.cli.command("rebuild-doctor-stats")
+@click.option("--doctor", "doctor_user_id", default=None, help="Only rebuild this doctor's stats (users _id).")
+def rebuild_doctor_stats_command(doctor_user_id):
+    """Recompute doctor_stats and doctor_daily_stats from appointments and messages."""
+    if doctor_user_id is not None and not ObjectId.is_valid(doctor_user_id):
+        raise click.BadParameter("must be a users _id", param_hint="--doctor")
+    rebuild_doctor_stats(db, doctor_user_id)
+
+@app.cli.command("rebuild-patient-roster")
+def rebuild_patient_roster_command():
+    """Recompute doctor_patients from appointments and patient profiles."""
+    rebuild_roster(db)
+
+@app.cli.command("check-indexes")
+def check_indexes_command():
+    """Report indexes that are missing, extra or changed compared to services/indexes.py."""
+    report = check_indexes(db)
+    if not report:
+        print("All indexes match the specification")
+        return
+    for collection_name, diff in report.items():
+        for kind in ("missing", "extra", "changed"):
+            for name in diff[kind]:
+                print(f"{collection_name}: {kind} index {name}")
+
+@app.cli.command("ensure-indexes")
+@click.option("--drop-extra", is_flag=True, help="Also drop indexes that are not in the specification.")
+def ensure_indexes_command(drop_extra):
+    """Create every index in services/indexes.py (safe to re-run)."""
+    failed = ensure_indexes(db, drop_extra=drop_extra)
+    if failed:
+        print(f"Failed on: {', '.join(failed)}")
+    else:
+        print("Indexes are up to date")
+
 if __name__ == "__main__":
-    app.run(debug=True, host='0.0.0.0')
\ No newline at end of file
+    socketio.run(app, debug=True, host='0.0.0.0', allow_unsafe_werkzeug=True)
\ No newline at end of file
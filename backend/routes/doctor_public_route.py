@@ -1,34 +1,59 @@
 from flask import Blueprint, jsonify, request
 from flask_cors import cross_origin
 from bson import ObjectId
-from routes.db import doctor_profiles_collection, doctor_availability_collection  # import your collections
+from routes.db import db, doctor_profiles_collection, doctor_availability_collection  # import your collections
+from services.conditional import DOCTOR_DIRECTORY_VERSION
+from services.snapshots import VersionedSnapshot
+from services.doctor_refs import resolve_doctor_user_id
+from services.free_slots import compute_free_slots, to_utc, FREE_SLOTS_MAX_DAYS
+from services.doctor_index import doctor_index
+from datetime import datetime, timedelta
 
 doctor_routes = Blueprint('doctor_routes', __name__)
 
+def build_doctor_directory(db):
+    projection = {field: 1 for field in ("userId", "firstName", "lastName", "email", "specialization", "experience",
+                                         "qualification", "profilePhoto", "clinicName", "consultationFee")}
+    return [{
+        "_id": str(doc.get("_id")),
+        "userId": str(doc.get("userId")),
+        "name": f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
+        "email": doc.get("email", ""),
+        "specialization": doc.get("specialization", ""),
+        "experience": doc.get("experience", ""),
+        "qualification": doc.get("qualification", ""),
+        "profilePhoto": doc.get("profilePhoto", ""),
+        "clinicName": doc.get("clinicName", ""),
+        "consultationFee": doc.get("consultationFee", ""),
+    } for doc in db.doctor_profiles.find({}, projection)]
+
+doctor_directory = VersionedSnapshot(DOCTOR_DIRECTORY_VERSION, build_doctor_directory)
+
 # Get all doctors for the patient dashboard
 @doctor_routes.route('/api/doctors', methods=['GET'])
 def get_all_doctors():
     try:
-        doctors_cursor = doctor_profiles_collection.find({})
-        doctors = []
-        for doc in doctors_cursor:
-            doctors.append({
-                "_id": str(doc.get("_id")),
-                "userId": str(doc.get("userId")),
-                "name": f"{doc.get('firstName', '')} {doc.get('lastName', '')}".strip(),
-                "email": doc.get("email", ""),
-                "specialization": doc.get("specialization", ""),
-                "experience": doc.get("experience", ""),
-                "qualification": doc.get("qualification", ""),
-                "profilePhoto": doc.get("profilePhoto", ""),
-                "clinicName": doc.get("clinicName", ""),
-                "consultationFee": doc.get("consultationFee", ""),
-            })
-        return jsonify(doctors), 200
+        return doctor_directory.response(db)
     except Exception as e:
         print("Error fetching doctors:", e)
         return jsonify({"error": "Internal server error"}), 500
 
+# Typeahead over doctor name, specialization, clinic and qualification
+@doctor_routes.route('/api/doctors/suggest', methods=['GET'])
+def suggest_doctors():
+    query = request.args.get("q", "")
+    try:
+        limit = max(1, min(int(request.args.get("limit", 10)), 50))
+    except ValueError:
+        return jsonify({"error": "Invalid limit"}), 400
+
+    try:
+        doctor_index.refresh(db)
+    except Exception as e:
+        # Serve from the index as it is if MongoDB cannot be reached
+        print("Error refreshing doctor index:", e)
+    return jsonify(doctor_index.search(query, limit)), 200
+
 # Get availability for a particular doctor
 @doctor_routes.route('/api/doctors/<doctor_id>/availability', methods=['GET'])
 @cross_origin() 
@@ -51,4 +76,48 @@ def get_doctor_availability(doctor_id):
         return jsonify(availability), 200
     except Exception as e:
         print("Error fetching availability:", e)
-        return jsonify({"error": "Internal server error"}), 500
\ No newline at end of file
+        return jsonify({"error": "Internal server error"}), 500
+
+
+def _range_bound(value, end=False):
+    """'YYYY-MM-DD' (a whole day, so an end date is inclusive) or an ISO datetime."""
+    if len(value) == 10:
+        day = datetime.strptime(value, "%Y-%m-%d")
+        return day + timedelta(days=1) if end else day
+    parsed = to_utc(value)
+    if parsed is None:
+        raise ValueError(value)
+    return parsed
+
+# Bookable slots for a doctor between from and to (defaults: today, one week)
+@doctor_routes.route('/api/doctors/<doctor_id>/free-slots', methods=['GET'])
+def get_doctor_free_slots(doctor_id):
+    try:
+        start = _range_bound(request.args["from"]) if request.args.get("from") \
+            else datetime.combine(datetime.utcnow().date(), datetime.min.time())
+        end = _range_bound(request.args["to"], end=True) if request.args.get("to") \
+            else start + timedelta(days=7)
+    except ValueError:
+        return jsonify({"error": "from/to must be YYYY-MM-DD or ISO datetimes"}), 400
+    if end <= start or end - start > timedelta(days=FREE_SLOTS_MAX_DAYS):
+        return jsonify({"error": f"Range must be positive and at most {FREE_SLOTS_MAX_DAYS} days"}), 400
+
+    try:
+        doctor_user_id = resolve_doctor_user_id(doctor_id, db)
+        if not doctor_user_id:
+            return jsonify({"error": "Doctor profile not found"}), 404
+
+        slots, duration = compute_free_slots(db, doctor_user_id, start, end)
+        return jsonify({
+            "doctorUserId": doctor_user_id,
+            "consultationDuration": int(duration.total_seconds() // 60),
+            "slots": [{
+                "date": slot.strftime("%Y-%m-%d"),
+                "time": slot.strftime("%H:%M"),
+                "startTime": slot.isoformat() + "Z",
+                "endTime": (slot + duration).isoformat() + "Z"
+            } for slot in slots]
+        }), 200
+    except Exception as e:
+        print("Error computing free slots:", e)
+        return jsonify({"error": "Internal server error"}), 500
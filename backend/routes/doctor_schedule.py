@@ -2,12 +2,15 @@ from flask import Blueprint, request, jsonify, current_app
 from models.doctor_availability import DoctorAvailabilitySchema
 from models.doctor_busy_time import DoctorBusyTimeSchema
 from bson import ObjectId
+from services.conditional import conditional, bump_version, get_version, schedule_version_key
 
 doctor_schedule = Blueprint('doctor_schedule', __name__)
 
-# --- helper ---
-def safe_iso(val):
-    return val.isoformat() if hasattr(val, "isoformat") else val
+def schedule_version():
+    doctor_id = request.args.get("doctorId")
+    if not doctor_id:
+        return None
+    return f"{doctor_id}:{get_version(current_app.db, schedule_version_key(doctor_id))}"
 
 
 # Availability routes
@@ -22,6 +25,7 @@ def add_doctor_availability():
 
         db = current_app.db
         result = db.doctor_availability.insert_one(data)
+        bump_version(db, schedule_version_key(data.get("doctorId")))
 
         return jsonify({"message": "Availability added", "id": str(result.inserted_id)}), 201
     except Exception as e:
@@ -29,6 +33,7 @@ def add_doctor_availability():
 
 
 @doctor_schedule.route('/doctor/availability', methods=['GET'])
+@conditional(schedule_version)
 def get_doctor_availability():
     try:
         doctor_id_str = request.args.get("doctorId")
@@ -42,13 +47,6 @@ def get_doctor_availability():
 
         db = current_app.db
         slots = list(db.doctor_availability.find({"doctorId": doctor_id}))
-        for slot in slots:
-            slot["_id"] = str(slot["_id"])
-            slot["startTime"] = safe_iso(slot["startTime"])
-            slot["endTime"] = safe_iso(slot["endTime"])
-            slot["createdAt"] = safe_iso(slot["createdAt"])
-            slot["updatedAt"] = safe_iso(slot["updatedAt"])
-
         return jsonify(slots), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -58,9 +56,10 @@ def get_doctor_availability():
 def delete_doctor_availability(slot_id):
     try:
         db = current_app.db
-        result = db.doctor_availability.delete_one({"_id": ObjectId(slot_id)})
+        deleted = db.doctor_availability.find_one_and_delete({"_id": ObjectId(slot_id)}, {"doctorId": 1})
 
-        if result.deleted_count == 1:
+        if deleted:
+            bump_version(db, schedule_version_key(deleted.get("doctorId")))
             return jsonify({"message": "Slot deleted"}), 200
         else:
             return jsonify({"error": "Slot not found"}), 404
@@ -80,6 +79,7 @@ def add_doctor_busy_time():
 
         db = current_app.db
         result = db.doctor_busy_time.insert_one(data)
+        bump_version(db, schedule_version_key(data.get("doctorId")))
 
         return jsonify({"message": "Busy time added", "id": str(result.inserted_id)}), 201
     except Exception as e:
@@ -87,6 +87,7 @@ def add_doctor_busy_time():
 
 
 @doctor_schedule.route('/doctor/busy', methods=['GET'])
+@conditional(schedule_version)
 def get_doctor_busy_times():
     try:
         doctor_id_str = request.args.get("doctorId")
@@ -100,13 +101,6 @@ def get_doctor_busy_times():
 
         db = current_app.db
         busy_times = list(db.doctor_busy_time.find({"doctorId": doctor_id}))
-        for slot in busy_times:
-            slot["_id"] = str(slot["_id"])
-            slot["startTime"] = safe_iso(slot["startTime"])
-            slot["endTime"] = safe_iso(slot["endTime"])
-            slot["createdAt"] = safe_iso(slot["createdAt"])
-            slot["updatedAt"] = safe_iso(slot["updatedAt"])
-
         return jsonify(busy_times), 200
     except Exception as e:
         return jsonify({"error": str(e)}), 500
@@ -116,9 +110,10 @@ def get_doctor_busy_times():
 def delete_doctor_busy_time(slot_id):
     try:
         db = current_app.db
-        result = db.doctor_busy_time.delete_one({"_id": ObjectId(slot_id)})
+        deleted = db.doctor_busy_time.find_one_and_delete({"_id": ObjectId(slot_id)}, {"doctorId": 1})
 
-        if result.deleted_count == 1:
+        if deleted:
+            bump_version(db, schedule_version_key(deleted.get("doctorId")))
             return jsonify({"message": "Busy time deleted"}), 200
         else:
             return jsonify({"error": "Busy time not found"}), 404
@@ -128,6 +123,7 @@ def delete_doctor_busy_time(slot_id):
 
 # Combined route
 @doctor_schedule.route('/doctor/schedule', methods=['GET'])
+@conditional(schedule_version)
 def get_combined_doctor_schedule():
     from bson import ObjectId
     doctor_id = request.args.get("doctorId")
@@ -149,12 +145,6 @@ def get_combined_doctor_schedule():
         ]
     }))
     for slot in availability:
-        slot["_id"] = str(slot["_id"])
-        slot["doctorId"] = str(slot["doctorId"])
-        slot["startTime"] = safe_iso(slot["startTime"])
-        slot["endTime"] = safe_iso(slot["endTime"])
-        slot["createdAt"] = safe_iso(slot["createdAt"])
-        slot["updatedAt"] = safe_iso(slot["updatedAt"])
         slot["type"] = "available"
 
     busy = list(db.doctor_busy_time.find({
@@ -164,12 +154,6 @@ def get_combined_doctor_schedule():
         ]
     }))
     for slot in busy:
-        slot["_id"] = str(slot["_id"])
-        slot["doctorId"] = str(slot["doctorId"])
-        slot["startTime"] = safe_iso(slot["startTime"])
-        slot["endTime"] = safe_iso(slot["endTime"])
-        slot["createdAt"] = safe_iso(slot["createdAt"])
-        slot["updatedAt"] = safe_iso(slot["updatedAt"])
         slot["type"] = "busy"
 
     return jsonify(availability + busy), 200
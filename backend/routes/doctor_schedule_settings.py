@@ -1,11 +1,14 @@
 from flask import Blueprint, request, jsonify, current_app
 from models.doctor_schedule_settings import DoctorScheduleSettingsSchema
 from bson import ObjectId
+from services.conditional import conditional, bump_version, get_version, schedule_version_key
 import traceback
 
 schedule_settings = Blueprint("schedule_settings", __name__)
 
 @schedule_settings.route("/doctor/schedule-settings", methods=["GET"])
+@conditional(lambda: get_version(current_app.db, schedule_version_key(request.args["doctorId"]))
+             if request.args.get("doctorId") else None)
 def get_schedule_settings():
     try:
         doctor_id = request.args.get("doctorId")
@@ -16,8 +19,6 @@ def get_schedule_settings():
         settings = db.doctor_schedule_settings.find_one({"doctorId": ObjectId(doctor_id)})
 
         if settings:
-            settings["_id"] = str(settings["_id"])
-            settings["doctorId"] = str(settings["doctorId"])
             return jsonify(settings), 200
         else:
             return jsonify({"message": "No settings found"}), 404
@@ -39,6 +40,7 @@ def update_schedule_settings():
             {"$set": data},
             upsert=True
         )
+        bump_version(db, schedule_version_key(data["doctorId"]))
 
         return jsonify({"message": "Schedule settings saved successfully"}), 200
 
@@ -12,6 +12,9 @@ from dateutil.parser import isoparse
 import base64
 import json
 import traceback
+from pymongo import UpdateOne
+from services.conditional import bump_version, schedule_version_key
+from services.free_slots import to_utc
 
 load_dotenv()
 google_calendar = Blueprint("google_calendar", __name__)
@@ -119,6 +122,22 @@ def sync_google_busy():
         events = events_result.get('items', [])
         print(f"Fetched {len(events)} Google Calendar events")
 
+        # Earlier syncs stored ISO strings; convert this doctor's to dates first so
+        # the duplicate check below matches them
+        migrated = [
+            UpdateOne({"_id": slot["_id"]}, {"$set": {
+                "startTime": to_utc(slot["startTime"]),
+                "endTime": to_utc(slot["endTime"])
+            }})
+            for slot in db.doctor_busy_time.find(
+                {"doctorId": doctor_id, "startTime": {"$type": "string"}},
+                {"startTime": 1, "endTime": 1}
+            )
+            if to_utc(slot.get("startTime")) and to_utc(slot.get("endTime"))
+        ]
+        if migrated:
+            db.doctor_busy_time.bulk_write(migrated, ordered=False)
+
         busy_slots = []
         for event in events:
             start = event['start'].get('dateTime') or event['start'].get('date')
@@ -127,10 +146,11 @@ def sync_google_busy():
             if not start or not end:
                 continue
 
+            # Stored as BSON dates (UTC) so slot queries can range-match them
             busy_slot = {
                 "doctorId": doctor_id,
-                "startTime": isoparse(start).astimezone().isoformat(),
-                "endTime": isoparse(end).astimezone().isoformat(),
+                "startTime": to_utc(isoparse(start).astimezone()),
+                "endTime": to_utc(isoparse(end).astimezone()),
                 "reason": event.get("summary", "Google Calendar Event"),
                 "createdAt": datetime.datetime.now(datetime.timezone.utc),
                 "updatedAt": datetime.datetime.now(datetime.timezone.utc)
@@ -146,6 +166,8 @@ def sync_google_busy():
 
         if busy_slots:
             db.doctor_busy_time.insert_many(busy_slots)
+        if busy_slots or migrated:
+            bump_version(db, schedule_version_key(doctor_id))
 
         return jsonify({"message": f"{len(busy_slots)} busy slots synced."}), 200
 
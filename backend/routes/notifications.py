@@ -4,7 +4,8 @@ from apscheduler.triggers.date import DateTrigger
 from datetime import datetime, timedelta
 import pytz
 from bson import ObjectId
-from flask_mail import Message
+from services.outbox import enqueue_email
+import multiprocessing
 import logging
 import os
 
@@ -16,21 +17,41 @@ logger = logging.getLogger(__name__)
 
 # Initialize scheduler
 scheduler = BackgroundScheduler(timezone=pytz.UTC)
-if not scheduler.running:
+# Not in image pool worker processes, which may import the app again
+if not scheduler.running and multiprocessing.parent_process() is None:
     logger.info("Starting APScheduler")
     scheduler.start()
 
+# Scheduler jobs run outside any request, so they need the app to push a context
+_app = None
+
+@notifications.record_once
+def _remember_app(state):
+    global _app
+    _app = state.app
+
+def run_with_app_context(func, *args):
+    if _app is None:
+        return func(*args)
+    with _app.app_context():
+        return func(*args)
+
+def run_in_background(func, *args):
+    """
+    Run func(*args) on the scheduler's thread pool as soon as possible, so that
+    side effects such as emails stay off the request path.
+    """
+    scheduler.add_job(
+        run_with_app_context,
+        args=[func, *args],
+        misfire_grace_time=None
+    )
+
 def send_appointment_reminder(appointment_id, recipient_email, doctor_name, patient_name, date_str, time_str, reminder_type, minutes_remaining=None):
     """
     Send appointment reminder email
     """
     try:
-        # Access mail from current_app
-        if not hasattr(current_app, 'mail'):
-            logger.error("Flask app does not have 'mail' attribute")
-            raise AttributeError("Flask app does not have 'mail' attribute")
-        mail = current_app.mail
-        
         # Log the recipient email
         logger.info(f"Preparing to send {reminder_type} reminder for appointment {appointment_id} to {recipient_email}")
 
@@ -61,11 +82,9 @@ Thank you,
 MediConnect Team
 """
 
-        # Send email
-        msg = Message(subject=subject, recipients=[recipient_email])
-        msg.body = body
-        mail.send(msg)
-        logger.info(f"Sent {reminder_type} reminder for appointment {appointment_id} to {recipient_email}")
+        # Queue email; the outbox sender delivers it
+        enqueue_email(current_app.db, recipient_email, subject, body)
+        logger.info(f"Queued {reminder_type} reminder for appointment {appointment_id} to {recipient_email}")
 
     except Exception as e:
         logger.error(f"Failed to send {reminder_type} reminder for appointment {appointment_id} to {recipient_email}: {str(e)}")
@@ -96,9 +115,9 @@ def schedule_appointment_reminders(appointment_id, patient_email, doctor_name, p
         reminder_30m_time = appointment_dt - timedelta(minutes=30)
         if reminder_30m_time > now:
             scheduler.add_job(
-                send_appointment_reminder,
+                run_with_app_context,
                 trigger=DateTrigger(run_date=reminder_30m_time),
-                args=[appointment_id, patient_email, doctor_name, patient_name, date_str, time_str, '30_minutes'],
+                args=[send_appointment_reminder, appointment_id, patient_email, doctor_name, patient_name, date_str, time_str, '30_minutes'],
                 id=f"reminder_30m_{appointment_id}",
                 replace_existing=True
             )
@@ -108,9 +127,9 @@ def schedule_appointment_reminders(appointment_id, patient_email, doctor_name, p
         reminder_15m_time = appointment_dt - timedelta(minutes=15)
         if reminder_15m_time > now:
             scheduler.add_job(
-                send_appointment_reminder,
+                run_with_app_context,
                 trigger=DateTrigger(run_date=reminder_15m_time),
-                args=[appointment_id, patient_email, doctor_name, patient_name, date_str, time_str, '15_minutes'],
+                args=[send_appointment_reminder, appointment_id, patient_email, doctor_name, patient_name, date_str, time_str, '15_minutes'],
                 id=f"reminder_15m_{appointment_id}",
                 replace_existing=True
             )
@@ -126,21 +145,15 @@ def test_notification():
     Test endpoint to verify notification system
     """
     try:
-        # Access mail from current_app
-        if not hasattr(current_app, 'mail'):
-            logger.error("Flask app does not have 'mail' attribute")
-            return jsonify({"error": "Mail service not initialized"}), 500
-        mail = current_app.mail
-        
-        logger.info(f"Sending test notification to {os.getenv('SENDER_EMAIL')}")
-        msg = Message(
-            subject="MediConnect: Test Notification",
-            recipients=[os.getenv('SENDER_EMAIL')],
-            body="This is a test notification from MediConnect."
+        logger.info(f"Queueing test notification to {os.getenv('SENDER_EMAIL')}")
+        enqueue_email(
+            current_app.db,
+            os.getenv('SENDER_EMAIL'),
+            "MediConnect: Test Notification",
+            "This is a test notification from MediConnect."
         )
-        mail.send(msg)
-        logger.info(f"Sent test notification to {os.getenv('SENDER_EMAIL')}")
-        return jsonify({"message": "Test notification sent successfully"}), 200
+        logger.info(f"Queued test notification to {os.getenv('SENDER_EMAIL')}")
+        return jsonify({"message": "Test notification queued successfully"}), 200
     except Exception as e:
         logger.error(f"Test notification failed: {str(e)}")
         return jsonify({"error": f"Failed to send test notification: {str(e)}"}), 500
@@ -0,0 +1,230 @@
+from functools import wraps
+from flask import request, jsonify, current_app
+from bson import ObjectId
+from datetime import datetime, timedelta, timezone
+import jwt
+import os
+import uuid
+from services.cache import TTLCache
+
+ACCESS_TOKEN_LIFETIME = timedelta(minutes=int(os.getenv('ACCESS_TOKEN_MINUTES', 60)))
+REFRESH_TOKEN_LIFETIME = timedelta(days=int(os.getenv('REFRESH_TOKEN_DAYS', 14)))
+
+# Per-worker cache of authenticated users keyed by email. The password hash and
+# Google token are never needed by request handlers, so they are not cached.
+user_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('USER_CACHE_TTL', 60))
+)
+USER_CACHE_PROJECTION = {"password": 0, "googleToken": 0}
+
+# email -> tokenVersion. This is the only per-request lookup for tokens that
+# carry claims, so it is kept short-lived to bound how long a revoked token works.
+token_version_cache = TTLCache(
+    maxsize=int(os.getenv('USER_CACHE_SIZE', 1024)),
+    ttl=int(os.getenv('TOKEN_VERSION_CACHE_TTL', 30))
+)
+
+
+def cache_stats():
+    """Hit/miss counters of this worker's auth caches; hits are saved MongoDB round trips."""
+    return {"userCache": user_cache.stats(), "tokenVersionCache": token_version_cache.stats()}
+
+
+def _users():
+    return current_app.db.users
+
+
+def get_cached_user(email):
+    user = user_cache.get(email, lambda: _users().find_one({"email": email}, USER_CACHE_PROJECTION))
+    return dict(user) if user else None
+
+
+def invalidate_cached_user(email):
+    """Must be called after any write to a users document (profile, password, role)."""
+    if email:
+        user_cache.invalidate(email)
+        token_version_cache.invalidate(email)
+
+
+def get_token_version(email):
+    def load():
+        user = _users().find_one({"email": email}, {"tokenVersion": 1})
+        return user.get("tokenVersion", 0) if user else None
+    return token_version_cache.get(email, load)
+
+
+def bump_token_version(email):
+    """Revoke every token issued to this user so that claims are re-issued on next login."""
+    _users().update_one({"email": email}, {"$inc": {"tokenVersion": 1}})
+    invalidate_cached_user(email)
+
+
+def build_claims(user, doctor_profile_id=None):
+    """Claims handlers need, so that most requests never have to load the user."""
+    first_name = user.get("firstName", "") or ""
+    last_name = user.get("lastName", "") or ""
+    return {
+        "email": user.get("email"),
+        "role": user.get("role"),
+        # Historically named doctorId, but this is the users _id for every role
+        "doctorId": str(user["_id"]),
+        "firstName": first_name,
+        "lastName": last_name,
+        "name": f"{first_name} {last_name}".strip(),
+        "doctorProfileId": str(doctor_profile_id) if doctor_profile_id else None,
+        "tv": user.get("tokenVersion", 0)
+    }
+
+
+def issue_access_token(claims):
+    payload = dict(claims)
+    payload["exp"] = datetime.now(timezone.utc) + ACCESS_TOKEN_LIFETIME
+    return jwt.encode(payload, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+
+class RefreshTokenError(Exception):
+    pass
+
+
+def _refresh_tokens():
+    return current_app.db.refresh_tokens
+
+
+def issue_refresh_token(claims, family=None):
+    """
+    Store a refresh token and return it as a signed JWT referencing the stored row.
+    Tokens rotated from the same login share a family so that they can be revoked together.
+    """
+    now = datetime.now(timezone.utc)
+    jti = uuid.uuid4().hex
+    expires_at = now + REFRESH_TOKEN_LIFETIME
+    _refresh_tokens().insert_one({
+        "_id": jti,
+        "family": family or jti,
+        "email": claims["email"],
+        "claims": claims,
+        "createdAt": now,
+        "expiresAt": expires_at,
+        "revokedAt": None
+    })
+    return jwt.encode({
+        "typ": "refresh",
+        "jti": jti,
+        "sub": claims["email"],
+        "exp": expires_at
+    }, current_app.config['SECRET_KEY'], algorithm="HS256")
+
+
+def revoke_refresh_family(family):
+    _refresh_tokens().update_many(
+        {"family": family, "revokedAt": None},
+        {"$set": {"revokedAt": datetime.now(timezone.utc)}}
+    )
+
+
+def _decode_refresh_token(token):
+    data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+    if data.get("typ") != "refresh" or not data.get("jti"):
+        raise RefreshTokenError("Not a refresh token")
+    return data
+
+
+def rotate_refresh_token(token):
+    """
+    Exchange a refresh token for a new access token and a new refresh token.
+    Claims are rebuilt from the current user document, so name, role and
+    profile changes made since login reach the new tokens.
+    """
+    data = _decode_refresh_token(token)
+
+    stored = _refresh_tokens().find_one_and_update(
+        {"_id": data["jti"], "revokedAt": None},
+        {"$set": {"revokedAt": datetime.now(timezone.utc)}}
+    )
+    if not stored:
+        # Unknown or already rotated: treat reuse as theft and revoke the whole family
+        stale = _refresh_tokens().find_one({"_id": data["jti"]}, {"family": 1})
+        if stale:
+            revoke_refresh_family(stale["family"])
+        raise RefreshTokenError("Refresh token has been revoked")
+
+    user = _users().find_one({"email": stored["email"]}, USER_CACHE_PROJECTION)
+    if not user or user.get("tokenVersion", 0) != stored["claims"].get("tv"):
+        revoke_refresh_family(stored["family"])
+        raise RefreshTokenError("Refresh token has been revoked")
+
+    doctor_profile_id = None
+    if user.get("role") == "doctor":
+        profile = current_app.db.doctor_profiles.find_one({"userId": str(user["_id"])}, {"_id": 1})
+        doctor_profile_id = profile["_id"] if profile else None
+    claims = build_claims(user, doctor_profile_id)
+
+    return issue_access_token(claims), issue_refresh_token(claims, family=stored["family"])
+
+
+def revoke_refresh_token(token):
+    data = _decode_refresh_token(token)
+    stored = _refresh_tokens().find_one({"_id": data["jti"]}, {"family": 1})
+    if stored:
+        revoke_refresh_family(stored["family"])
+
+
+def user_from_claims(data):
+    return {
+        "_id": ObjectId(data["doctorId"]),
+        "email": data["email"],
+        "role": data.get("role"),
+        "firstName": data.get("firstName", ""),
+        "lastName": data.get("lastName", ""),
+        "doctorProfileId": data.get("doctorProfileId")
+    }
+
+
+class AuthError(Exception):
+    def __init__(self, message, status):
+        super().__init__(message)
+        self.message = message
+        self.status = status
+
+
+def authenticate_token(token):
+    """Decode an access token and return current_user, or raise AuthError."""
+    try:
+        data = jwt.decode(token, current_app.config['SECRET_KEY'], algorithms=["HS256"])
+        if "tv" in data:
+            # Versioned token: only the (cached) tokenVersion is checked
+            version = get_token_version(data['email'])
+            if version is None:
+                raise AuthError('User not found', 404)
+            if version != data['tv']:
+                raise AuthError('Token has been revoked', 401)
+            return user_from_claims(data)
+
+        # Tokens issued before claims were added still load the user
+        current_user = get_cached_user(data['email'])
+    except AuthError:
+        raise
+    except Exception as e:
+        print(e)
+        raise AuthError('Token is invalid', 403)
+    if not current_user:
+        raise AuthError('User not found', 404)
+    return current_user
+
+
+#Verifying the token
+def token_required(f):
+    @wraps(f)
+    def decorated(*args, **kwargs):
+        token = request.headers.get('Authorization')
+        if not token:
+            return jsonify({'message': 'Token is missing'}), 403
+        try:
+            current_user = authenticate_token(token.split(" ")[1])  # Bearer <token>
+        except IndexError:
+            return jsonify({'message': 'Token is invalid'}), 403
+        except AuthError as e:
+            return jsonify({'message': e.message}), e.status
+        return f(current_user, *args, **kwargs)
+    return decorated
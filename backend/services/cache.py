@@ -0,0 +1,110 @@
+from collections import OrderedDict
+import threading
+import time
+
+
+class TTLCache:
+    """
+    Small thread-safe LRU cache whose entries also expire after a fixed TTL.
+
+    Each worker process keeps its own instance, so entries must be invalidated
+    explicitly whenever the underlying record is written.
+    """
+
+    def __init__(self, maxsize=1024, ttl=60, weigh=None, max_weight=None):
+        """
+        weigh(value) and max_weight optionally bound the cache by total weight
+        (e.g. len for bytes values) in addition to the number of entries.
+        """
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.weigh = weigh
+        self.max_weight = max_weight
+        self.weight = 0
+        self._data = OrderedDict()
+        # key -> token of the load in flight; a write to the key drops it, so a
+        # load that started before an invalidate cannot store its stale result
+        self._loads = {}
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key, loader=None):
+        """
+        Return the cached value for key. On a miss the optional loader is
+        called and its result stored, unless it is None (misses are not cached)
+        or the key was written or invalidated while the loader ran.
+        """
+        now = time.monotonic()
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is not None and entry[1] > now:
+                self._data.move_to_end(key)
+                self.hits += 1
+                return entry[0]
+            if entry is not None:
+                self._pop(key)
+            self.misses += 1
+            if loader is None:
+                return None
+            token = self._loads[key] = object()
+
+        try:
+            value = loader()
+        except BaseException:
+            with self._lock:
+                if self._loads.get(key) is token:
+                    del self._loads[key]
+            raise
+        with self._lock:
+            if self._loads.get(key) is token:
+                del self._loads[key]
+                if value is not None:
+                    self._store(key, value)
+        return value
+
+    def _pop(self, key):
+        entry = self._data.pop(key, None)
+        if entry is not None and self.weigh is not None:
+            self.weight -= self.weigh(entry[0])
+
+    def _store(self, key, value):
+        self._pop(key)
+        if self.weigh is not None:
+            weight = self.weigh(value)
+            if self.max_weight is not None and weight > self.max_weight:
+                return
+            self.weight += weight
+        self._data[key] = (value, time.monotonic() + self.ttl)
+        while len(self._data) > self.maxsize or (
+                self.max_weight is not None and self.weight > self.max_weight):
+            self._pop(next(iter(self._data)))
+
+    def set(self, key, value):
+        with self._lock:
+            self._loads.pop(key, None)
+            self._store(key, value)
+
+    def invalidate(self, key):
+        with self._lock:
+            self._loads.pop(key, None)
+            self._pop(key)
+
+    def clear(self):
+        with self._lock:
+            self._loads.clear()
+            self._data.clear()
+            self.weight = 0
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "size": len(self._data),
+                "maxsize": self.maxsize,
+                **({"weight": self.weight, "maxWeight": self.max_weight} if self.weigh is not None else {}),
+                "ttl": self.ttl,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hitRate": round(self.hits / total, 3) if total else 0.0
+            }
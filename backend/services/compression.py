@@ -0,0 +1,132 @@
+from flask import request
+import hashlib
+import gzip
+import os
+from services.cache import TTLCache
+
+try:
+    import brotli
+except ImportError:  # pragma: no cover - gzip only
+    brotli = None
+
+# Response compression negotiated from Accept-Encoding. Small bodies, streamed
+# files and already-compressed formats (images, PDFs, archives) are sent as they
+# are. Bodies that carry a strong ETag are the same bytes every time, so their
+# compressed form is cached (bounded by COMPRESS_CACHE_BYTES) and reused; the
+# compressed body is sent with its own ETag (see encoded_etag).
+
+COMPRESS_MIN_SIZE = int(os.getenv('COMPRESS_MIN_SIZE', 1024))
+COMPRESS_GZIP_LEVEL = int(os.getenv('COMPRESS_GZIP_LEVEL', 6))
+COMPRESS_BROTLI_QUALITY = int(os.getenv('COMPRESS_BROTLI_QUALITY', 5))
+COMPRESS_CACHE_SIZE = int(os.getenv('COMPRESS_CACHE_SIZE', 256))
+# Total compressed bytes kept in the cache
+COMPRESS_CACHE_BYTES = int(os.getenv('COMPRESS_CACHE_BYTES', 16 * 1024 * 1024))
+
+COMPRESSIBLE_TYPES = (
+    "application/json",
+    "application/javascript",
+    "application/xml",
+    "text/",
+    "image/svg+xml",
+)
+
+_compressed = TTLCache(
+    maxsize=COMPRESS_CACHE_SIZE,
+    ttl=int(os.getenv('COMPRESS_CACHE_TTL', 3600)),
+    weigh=len,
+    max_weight=COMPRESS_CACHE_BYTES
+)
+
+ENCODINGS = ("br", "gzip")
+
+
+def encoded_etag(etag, encoding):
+    """
+    A strong ETag names one exact byte sequence, so each content coding of a
+    representation gets its own tag: "<etag>-<encoding>".
+    """
+    return f"{etag}-{encoding}"
+
+
+def if_none_match_contains(etag):
+    """True when the client holds the representation tagged etag, in any content coding."""
+    if_none_match = request.if_none_match
+    return if_none_match.contains(etag) or any(
+        if_none_match.contains(encoded_etag(etag, encoding)) for encoding in ENCODINGS
+    )
+
+
+def choose_encoding(accept_encodings):
+    """'br', 'gzip' or None: the supported coding the client weights highest (br on ties)."""
+    offers = [("br", accept_encodings["br"])] if brotli is not None else []
+    offers.append(("gzip", accept_encodings["gzip"]))
+    encoding, quality = max(offers, key=lambda offer: offer[1])
+    return encoding if quality > 0 else None
+
+
+def compress(body, encoding, gzip_level=COMPRESS_GZIP_LEVEL, brotli_quality=COMPRESS_BROTLI_QUALITY):
+    if encoding == "br":
+        return brotli.compress(body, quality=brotli_quality)
+    return gzip.compress(body, gzip_level)
+
+
+def _compressible(response):
+    if response.status_code < 200 or response.status_code in (204, 206, 304):
+        return False
+    if response.direct_passthrough or response.is_streamed:
+        return False
+    if "Content-Encoding" in response.headers:
+        return False
+    if "no-transform" in response.headers.get("Cache-Control", ""):
+        return False
+    return (response.mimetype or "").startswith(COMPRESSIBLE_TYPES)
+
+
+def _echo_encoded_etag(response):
+    # A 304 must carry the tag of the copy the client holds, which may be a
+    # compressed one
+    etag, weak = response.get_etag()
+    if etag and not weak and not request.if_none_match.contains(etag):
+        for encoding in ENCODINGS:
+            if request.if_none_match.contains(encoded_etag(etag, encoding)):
+                response.set_etag(encoded_etag(etag, encoding))
+                response.vary.add("Accept-Encoding")
+                return
+
+
+def compress_response(response):
+    if response.status_code == 304:
+        _echo_encoded_etag(response)
+        return response
+    if not _compressible(response):
+        return response
+    response.vary.add("Accept-Encoding")
+    if request.method == "HEAD":
+        return response
+
+    encoding = choose_encoding(request.accept_encodings)
+    if encoding is None:
+        return response
+
+    body = response.get_data()
+    if len(body) < COMPRESS_MIN_SIZE:
+        return response
+
+    etag, weak = response.get_etag()
+    if etag and not weak:
+        key = (encoding, hashlib.sha1(body).digest())
+        compressed = _compressed.get(key, lambda: compress(body, encoding))
+    else:
+        compressed = compress(body, encoding)
+
+    if len(compressed) >= len(body):
+        return response
+    response.set_data(compressed)
+    response.headers["Content-Encoding"] = encoding
+    if etag:
+        response.set_etag(encoded_etag(etag, encoding), weak=weak)
+    return response
+
+
+def init_compression(app):
+    app.after_request(compress_response)
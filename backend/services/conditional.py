@@ -0,0 +1,77 @@
+from functools import wraps
+from flask import request, make_response
+from pymongo import UpdateOne, ReturnDocument
+import hashlib
+from services.compression import if_none_match_contains
+
+# Conditional GET support. A handler declares how to get a cheap version token
+# for what it returns (an updatedAt, a last_message_time, or a counter from
+# resource_versions); when the client already has that version it gets a 304
+# and the handler never runs.
+
+# resource_versions keys shared between modules
+DOCTOR_DIRECTORY_VERSION = "doctor_directory"
+
+
+def schedule_version_key(doctor_id):
+    return f"schedule:{doctor_id}"
+
+
+def get_version(db, key):
+    doc = db.resource_versions.find_one({"_id": key}, {"v": 1})
+    return doc["v"] if doc else 0
+
+
+def bump_version(db, *keys):
+    """Mark the resources behind these keys as changed so cached copies revalidate."""
+    keys = [key for key in keys if key]
+    if keys:
+        db.resource_versions.bulk_write(
+            [UpdateOne({"_id": key}, {"$inc": {"v": 1}}, upsert=True) for key in keys],
+            ordered=False
+        )
+
+
+def bump_version_of(db, key):
+    """bump_version for a single key. Returns the new version."""
+    doc = db.resource_versions.find_one_and_update(
+        {"_id": key}, {"$inc": {"v": 1}}, {"v": 1},
+        upsert=True, return_document=ReturnDocument.AFTER
+    )
+    return doc["v"]
+
+
+def make_etag(*parts):
+    # The full path is included so that different pages/filters get different tags
+    raw = "|".join(str(part) for part in parts + (request.full_path,))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def conditional(version_fn):
+    """
+    Decorator for GET handlers. version_fn is called with the handler's
+    arguments and returns a version token, or None to skip validation. The
+    token must identify the caller when the response is per-user. Put it
+    below @token_required so both receive current_user.
+    """
+    def decorator(f):
+        @wraps(f)
+        def decorated(*args, **kwargs):
+            version = version_fn(*args, **kwargs)
+            if version is None:
+                return f(*args, **kwargs)
+
+            etag = make_etag(version)
+            if if_none_match_contains(etag):
+                response = make_response("", 304)
+            else:
+                response = make_response(f(*args, **kwargs))
+                if response.status_code != 200:
+                    return response
+
+            response.set_etag(etag)
+            response.headers['Cache-Control'] = 'private, no-cache'
+            response.vary.add('Authorization')
+            return response
+        return decorated
+    return decorator
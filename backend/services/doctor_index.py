@@ -0,0 +1,196 @@
+from collections import defaultdict
+import threading
+import heapq
+import unicodedata
+import time
+import re
+import os
+from services.conditional import get_version, DOCTOR_DIRECTORY_VERSION
+
+# In-process typeahead index over doctor profiles. Every token of the indexed
+# fields is posted under each of its prefixes and its trigrams, so a keystroke
+# is answered from dictionaries without touching MongoDB. Profile writes in this
+# process update it directly; writes made by other workers are picked up when
+# the doctor directory version changes (checked at most every
+# DOCTOR_INDEX_REFRESH_SECONDS). A write here that is the only change since the
+# version the index holds moves the index to the new version, so it does not
+# trigger a reload of its own.
+
+DOCTOR_INDEX_REFRESH_SECONDS = float(os.getenv('DOCTOR_INDEX_REFRESH_SECONDS', 30))
+MAX_PREFIX_LENGTH = 15
+
+# How much a match in each field counts towards the ranking
+FIELD_WEIGHTS = {
+    "name": 3.0,
+    "specialization": 2.0,
+    "clinicName": 1.5,
+    "qualification": 1.0,
+}
+# A trigram (typo-tolerant) match counts this much of a prefix match
+TRIGRAM_FACTOR = 0.5
+# Share of a query token's trigrams a candidate must have to count as a fuzzy match
+TRIGRAM_MIN_OVERLAP = 0.5
+
+_TOKEN = re.compile(r"[a-z0-9]+")
+
+
+def tokenize(text):
+    text = unicodedata.normalize("NFKD", str(text or "")).encode("ascii", "ignore").decode().lower()
+    return _TOKEN.findall(text)
+
+
+def trigrams(token):
+    padded = f" {token} "
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+def _entry(profile):
+    return {
+        "id": str(profile["_id"]),
+        "userId": str(profile.get("userId", "")),
+        "name": f"{profile.get('firstName', '') or ''} {profile.get('lastName', '') or ''}".strip(),
+        "specialization": profile.get("specialization") or "",
+        "qualification": profile.get("qualification") or "",
+        "clinicName": profile.get("clinicName") or "",
+        "profilePhoto": profile.get("profilePhoto") or "",
+    }
+
+
+class DoctorSearchIndex:
+    def __init__(self):
+        self._lock = threading.RLock()
+        self._entries = {}
+        self._prefixes = defaultdict(dict)   # prefix -> {doctor id: weight}
+        self._trigrams = defaultdict(dict)   # trigram -> {doctor id: weight}
+        self._keys = {}                      # doctor id -> (prefixes, trigrams) it is posted under
+        self._version = None
+        self._checked_at = 0
+        # One rebuild at a time; upserts made while it reads MongoDB are kept
+        # in _pending and replayed before the swap
+        self._rebuild_lock = threading.Lock()
+        self._pending = None
+
+    def __len__(self):
+        return len(self._entries)
+
+    def _post(self, postings, key, doctor_id, weight):
+        if postings[key].get(doctor_id, 0) < weight:
+            postings[key][doctor_id] = weight
+
+    def upsert(self, profile, version=None):
+        """Index profile. version is the directory version its write bumped to, if known."""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((profile, version))
+            self._index(profile)
+            if version is not None and self._version is not None and version == self._version + 1:
+                self._version = version
+
+    def _index(self, profile):
+        entry = _entry(profile)
+        doctor_id = entry["id"]
+        with self._lock:
+            self.remove(doctor_id)
+            prefixes, grams = set(), set()
+            for field, weight in FIELD_WEIGHTS.items():
+                for token in tokenize(entry[field]):
+                    for end in range(1, min(len(token), MAX_PREFIX_LENGTH) + 1):
+                        self._post(self._prefixes, token[:end], doctor_id, weight)
+                        prefixes.add(token[:end])
+                    for gram in trigrams(token):
+                        self._post(self._trigrams, gram, doctor_id, weight)
+                        grams.add(gram)
+            self._entries[doctor_id] = entry
+            self._keys[doctor_id] = (prefixes, grams)
+
+    def remove(self, doctor_id):
+        with self._lock:
+            prefixes, grams = self._keys.pop(doctor_id, ((), ()))
+            for postings, keys in ((self._prefixes, prefixes), (self._trigrams, grams)):
+                for key in keys:
+                    postings[key].pop(doctor_id, None)
+                    if not postings[key]:
+                        del postings[key]
+            self._entries.pop(doctor_id, None)
+
+    def rebuild(self, profiles, version=None):
+        """Replace the index with profiles, read at directory version (read before profiles)."""
+        with self._rebuild_lock:
+            with self._lock:
+                self._pending = []
+            try:
+                fresh = DoctorSearchIndex()
+                for profile in profiles:
+                    fresh._index(profile)
+                fresh._version = version
+            except Exception:
+                with self._lock:
+                    self._pending = None
+                raise
+
+            with self._lock:
+                # Writes bumped past the version read may be missing from profiles
+                for profile, upsert_version in self._pending:
+                    if version is None or upsert_version is None or upsert_version > version:
+                        fresh.upsert(profile, upsert_version)
+                self._pending = None
+                self._entries, self._prefixes = fresh._entries, fresh._prefixes
+                self._trigrams, self._keys = fresh._trigrams, fresh._keys
+                self._version = fresh._version
+                self._checked_at = time.monotonic()
+
+    def refresh(self, db):
+        """Reload from MongoDB if another process changed the directory since the last check."""
+        if time.monotonic() - self._checked_at < DOCTOR_INDEX_REFRESH_SECONDS:
+            return
+        if self._rebuild_lock.locked():
+            # Another request is already reloading; answer from the current index
+            return
+        version = get_version(db, DOCTOR_DIRECTORY_VERSION)
+        if version == self._version:
+            self._checked_at = time.monotonic()
+            return
+        projection = {field: 1 for field in ("userId", "firstName", "lastName", "specialization",
+                                             "qualification", "clinicName", "profilePhoto")}
+        self.rebuild(db.doctor_profiles.find({}, projection), version)
+
+    def _match_token(self, token):
+        """{doctor id: score} for one query token: prefix postings, else trigram overlap."""
+        exact = self._prefixes.get(token[:MAX_PREFIX_LENGTH], {})
+        if exact or len(token) < 3:
+            return exact
+
+        query_grams = trigrams(token)
+        counts = defaultdict(float)
+        best = {}
+        for gram in query_grams:
+            for doctor_id, weight in self._trigrams.get(gram, {}).items():
+                counts[doctor_id] += 1
+                best[doctor_id] = max(best.get(doctor_id, 0), weight)
+        needed = len(query_grams) * TRIGRAM_MIN_OVERLAP
+        return {
+            doctor_id: best[doctor_id] * TRIGRAM_FACTOR * count / len(query_grams)
+            for doctor_id, count in counts.items() if count >= needed
+        }
+
+    def search(self, query, limit=10):
+        tokens = tokenize(query)
+        if not tokens:
+            return []
+        with self._lock:
+            scores = None
+            for token in tokens:
+                matches = self._match_token(token)
+                if scores is None:
+                    scores = matches
+                else:
+                    # Every query token has to match something
+                    scores = {doctor_id: score + matches[doctor_id]
+                              for doctor_id, score in scores.items() if doctor_id in matches}
+                if not scores:
+                    return []
+            ranked = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], self._entries[item[0]]["name"]))
+            return [dict(self._entries[doctor_id], score=round(score, 3)) for doctor_id, score in ranked]
+
+
+doctor_index = DoctorSearchIndex()
@@ -0,0 +1,87 @@
+from flask import current_app
+from bson import ObjectId
+from pymongo import UpdateOne
+import re
+from services.cache import TTLCache
+
+# Appointments reference their doctor through doctorUserId: the string form of the
+# doctor's users _id, which is also what doctor_profiles.userId stores. Older
+# records only have doctorId (either a profile _id or a users _id) and doctorName.
+
+# profile _id / user _id -> users _id. The mapping never changes once created.
+_doctor_user_ids = TTLCache(maxsize=4096, ttl=3600)
+
+_TITLE_PREFIX = re.compile(r'^dr\.?\s*', re.IGNORECASE)
+
+
+def resolve_doctor_user_id(doctor_id, db=None):
+    """Map a doctor profile id or a users id to the canonical doctorUserId, or None."""
+    if not doctor_id:
+        return None
+    doctor_id = str(doctor_id)
+    db = db if db is not None else current_app.db
+
+    def load():
+        query = [{"userId": doctor_id}]
+        if ObjectId.is_valid(doctor_id):
+            query.append({"_id": ObjectId(doctor_id)})
+        profile = db.doctor_profiles.find_one({"$or": query}, {"userId": 1})
+        return str(profile["userId"]) if profile else None
+
+    return _doctor_user_ids.get(doctor_id, load)
+
+
+def normalize_doctor_name(name):
+    """'Dr. Jane  Doe' / 'Dr Jane Doe' / 'Jane Doe' -> 'jane doe'"""
+    return " ".join(_TITLE_PREFIX.sub("", (name or "").strip()).lower().split())
+
+
+def backfill_doctor_user_ids(db, batch_size=500, log=print):
+    """
+    Set doctorUserId on appointments that do not have it yet.
+
+    Work is done in _id order in batches of bulk writes. Only documents missing
+    the field are selected, so the job can be interrupted and re-run safely;
+    appointments that cannot be resolved get doctorUserId=None and are skipped
+    on later runs.
+    """
+    profiles = list(db.doctor_profiles.find({}, {"userId": 1, "firstName": 1, "lastName": 1}))
+    by_id = {}
+    by_name = {}
+    ambiguous = set()
+    for profile in profiles:
+        user_id = str(profile["userId"])
+        by_id[str(profile["_id"])] = user_id
+        by_id[user_id] = user_id
+        name = normalize_doctor_name(f"{profile.get('firstName', '')} {profile.get('lastName', '')}")
+        if name in by_name and by_name[name] != user_id:
+            ambiguous.add(name)
+        by_name[name] = user_id
+    for name in ambiguous:
+        by_name.pop(name, None)
+
+    last_id = None
+    updated = unresolved = 0
+    while True:
+        query = {"doctorUserId": {"$exists": False}}
+        if last_id is not None:
+            query["_id"] = {"$gt": last_id}
+        batch = list(db.appointment.find(query, {"doctorId": 1, "doctorName": 1})
+                     .sort("_id", 1).limit(batch_size))
+        if not batch:
+            break
+
+        ops = []
+        for appt in batch:
+            user_id = by_id.get(str(appt.get("doctorId"))) or by_name.get(normalize_doctor_name(appt.get("doctorName")))
+            if user_id is None:
+                unresolved += 1
+            else:
+                updated += 1
+            ops.append(UpdateOne({"_id": appt["_id"]}, {"$set": {"doctorUserId": user_id}}))
+
+        db.appointment.bulk_write(ops, ordered=False)
+        last_id = batch[-1]["_id"]
+        log(f"Backfilled up to {last_id}: {updated} resolved, {unresolved} unresolved")
+
+    return {"updated": updated, "unresolved": unresolved}
@@ -0,0 +1,184 @@
+from bson import ObjectId
+from datetime import datetime, timezone
+from pymongo import InsertOne, ReplaceOne
+from services.indexes import INDEX_SPEC
+
+# Dashboard counters kept up to date as things happen instead of being counted
+# on every load:
+#
+#   doctor_stats        {_id: doctorUserId, totalAppointments, totalPatients, unreadMessages}
+#   doctor_daily_stats  {_id: "<doctorUserId>:<YYYY-MM-DD>", doctorUserId, date,
+#                        appointments, messagesReceived, messagesSent}
+#
+# appointments in a daily document counts appointments taking place that day;
+# the message counters count messages sent or received that (UTC) day.
+# rebuild_doctor_stats() recomputes both from the source collections, without
+# a moment where the dashboard finds them empty.
+
+REBUILD_BATCH_SIZE = 1000
+
+
+def _daily_id(doctor_user_id, date):
+    return f"{doctor_user_id}:{date}"
+
+
+def _inc_daily(db, doctor_user_id, date, inc):
+    db.doctor_daily_stats.update_one(
+        {"_id": _daily_id(doctor_user_id, date)},
+        {"$inc": inc, "$setOnInsert": {"doctorUserId": doctor_user_id, "date": date}},
+        upsert=True
+    )
+
+
+def record_appointment(db, doctor_user_id, date, new_patient):
+    """Count a booked appointment; new_patient when it is the patient's first with this doctor."""
+    db.doctor_stats.update_one(
+        {"_id": doctor_user_id},
+        {"$inc": {"totalAppointments": 1, "totalPatients": 1 if new_patient else 0}},
+        upsert=True
+    )
+    _inc_daily(db, doctor_user_id, date, {"appointments": 1})
+
+
+def record_message(db, doctor_user_id, sent_by_doctor, when=None):
+    """Count a message in a conversation with this doctor."""
+    date = (when or datetime.now(timezone.utc)).strftime("%Y-%m-%d")
+    if sent_by_doctor:
+        _inc_daily(db, doctor_user_id, date, {"messagesSent": 1})
+        return
+    db.doctor_stats.update_one({"_id": doctor_user_id}, {"$inc": {"unreadMessages": 1}}, upsert=True)
+    _inc_daily(db, doctor_user_id, date, {"messagesReceived": 1})
+
+
+def record_read(db, doctor_user_id, count):
+    """The doctor opened a conversation that had `count` unread messages."""
+    if count:
+        db.doctor_stats.update_one({"_id": doctor_user_id}, {"$inc": {"unreadMessages": -count}}, upsert=True)
+
+
+def get_doctor_stats(db, doctor_user_id):
+    return db.doctor_stats.find_one({"_id": doctor_user_id}) or {}
+
+
+def appointments_since(db, doctor_user_id, date):
+    """Appointments on or after date, summed over the daily documents."""
+    return sum(
+        day.get("appointments", 0)
+        for day in db.doctor_daily_stats.find(
+            {"doctorUserId": doctor_user_id, "date": {"$gte": date}}, {"appointments": 1}
+        )
+    )
+
+
+def appointments_on(db, doctor_user_id, date):
+    day = db.doctor_daily_stats.find_one({"_id": _daily_id(doctor_user_id, date)}, {"appointments": 1})
+    return day.get("appointments", 0) if day else 0
+
+
+def rebuild_doctor_stats(db, doctor_user_id=None, log=print):
+    """
+    Recompute doctor_stats and doctor_daily_stats from appointments,
+    conversations and messages, for one doctor or for all of them.
+    """
+    doctor_match = {"doctorUserId": doctor_user_id} if doctor_user_id else {"doctorUserId": {"$type": "string"}}
+    stats = {}
+    daily = {}
+
+    def daily_doc(user_id, date):
+        return daily.setdefault(_daily_id(user_id, date), {
+            "_id": _daily_id(user_id, date), "doctorUserId": user_id, "date": date,
+            "appointments": 0, "messagesReceived": 0, "messagesSent": 0
+        })
+
+    def stats_doc(user_id):
+        return stats.setdefault(user_id, {
+            "_id": user_id, "totalAppointments": 0, "totalPatients": 0, "unreadMessages": 0
+        })
+
+    for row in db.appointment.aggregate([
+        {"$match": doctor_match},
+        {"$group": {"_id": {"doctor": "$doctorUserId", "date": "$date"}, "count": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        daily_doc(row["_id"]["doctor"], row["_id"]["date"])["appointments"] = row["count"]
+        stats_doc(row["_id"]["doctor"])["totalAppointments"] += row["count"]
+
+    for row in db.appointment.aggregate([
+        {"$match": doctor_match},
+        {"$group": {"_id": {"doctor": "$doctorUserId", "patient": "$patientEmail"}}},
+        {"$group": {"_id": "$_id.doctor", "patients": {"$sum": 1}}}
+    ], allowDiskUse=True):
+        stats_doc(row["_id"])["totalPatients"] = row["patients"]
+
+    # Conversations and messages are keyed by email
+    doctor_users = {
+        user["email"]: str(user["_id"])
+        for user in db.users.find(
+            {"role": "doctor", **({"_id": ObjectId(doctor_user_id)} if doctor_user_id else {})},
+            {"email": 1}
+        )
+    }
+    conversation_doctors = {}
+    for conversation in db.conversations.find(
+        {"doctor_email": {"$in": list(doctor_users)}},
+        {"doctor_email": 1, "unread_count_doctor": 1}
+    ):
+        user_id = doctor_users[conversation["doctor_email"]]
+        conversation_doctors[conversation["_id"]] = user_id
+        stats_doc(user_id)["unreadMessages"] += conversation.get("unread_count_doctor", 0)
+
+    for row in db.messages.aggregate([
+        {"$match": {"conversation_id": {"$in": list(conversation_doctors)}}},
+        {"$group": {
+            "_id": {
+                "conversation": "$conversation_id",
+                "date": {"$dateToString": {"format": "%Y-%m-%d", "date": "$timestamp"}},
+                "fromDoctor": {"$eq": ["$sender_role", "doctor"]}
+            },
+            "count": {"$sum": 1}
+        }}
+    ], allowDiskUse=True):
+        key = row["_id"]
+        field = "messagesSent" if key["fromDoctor"] else "messagesReceived"
+        daily_doc(conversation_doctors[key["conversation"]], key["date"])[field] += row["count"]
+
+    if doctor_user_id:
+        _replace_scope(db.doctor_daily_stats, {"doctorUserId": doctor_user_id}, daily.values())
+        _replace_scope(db.doctor_stats, {"_id": doctor_user_id}, stats.values())
+    else:
+        _replace_collection(db, "doctor_daily_stats", daily.values())
+        _replace_collection(db, "doctor_stats", stats.values())
+    log(f"Rebuilt stats for {len(stats)} doctors ({len(daily)} daily documents)")
+    return len(stats)
+
+
+def _write_batches(collection, requests):
+    batch = []
+    for request in requests:
+        batch.append(request)
+        if len(batch) >= REBUILD_BATCH_SIZE:
+            collection.bulk_write(batch, ordered=False)
+            batch = []
+    if batch:
+        collection.bulk_write(batch, ordered=False)
+
+
+def _replace_scope(collection, scope, docs):
+    """Overwrite the documents matching scope with docs in place, then drop the ones not rebuilt."""
+    docs = list(docs)
+    _write_batches(collection, (ReplaceOne({"_id": doc["_id"]}, doc, upsert=True) for doc in docs))
+    collection.delete_many({**scope, "_id": {"$nin": [doc["_id"] for doc in docs]}})
+
+
+def _replace_collection(db, name, docs):
+    """Build the collection under a temporary name with its indexes and rename it over the live one."""
+    staging = db[f"{name}_rebuild"]
+    staging.drop()
+    _write_batches(staging, (InsertOne(doc) for doc in docs))
+    if name in INDEX_SPEC:
+        staging.create_indexes(INDEX_SPEC[name])
+    if staging.estimated_document_count():
+        staging.rename(name, dropTarget=True)
+    else:
+        # rename needs an existing source collection
+        staging.drop()
+        db[name].delete_many({})
@@ -0,0 +1,194 @@
+from bson import ObjectId
+from dateutil.parser import isoparse
+from datetime import datetime, timedelta, timezone
+import os
+
+# Bookable slots for a doctor, computed from availability windows, schedule
+# settings, busy time, appointments and live slot holds. Everything is handled
+# as naive UTC datetimes, matching how appointment date/time are interpreted by
+# the reminder scheduler.
+
+DEFAULT_CONSULTATION_MINUTES = int(os.getenv('DEFAULT_CONSULTATION_MINUTES', 30))
+FREE_SLOTS_MAX_DAYS = int(os.getenv('FREE_SLOTS_MAX_DAYS', 31))
+# Widest UTC offset; ISO strings in local time compare as local wall-clock time
+MAX_UTC_OFFSET = timedelta(hours=14)
+
+WEEKDAYS = ["Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "Sunday"]
+
+
+def to_utc(value):
+    """datetime or ISO string -> naive UTC datetime (None if unparseable)."""
+    if isinstance(value, str):
+        try:
+            value = isoparse(value)
+        except ValueError:
+            return None
+    if not isinstance(value, datetime):
+        return None
+    if value.tzinfo is not None:
+        value = value.astimezone(timezone.utc).replace(tzinfo=None)
+    return value
+
+
+def merge_intervals(intervals):
+    """Sort by start and sweep, joining overlapping or touching intervals."""
+    merged = []
+    for start, end in sorted(i for i in intervals if i[0] and i[1] and i[0] < i[1]):
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1][1] = end
+        else:
+            merged.append([start, end])
+    return [(start, end) for start, end in merged]
+
+
+def intersect_intervals(a, b):
+    """Intersection of two merged, sorted interval lists."""
+    result = []
+    i = j = 0
+    while i < len(a) and j < len(b):
+        start = max(a[i][0], b[j][0])
+        end = min(a[i][1], b[j][1])
+        if start < end:
+            result.append((start, end))
+        if a[i][1] < b[j][1]:
+            i += 1
+        else:
+            j += 1
+    return result
+
+
+def subtract_intervals(windows, blocked):
+    """Parts of the merged windows not covered by the merged blocked list."""
+    result = []
+    j = 0
+    for start, end in windows:
+        # Blocks ending before this window cannot affect it or any later one
+        while j < len(blocked) and blocked[j][1] <= start:
+            j += 1
+        k = j
+        while k < len(blocked) and blocked[k][0] < end:
+            if blocked[k][0] > start:
+                result.append((start, blocked[k][0]))
+            start = max(start, blocked[k][1])
+            k += 1
+        if start < end:
+            result.append((start, end))
+    return result
+
+
+def _clock(value):
+    hours, minutes = str(value).split(":")[:2]
+    return timedelta(hours=int(hours), minutes=int(minutes))
+
+
+def working_hours(settings):
+    """(day start, day end) offsets from midnight, or None without usable settings."""
+    hours = (settings or {}).get("workingHours") or {}
+    try:
+        return _clock(hours.get("start", "00:00")), _clock(hours.get("end", "24:00"))
+    except (ValueError, AttributeError):
+        return None
+
+
+def working_windows(settings, start, end):
+    """One window per working day between start and end, or None without settings."""
+    hours = working_hours(settings) if settings else None
+    if hours is None:
+        return None
+    day_start, day_end = hours
+    days = set(settings.get("workingDays") or WEEKDAYS)
+
+    windows = []
+    day = datetime.combine(start.date(), datetime.min.time())
+    while day < end:
+        if WEEKDAYS[day.weekday()] in days:
+            windows.append((day + day_start, day + day_end))
+        day += timedelta(days=1)
+    return merge_intervals(windows)
+
+
+def aligned_slots(free, duration, offset=timedelta(0)):
+    """
+    Slot starts that fit entirely inside a free interval and sit on the grid of
+    `duration` steps from each day's midnight + offset (the working-day start).
+    """
+    slots = []
+    for start, end in free:
+        day_anchor = datetime.combine(start.date(), datetime.min.time()) + offset
+        steps = -((day_anchor - start) // duration)  # ceil((start - anchor) / duration)
+        slot = day_anchor + steps * duration
+        while slot + duration <= end:
+            slots.append(slot)
+            slot += duration
+    return slots
+
+
+def compute_free_slots(db, doctor_user_id, start, end, now=None):
+    """
+    Free slots for the doctor in [start, end), as (start datetime, duration).
+
+    Availability windows are limited to the working days/hours of the doctor's
+    schedule settings; a doctor with settings but no availability entries is
+    considered available during working hours. Busy time, booked appointments
+    and other patients' live holds are then subtracted.
+    """
+    now = now or datetime.now(timezone.utc).replace(tzinfo=None)
+    start = max(start, now)
+    doctor_oid = ObjectId(doctor_user_id)
+    doctor_ids = [doctor_oid, doctor_user_id]
+
+    settings = db.doctor_schedule_settings.find_one({"doctorId": doctor_oid})
+    duration = timedelta(minutes=int((settings or {}).get("consultationDuration") or DEFAULT_CONSULTATION_MINUTES))
+    if start >= end:
+        return [], duration
+
+    availability = merge_intervals(
+        (to_utc(slot.get("startTime")), to_utc(slot.get("endTime")))
+        for slot in db.doctor_availability.find(
+            {"doctorId": {"$in": doctor_ids}, "startTime": {"$lt": end}, "endTime": {"$gt": start}},
+            {"startTime": 1, "endTime": 1}
+        )
+    )
+    working = working_windows(settings, start, end)
+    if working is not None:
+        windows = intersect_intervals(availability, working) if availability else working
+    else:
+        windows = availability
+    windows = intersect_intervals(windows, [(start, end)])
+    if not windows:
+        return [], duration
+
+    blocked = []
+    # Busy time from Google syncs made before it was stored as dates is still
+    # ISO strings with an offset. A range comparison only reaches BSON values
+    # of the same type, so those rows get their own window, widened by the
+    # largest offset, and are checked exactly below.
+    for busy in db.doctor_busy_time.find(
+        {"doctorId": {"$in": doctor_ids}, "$or": [
+            {"startTime": {"$lt": end}, "endTime": {"$gt": start}},
+            {"startTime": {"$lt": (end + MAX_UTC_OFFSET).isoformat()},
+             "endTime": {"$gt": (start - MAX_UTC_OFFSET).isoformat()}}
+        ]},
+        {"startTime": 1, "endTime": 1}
+    ):
+        busy_start, busy_end = to_utc(busy.get("startTime")), to_utc(busy.get("endTime"))
+        if busy_start and busy_end:
+            blocked.append((busy_start, busy_end))
+
+    dates = {"$gte": start.strftime("%Y-%m-%d"), "$lte": end.strftime("%Y-%m-%d")}
+    taken = list(db.appointment.find({"doctorUserId": doctor_user_id, "date": dates}, {"date": 1, "time": 1}))
+    taken += list(db.slot_holds.find(
+        {"doctorUserId": doctor_user_id, "date": dates, "expiresAt": {"$gt": now}},
+        {"date": 1, "time": 1}
+    ))
+    for slot in taken:
+        try:
+            slot_start = datetime.strptime(f"{slot['date']} {slot['time']}", "%Y-%m-%d %H:%M")
+        except (KeyError, ValueError):
+            continue
+        blocked.append((slot_start, slot_start + duration))
+
+    free = subtract_intervals(windows, merge_intervals(blocked))
+    hours = working_hours(settings) if settings else None
+    return aligned_slots(free, duration, hours[0] if hours else timedelta(0)), duration
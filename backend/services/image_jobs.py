@@ -0,0 +1,176 @@
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from datetime import datetime, timedelta, timezone
+from werkzeug.datastructures import FileStorage
+import multiprocessing
+import threading
+import logging
+import uuid
+import io
+import os
+from services.images import compress_image, content_filename, write_file, write_derivatives
+from services.realtime import socketio, user_room
+from services.json_provider import json_safe
+
+logger = logging.getLogger(__name__)
+
+# Uploaded images are compressed in a pool of worker processes so that Pillow
+# neither blocks a request worker nor holds its GIL. upload_image() records an
+# image_jobs document and answers at once with its id:
+#
+#   {_id: job_id, owner, status: "pending" | "ready" | "failed", original_name,
+#    original_size, createdAt, finishedAt, file_id, file_size, file_type, error}
+#
+# When the job finishes the document is updated and an "upload_updated" event is
+# pushed to the owner's Socket.IO room; clients can also poll GET /api/upload/<job_id>.
+IMAGE_WORKERS = int(os.getenv('IMAGE_WORKERS', 2))
+# Jobs allowed to wait for a worker before new uploads are rejected
+IMAGE_QUEUE_SIZE = int(os.getenv('IMAGE_QUEUE_SIZE', 8))
+# A job still pending after this long was lost (e.g. the server restarted)
+IMAGE_JOB_TIMEOUT = timedelta(seconds=int(os.getenv('IMAGE_JOB_TIMEOUT', 120)))
+# Workers are not forked from the server process: by the time the first upload
+# arrives it runs the Mongo client, outbox, scheduler and Socket.IO threads, and
+# a lock held by one of them at fork time would stay held in the child. Workers
+# started this way re-import the main script when the server runs as
+# `python app.py`; app.py skips its background work there (see parent_process()).
+IMAGE_POOL_START_METHOD = os.getenv('IMAGE_POOL_START_METHOD', 'forkserver')
+
+_executor = None
+_executor_lock = threading.Lock()
+_slots = threading.BoundedSemaphore(IMAGE_WORKERS + IMAGE_QUEUE_SIZE)
+
+
+class ImageQueueFull(Exception):
+    """Raised when the image pool is saturated; handlers should answer 503."""
+
+
+def _get_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            context = multiprocessing.get_context(IMAGE_POOL_START_METHOD)
+            if IMAGE_POOL_START_METHOD == 'forkserver':
+                # Only what the workers run, not the server's __main__
+                context.set_forkserver_preload(['services.images'])
+            _executor = ProcessPoolExecutor(max_workers=IMAGE_WORKERS, mp_context=context)
+        return _executor
+
+
+def _discard_executor(executor):
+    global _executor
+    with _executor_lock:
+        if _executor is executor:
+            _executor = None
+    executor.shutdown(wait=False)
+
+
+def process_upload(content, original_filename, upload_folder):
+    """Runs in a worker process: compress the upload and write it and its derivatives to upload_folder."""
+    compressed_file, compressed_extension = compress_image(
+        FileStorage(io.BytesIO(content), filename=original_filename)
+    )
+    if isinstance(compressed_file, FileStorage):
+        # The original file (already within limits, or compression failed)
+        data = content
+    else:
+        data = compressed_file.getvalue()
+        compressed_file.close()
+
+    filename = content_filename(data, compressed_extension)
+    filepath = os.path.join(upload_folder, filename)
+    if not os.path.exists(filepath):
+        os.makedirs(upload_folder, exist_ok=True)
+        write_file(filepath, data)
+        write_derivatives(upload_folder, filename)
+
+    return {
+        "file_id": filename,
+        "file_size": len(data),
+        "file_type": compressed_extension
+    }
+
+
+def _finish(db, job_id, owner, update):
+    update["finishedAt"] = datetime.now(timezone.utc)
+    job = db.image_jobs.find_one_and_update({"_id": job_id}, {"$set": update})
+    if job is not None:
+        socketio.emit("upload_updated", json_safe(job_response({**job, **update})), to=user_room(owner))
+
+
+def submit_upload(db, owner, content, original_filename, upload_folder):
+    """Queue an uploaded image for processing. Returns the pending job document."""
+    if not _slots.acquire(blocking=False):
+        raise ImageQueueFull("Image processing queue is full")
+
+    job = {
+        "_id": uuid.uuid4().hex,
+        "owner": owner,
+        "status": "pending",
+        "original_name": original_filename,
+        "original_size": len(content),
+        "createdAt": datetime.now(timezone.utc)
+    }
+    try:
+        db.image_jobs.insert_one(job)
+        executor = _get_executor()
+        try:
+            future = executor.submit(process_upload, content, original_filename, upload_folder)
+        except BrokenProcessPool:
+            # A worker died; start a new pool for this and later jobs
+            _discard_executor(executor)
+            future = _get_executor().submit(process_upload, content, original_filename, upload_folder)
+    except Exception:
+        _slots.release()
+        db.image_jobs.delete_one({"_id": job["_id"]})
+        raise
+
+    def done(future):
+        _slots.release()
+        try:
+            _finish(db, job["_id"], owner, {"status": "ready", **future.result()})
+        except Exception as e:
+            logger.exception("Image job %s failed", job["_id"])
+            if isinstance(e, BrokenProcessPool):
+                _discard_executor(executor)
+            try:
+                _finish(db, job["_id"], owner, {"status": "failed", "error": str(e) or type(e).__name__})
+            except Exception:
+                logger.exception("Could not record the failure of image job %s", job["_id"])
+
+    future.add_done_callback(done)
+    return job
+
+
+def get_upload_job(db, job_id, owner):
+    job = db.image_jobs.find_one({"_id": job_id, "owner": owner})
+    if job and job["status"] == "pending":
+        created_at = job["createdAt"].replace(tzinfo=timezone.utc)
+        if datetime.now(timezone.utc) - created_at > IMAGE_JOB_TIMEOUT:
+            job = {**job, "status": "failed", "error": "Image processing timed out"}
+    return job
+
+
+def job_response(job):
+    """The job as returned to its owner; ready jobs carry the old upload response fields."""
+    response = {
+        "job_id": job["_id"],
+        "status": job["status"],
+        "original_name": job.get("original_name")
+    }
+    if job["status"] == "ready":
+        original_size = job.get("original_size", 0)
+        compressed_size = job["file_size"]
+        compression_ratio = (1 - compressed_size / original_size) * 100 if original_size > 0 else 0
+        response.update({
+            "file_id": job["file_id"],
+            "file_size": compressed_size,
+            "file_type": job["file_type"],
+            "compression_stats": {
+                "original_size": original_size,
+                "compressed_size": compressed_size,
+                "compression_ratio": f"{compression_ratio:.1f}%"
+            }
+        })
+    elif job["status"] == "failed":
+        response["error"] = job.get("error")
+    return response
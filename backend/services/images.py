@@ -0,0 +1,237 @@
+from PIL import Image
+from werkzeug.security import safe_join
+import hashlib
+import logging
+import uuid
+import re
+import io
+import os
+from services.cache import TTLCache
+
+logger = logging.getLogger(__name__)
+
+# Upload images are stored as JPEG of at most max_dimension px on the long side
+# and max_size_mb. The pipeline avoids the expensive steps where it can:
+#
+#   - JPEGs already within both limits (and carrying no EXIF, which may hold
+#     location data) are stored as uploaded, without decoding them.
+#   - Large JPEGs are decoded at 1/2, 1/4 or 1/8 scale by libjpeg (draft mode)
+#     and then resized, instead of decoding every pixel of a 12 MP photo.
+#   - The quality is found with a short binary search below the requested
+#     quality instead of trying a fixed ladder of encodes.
+#
+# Each upload also gets smaller copies for list views, stored as JPEG under
+# <upload folder>/<size>/<filename>. "full" is the upload itself.
+#
+# Uploads are named by the SHA-256 of their stored bytes, so an image uploaded
+# twice is stored once, and a name always refers to the same content: files are
+# served with a long immutable Cache-Control and the hash as ETag. Older uploads
+# are named "<uuid hex>_<original name>" and are never rewritten either.
+
+IMAGE_MIN_QUALITY = int(os.getenv('IMAGE_MIN_QUALITY', 30))
+# Encodes allowed for the quality search after the first attempt
+IMAGE_QUALITY_SEARCH_STEPS = int(os.getenv('IMAGE_QUALITY_SEARCH_STEPS', 3))
+IMAGE_FALLBACK_DIMENSION = 1280
+
+# Stored files never change, so clients and proxies may keep them for a year
+FILE_MAX_AGE = 365 * 24 * 3600
+CONTENT_ADDRESSED_NAME = re.compile(r"^([0-9a-f]{64})\.[a-z]+$")
+
+# Derivative name -> longest side in px
+IMAGE_DERIVATIVES = {"thumb": 160, "medium": 480}
+IMAGE_DERIVATIVE_QUALITY = int(os.getenv('IMAGE_DERIVATIVE_QUALITY', 80))
+
+# Derivatives generated on request for files that have none on disk (uploaded
+# before derivatives existed, or whose generation failed)
+_derivatives = TTLCache(
+    maxsize=int(os.getenv('IMAGE_DERIVATIVE_CACHE_SIZE', 256)),
+    ttl=int(os.getenv('IMAGE_DERIVATIVE_CACHE_TTL', 3600))
+)
+
+
+def _target_size(size, max_dimension):
+    if max(size) <= max_dimension:
+        return size
+    ratio = max_dimension / max(size)
+    return tuple(max(1, int(dim * ratio)) for dim in size)
+
+
+def _file_size(image_file):
+    image_file.seek(0, io.SEEK_END)
+    size = image_file.tell()
+    image_file.seek(0)
+    return size
+
+
+def _to_rgb(image):
+    # Flatten transparency onto white (JPEG has no alpha channel)
+    if image.mode in ('RGBA', 'LA', 'P'):
+        background = Image.new('RGB', image.size, (255, 255, 255))
+        if image.mode == 'P':
+            image = image.convert('RGBA')
+        background.paste(image, mask=image.split()[-1] if image.mode in ('RGBA', 'LA') else None)
+        return background
+    if image.mode != 'RGB':
+        return image.convert('RGB')
+    return image
+
+
+def _encode(image, quality):
+    output = io.BytesIO()
+    image.save(output, format='JPEG', quality=quality, optimize=True)
+    return output
+
+
+def _encode_within(image, max_bytes, quality):
+    """
+    Encode at the highest quality in [IMAGE_MIN_QUALITY, quality] that fits
+    max_bytes. Returns the output, or None if even the lowest quality is too large.
+    """
+    output = _encode(image, quality)
+    if output.getbuffer().nbytes <= max_bytes:
+        return output
+
+    best = None
+    low, high = IMAGE_MIN_QUALITY, quality - 1
+    for _ in range(IMAGE_QUALITY_SEARCH_STEPS):
+        if low > high:
+            break
+        q = (low + high) // 2
+        output = _encode(image, q)
+        if output.getbuffer().nbytes <= max_bytes:
+            best, low = output, q + 1
+        else:
+            high = q - 1
+
+    if best is None and low == IMAGE_MIN_QUALITY:
+        # The search never reached the minimum quality
+        output = _encode(image, IMAGE_MIN_QUALITY)
+        if output.getbuffer().nbytes <= max_bytes:
+            best = output
+    return best
+
+
+def compress_image(image_file, max_size_mb=2, quality=85, max_dimension=1920):
+    """
+    Compress image file to reduce size while maintaining reasonable quality
+
+    Args:
+        image_file: File object from request.files
+        max_size_mb: Maximum file size in MB (default: 2MB)
+        quality: JPEG quality (1-95, default: 85)
+        max_dimension: Maximum width or height (default: 1920px)
+
+    Returns:
+        Compressed image as BytesIO object (or the original file when it is
+        already within the limits), file extension
+    """
+    try:
+        max_bytes = max_size_mb * 1024 * 1024
+        image = Image.open(image_file)
+
+        if (image.format == 'JPEG' and image.mode in ('RGB', 'L')
+                and max(image.size) <= max_dimension and 'exif' not in image.info
+                and _file_size(image_file) <= max_bytes):
+            return image_file, 'jpg'
+
+        target = _target_size(image.size, max_dimension)
+        if image.format == 'JPEG' and target != image.size:
+            # Only reduces by powers of two down to at least the target size
+            image.draft('RGB', target)
+
+        image = _to_rgb(image)
+        if image.size != target:
+            image = image.resize(target, Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+        output = _encode_within(image, max_bytes, quality)
+        if output is not None:
+            output.seek(0)
+            return output, 'jpg'
+
+        # If still too large, resize further
+        if max(image.size) > IMAGE_FALLBACK_DIMENSION:
+            image = image.resize(_target_size(image.size, IMAGE_FALLBACK_DIMENSION), Image.Resampling.LANCZOS)
+            output = _encode(image, 60)
+            output.seek(0)
+            return output, 'jpg'
+
+        # Last resort - very aggressive compression
+        output = _encode(image, IMAGE_MIN_QUALITY)
+        output.seek(0)
+        return output, 'jpg'
+
+    except Exception as e:
+        print(f"Error compressing image: {e}")
+        # Return original file if compression fails
+        image_file.seek(0)
+        original_extension = image_file.filename.rsplit('.', 1)[1].lower()
+        return image_file, original_extension
+
+
+def make_derivative(source, max_dimension, quality=IMAGE_DERIVATIVE_QUALITY):
+    """JPEG bytes of the image at source (a path or file) scaled down to fit max_dimension."""
+    with Image.open(source) as image:
+        # No-op for formats other than JPEG
+        image.draft('RGB', _target_size(image.size, max_dimension))
+        image = _to_rgb(image)
+        image.thumbnail((max_dimension, max_dimension), Image.Resampling.LANCZOS, reducing_gap=3.0)
+        return _encode(image, quality).getvalue()
+
+
+def derivative_folder(upload_folder, size):
+    return os.path.join(upload_folder, size)
+
+
+def content_filename(data, extension):
+    return f"{hashlib.sha256(data).hexdigest()}.{extension}"
+
+
+def file_etag(filename, size="full"):
+    """
+    The content hash (per size) for content-addressed uploads. Other names get
+    True, which lets send_file derive a validator from the file's mtime and size.
+    """
+    match = CONTENT_ADDRESSED_NAME.match(filename)
+    if match is None:
+        return True
+    return match.group(1) if size == "full" else f"{match.group(1)}-{size}"
+
+
+def write_file(path, data):
+    """Write via a temporary file so readers (and concurrent writers of the same name) never see a partial file."""
+    temporary = f"{path}.{uuid.uuid4().hex}.tmp"
+    with open(temporary, 'wb') as f:
+        f.write(data)
+    os.replace(temporary, path)
+
+
+def write_derivatives(upload_folder, filename):
+    """Store every derivative of an upload. Failures are logged; they are generated on request instead."""
+    source = os.path.join(upload_folder, filename)
+    for size, max_dimension in IMAGE_DERIVATIVES.items():
+        try:
+            data = make_derivative(source, max_dimension)
+            folder = derivative_folder(upload_folder, size)
+            os.makedirs(folder, exist_ok=True)
+            write_file(os.path.join(folder, filename), data)
+        except Exception:
+            logger.exception("Could not create %s derivative of %s", size, filename)
+
+
+def cached_derivative(upload_folder, filename, size):
+    """
+    Derivative bytes generated from the upload and kept in a bounded in-memory
+    cache. Returns None if the upload does not exist or is not a readable image.
+    """
+    source = safe_join(upload_folder, filename)
+    if source is None or not os.path.isfile(source):
+        return None
+
+    def generate():
+        try:
+            return make_derivative(source, IMAGE_DERIVATIVES[size])
+        except Exception as e:
+            logger.warning("Could not create %s derivative of %s: %s", size, filename, e)
+            return None
+
+    return _derivatives.get((filename, size), generate)
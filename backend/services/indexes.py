@@ -0,0 +1,159 @@
+from pymongo import IndexModel, ASCENDING, DESCENDING, GEOSPHERE
+from pymongo.errors import OperationFailure
+
+# Every index the application relies on, by collection. Names are explicit so
+# that check_indexes() can tell a missing index from one that was changed.
+INDEX_SPEC = {
+    "users": [
+        # signup relies on this instead of a check-then-insert race
+        IndexModel([("email", ASCENDING)], name="email_unique", unique=True),
+    ],
+    "appointment": [
+        # A slot can only be booked once. Legacy rows without doctorUserId are excluded.
+        IndexModel(
+            [("doctorUserId", ASCENDING), ("date", ASCENDING), ("time", ASCENDING)],
+            name="doctor_slot_unique",
+            unique=True,
+            partialFilterExpression={"doctorUserId": {"$type": "string"}}
+        ),
+        IndexModel(
+            [("patientEmail", ASCENDING), ("date", DESCENDING), ("time", DESCENDING), ("_id", DESCENDING)],
+            name="patient_date"
+        ),
+    ],
+    "slot_holds": [
+        IndexModel(
+            [("doctorUserId", ASCENDING), ("date", ASCENDING), ("time", ASCENDING)],
+            name="slot_unique",
+            unique=True
+        ),
+        # Abandoned holds are removed by MongoDB's TTL monitor
+        IndexModel([("expiresAt", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+    ],
+    "messages": [
+        IndexModel([("conversation_id", ASCENDING), ("timestamp", ASCENDING), ("_id", ASCENDING)], name="conversation_timestamp"),
+    ],
+    "conversations": [
+        IndexModel([("doctor_email", ASCENDING), ("last_message_time", DESCENDING), ("_id", DESCENDING)], name="doctor_inbox"),
+        IndexModel([("patient_email", ASCENDING), ("last_message_time", DESCENDING), ("_id", DESCENDING)], name="patient_inbox"),
+        IndexModel([("doctor_email", ASCENDING), ("patient_email", ASCENDING)], name="participants_unique", unique=True),
+    ],
+    "doctor_profiles": [
+        IndexModel([("userId", ASCENDING)], name="user_unique", unique=True),
+        # search_doctors: specialty prefix match and clinic distance
+        IndexModel([("specialization", ASCENDING)], name="specialization",
+                   collation={"locale": "en", "strength": 2}),
+        IndexModel([("clinicLocation", GEOSPHERE)], name="clinic_location"),
+    ],
+    "patient_profiles": [
+        IndexModel([("userId", ASCENDING)], name="user_unique", unique=True),
+        IndexModel([("email", ASCENDING)], name="email"),
+    ],
+    "doctor_availability": [
+        IndexModel([("doctorId", ASCENDING), ("startTime", ASCENDING)], name="doctor_start"),
+    ],
+    "doctor_busy_time": [
+        IndexModel([("doctorId", ASCENDING), ("startTime", ASCENDING)], name="doctor_start"),
+    ],
+    "doctor_schedule_settings": [
+        IndexModel([("doctorId", ASCENDING)], name="doctor_unique", unique=True),
+    ],
+    "video_sessions": [
+        IndexModel([("appointment_id", ASCENDING), ("status", ASCENDING)], name="appointment_status"),
+    ],
+    "medical_history": [
+        IndexModel([("patientEmail", ASCENDING), ("_id", ASCENDING)], name="patient"),
+    ],
+    "prescriptions": [
+        IndexModel([("patientEmail", ASCENDING), ("_id", ASCENDING)], name="patient"),
+    ],
+    "visit_notes": [
+        IndexModel([("patientEmail", ASCENDING), ("_id", ASCENDING)], name="patient"),
+    ],
+    "email_outbox": [
+        IndexModel([("status", ASCENDING), ("nextAttemptAt", ASCENDING)], name="status_next_attempt"),
+        # Delivered mail is kept for a week for troubleshooting
+        IndexModel([("sentAt", ASCENDING)], name="sent_ttl", expireAfterSeconds=7 * 24 * 3600),
+    ],
+    "doctor_patients": [
+        IndexModel([("doctorUserId", ASCENDING), ("patientEmail", ASCENDING)], name="doctor_patient_unique", unique=True),
+        IndexModel([("doctorUserId", ASCENDING), ("lastVisit", DESCENDING), ("patientEmail", DESCENDING)], name="doctor_last_visit"),
+        IndexModel([("doctorUserId", ASCENDING), ("patientName", ASCENDING), ("patientEmail", ASCENDING)], name="doctor_name"),
+        # profile writes update every row of a patient
+        IndexModel([("patientEmail", ASCENDING)], name="patient"),
+    ],
+    "doctor_daily_stats": [
+        IndexModel([("doctorUserId", ASCENDING), ("date", ASCENDING)], name="doctor_date"),
+    ],
+    "image_jobs": [
+        # Finished jobs only need to outlive the client's polling
+        IndexModel([("createdAt", ASCENDING)], name="created_ttl", expireAfterSeconds=24 * 3600),
+    ],
+    "refresh_tokens": [
+        # Expired refresh tokens are removed by MongoDB's TTL monitor
+        IndexModel([("expiresAt", ASCENDING)], name="expires_ttl", expireAfterSeconds=0),
+        IndexModel([("family", ASCENDING)], name="family"),
+    ],
+}
+
+# Options that make two indexes with the same name different
+_COMPARED_OPTIONS = ("unique", "expireAfterSeconds", "partialFilterExpression")
+
+
+def _describe(document):
+    return {
+        "key": [(field, direction) for field, direction in document["key"].items()],
+        **{opt: document[opt] for opt in _COMPARED_OPTIONS if opt in document}
+    }
+
+
+def check_indexes(db):
+    """
+    Compare the indexes in the database with INDEX_SPEC.
+    Returns {collection: {"missing": [...], "extra": [...], "changed": [...]}} for collections that differ.
+    """
+    report = {}
+    for collection_name, models in INDEX_SPEC.items():
+        existing = db[collection_name].index_information()
+        existing.pop("_id_", None)
+
+        wanted = {model.document["name"]: _describe(model.document) for model in models}
+        current = {
+            name: {
+                "key": [(field, direction) for field, direction in info["key"]],
+                **{opt: info[opt] for opt in _COMPARED_OPTIONS if opt in info}
+            }
+            for name, info in existing.items()
+        }
+
+        missing = [name for name in wanted if name not in current]
+        extra = [name for name in current if name not in wanted]
+        changed = [name for name in wanted if name in current and current[name] != wanted[name]]
+
+        if missing or extra or changed:
+            report[collection_name] = {"missing": missing, "extra": extra, "changed": changed}
+    return report
+
+
+def ensure_indexes(db, drop_extra=False, log=print):
+    """
+    Create every index in INDEX_SPEC. Safe to run repeatedly: existing indexes
+    are left alone. Extra indexes are only dropped when drop_extra is set.
+    Returns the list of collections whose indexes could not be created.
+    """
+    failed = []
+    if drop_extra:
+        for collection_name, diff in check_indexes(db).items():
+            for name in diff["extra"] + diff["changed"]:
+                log(f"Dropping index {collection_name}.{name}")
+                db[collection_name].drop_index(name)
+
+    for collection_name, models in INDEX_SPEC.items():
+        try:
+            db[collection_name].create_indexes(models)
+        except OperationFailure as e:
+            # Usually duplicate data under a unique index or an index with the
+            # same keys under another name; the rest of the spec still applies.
+            log(f"Could not create indexes on {collection_name}: {e}")
+            failed.append(collection_name)
+    return failed
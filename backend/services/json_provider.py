@@ -0,0 +1,66 @@
+from flask.json.provider import DefaultJSONProvider
+from bson import ObjectId
+from bson.decimal128 import Decimal128
+from datetime import datetime, date, timezone
+import json
+
+try:
+    import orjson
+except ImportError:  # pragma: no cover - falls back to the standard library encoder
+    orjson = None
+
+# Handlers return Mongo documents as they come out of the driver: ObjectId is
+# written as its hex string and datetimes in ISO 8601. The driver hands back
+# BSON dates as naive datetimes that are in UTC, so every naive datetime is
+# written with a +00:00 offset, by both the orjson and the standard encoder.
+
+
+def utc(value):
+    """Mark a naive datetime read from MongoDB as UTC."""
+    if isinstance(value, datetime) and value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value
+
+
+def _default(value):
+    if isinstance(value, ObjectId):
+        return str(value)
+    if isinstance(value, (datetime, date)):
+        return utc(value).isoformat()
+    if isinstance(value, Decimal128):
+        return str(value.to_decimal())
+    return DefaultJSONProvider.default(value)
+
+
+_ORJSON_OPTIONS = (orjson.OPT_NON_STR_KEYS | orjson.OPT_NAIVE_UTC) if orjson else 0
+
+
+def json_safe(value):
+    """
+    value with everything reduced to JSON types exactly as HTTP responses
+    encode them, for channels that serialize on their own (Socket.IO events).
+    Works without an app context.
+    """
+    if orjson is None:
+        return json.loads(json.dumps(value, default=_default))
+    return orjson.loads(orjson.dumps(value, default=_default, option=_ORJSON_OPTIONS))
+
+
+class MongoJSONProvider(DefaultJSONProvider):
+    default = staticmethod(_default)
+    sort_keys = False
+
+    def dumps(self, obj, **kwargs):
+        if orjson is None or kwargs:
+            return super().dumps(obj, **kwargs)
+        return orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS).decode()
+
+    def response(self, *args, **kwargs):
+        obj = self._prepare_response_obj(args, kwargs)
+        if orjson is None:
+            return super().response(obj)
+        # orjson produces bytes; skip the str round trip
+        return self._app.response_class(
+            orjson.dumps(obj, default=_default, option=_ORJSON_OPTIONS),
+            mimetype=self.mimetype
+        )
@@ -0,0 +1,58 @@
+from flask import g
+
+_MISSING = object()
+
+
+class BatchLoader:
+    """
+    Loads documents of one collection by a key field. Keys are collected with
+    prime() and fetched together with a single $in query the first time one of
+    them is needed; results (including misses) are memoized.
+    """
+
+    def __init__(self, collection, key_field, projection=None):
+        self.collection = collection
+        self.key_field = key_field
+        self.projection = dict(projection, **{key_field: 1}) if projection else None
+        self._pending = set()
+        self._results = {}
+
+    def prime(self, keys):
+        for key in keys:
+            if key is not None and key not in self._results:
+                self._pending.add(key)
+        return self
+
+    def _fetch_pending(self):
+        keys = list(self._pending)
+        self._pending.clear()
+        if not keys:
+            return
+        for doc in self.collection.find({self.key_field: {"$in": keys}}, self.projection):
+            self._results.setdefault(doc[self.key_field], doc)
+        for key in keys:
+            self._results.setdefault(key, None)
+
+    def load(self, key):
+        if key is None:
+            return None
+        result = self._results.get(key, _MISSING)
+        if result is _MISSING:
+            self._pending.add(key)
+            self._fetch_pending()
+            result = self._results[key]
+        return result
+
+    def load_many(self, keys):
+        self.prime(keys)
+        return {key: self.load(key) for key in keys}
+
+
+def request_loader(collection, key_field, projection=None):
+    """Return the BatchLoader for this collection/key/projection shared by the current request."""
+    loaders = g.setdefault("_batch_loaders", {})
+    # Callers asking for different fields must not get each other's documents
+    cache_key = (collection.name, key_field, tuple(sorted(projection.items())) if projection else None)
+    if cache_key not in loaders:
+        loaders[cache_key] = BatchLoader(collection, key_field, projection)
+    return loaders[cache_key]
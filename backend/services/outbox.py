@@ -0,0 +1,213 @@
+from email.mime.multipart import MIMEMultipart
+from email.mime.text import MIMEText
+from email.mime.base import MIMEBase
+from email import encoders
+from datetime import datetime, timedelta, timezone
+from pymongo import ReturnDocument
+import smtplib
+import threading
+import logging
+import time
+import os
+
+logger = logging.getLogger(__name__)
+
+# Outgoing mail is written to the email_outbox collection by request handlers and
+# delivered by a background OutboxSender that keeps its SMTP connection open.
+OUTBOX_BATCH_SIZE = int(os.getenv('OUTBOX_BATCH_SIZE', 20))
+OUTBOX_POLL_SECONDS = float(os.getenv('OUTBOX_POLL_SECONDS', 5))
+OUTBOX_MAX_ATTEMPTS = int(os.getenv('OUTBOX_MAX_ATTEMPTS', 6))
+OUTBOX_RETRY_BASE_SECONDS = int(os.getenv('OUTBOX_RETRY_BASE_SECONDS', 30))
+# A message left in "sending" this long (e.g. the worker died) is picked up again
+OUTBOX_LOCK_SECONDS = int(os.getenv('OUTBOX_LOCK_SECONDS', 120))
+# Close the SMTP connection after this much idle time
+SMTP_IDLE_SECONDS = int(os.getenv('SMTP_IDLE_SECONDS', 60))
+
+_sender = None
+
+
+def enqueue_email(db, recipients, subject, body, attachments=None):
+    """
+    Queue an email for delivery. attachments is a list of
+    {"filename", "maintype", "subtype", "content", "params"} dicts.
+    """
+    now = datetime.now(timezone.utc)
+    result = db.email_outbox.insert_one({
+        "to": recipients if isinstance(recipients, list) else [recipients],
+        "subject": subject,
+        "body": body,
+        "attachments": attachments or [],
+        "status": "pending",
+        "attempts": 0,
+        "nextAttemptAt": now,
+        "createdAt": now
+    })
+    if _sender is not None:
+        _sender.wake()
+    return result.inserted_id
+
+
+def build_message(doc, sender_email):
+    message = MIMEMultipart()
+    message['From'] = sender_email
+    message['To'] = ", ".join(doc["to"])
+    message['Subject'] = doc["subject"]
+    message.attach(MIMEText(doc["body"], 'plain'))
+
+    for attachment in doc.get("attachments", []):
+        part = MIMEBase(attachment["maintype"], attachment["subtype"],
+                        name=attachment["filename"], **attachment.get("params", {}))
+        part.set_payload(attachment["content"])
+        encoders.encode_base64(part)
+        part.add_header('Content-Disposition', f'attachment; filename="{attachment["filename"]}"')
+        message.attach(part)
+    return message
+
+
+class OutboxSender(threading.Thread):
+    """Drains email_outbox in batches over a reused SMTP connection."""
+
+    def __init__(self, db, host, port, use_tls=True, username=None, password=None, sender_email=None):
+        super().__init__(name="email-outbox", daemon=True)
+        self.db = db
+        self.host = host
+        self.port = port
+        self.use_tls = use_tls
+        self.username = username
+        self.password = password
+        self.sender_email = sender_email or username
+        self._smtp = None
+        self._last_used = 0
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self):
+        self._stopping.set()
+        self._wake.set()
+
+    def run(self):
+        while not self._stopping.is_set():
+            try:
+                sent = self.drain_once()
+            except Exception:
+                logger.exception("Email outbox drain failed")
+                sent = 0
+            if not sent:
+                if self._smtp is not None and time.monotonic() - self._last_used > SMTP_IDLE_SECONDS:
+                    self._disconnect()
+                self._wake.wait(OUTBOX_POLL_SECONDS)
+                self._wake.clear()
+        self._disconnect()
+
+    def drain_once(self):
+        """Claim and deliver one batch. Returns the number of messages handled."""
+        handled = 0
+        while handled < OUTBOX_BATCH_SIZE:
+            doc = self._claim()
+            if doc is None:
+                break
+            if doc["attempts"] > OUTBOX_MAX_ATTEMPTS:
+                # Only reachable by reclaiming: the last allowed attempt never finished
+                self._mark_failed(doc, "Sending did not finish before the lock expired", permanent=True)
+            else:
+                self._deliver(doc)
+            handled += 1
+        return handled
+
+    def _claim(self):
+        """
+        Lock the next due message. Every claim counts as an attempt, so a
+        message whose send kills the worker (and is reclaimed when its lock
+        expires) still runs out of attempts.
+        """
+        now = datetime.now(timezone.utc)
+        return self.db.email_outbox.find_one_and_update(
+            {"$or": [
+                {"status": "pending", "nextAttemptAt": {"$lte": now}},
+                {"status": "sending", "lockedUntil": {"$lte": now}}
+            ]},
+            {"$set": {"status": "sending", "lockedUntil": now + timedelta(seconds=OUTBOX_LOCK_SECONDS)},
+             "$inc": {"attempts": 1}},
+            sort=[("nextAttemptAt", 1)],
+            return_document=ReturnDocument.AFTER
+        )
+
+    def _connection(self):
+        if self._smtp is not None:
+            return self._smtp
+        smtp = smtplib.SMTP(self.host, self.port, timeout=30)
+        if self.use_tls:
+            smtp.starttls()
+        if self.username and self.password:
+            smtp.login(self.username, self.password)
+        self._smtp = smtp
+        return smtp
+
+    def _disconnect(self):
+        if self._smtp is None:
+            return
+        try:
+            self._smtp.quit()
+        except Exception:
+            pass
+        self._smtp = None
+
+    def _deliver(self, doc):
+        message = build_message(doc, self.sender_email)
+        try:
+            try:
+                self._connection().send_message(message)
+            except smtplib.SMTPServerDisconnected:
+                # The server dropped an idle connection; reconnect once
+                self._disconnect()
+                self._connection().send_message(message)
+            self._last_used = time.monotonic()
+        except smtplib.SMTPRecipientsRefused as e:
+            self._mark_failed(doc, str(e), permanent=True)
+            return
+        except Exception as e:
+            self._disconnect()
+            self._mark_failed(doc, str(e))
+            return
+
+        self.db.email_outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {"status": "sent", "sentAt": datetime.now(timezone.utc)},
+             "$unset": {"lockedUntil": ""}}
+        )
+
+    def _mark_failed(self, doc, error, permanent=False):
+        # The claim already counted this attempt
+        attempts = doc["attempts"]
+        give_up = permanent or attempts >= OUTBOX_MAX_ATTEMPTS
+        delay = OUTBOX_RETRY_BASE_SECONDS * (2 ** (attempts - 1))
+        logger.warning(f"Email {doc['_id']} to {doc['to']} failed (attempt {attempts}): {error}")
+        self.db.email_outbox.update_one(
+            {"_id": doc["_id"]},
+            {"$set": {
+                "status": "failed" if give_up else "pending",
+                "lastError": error,
+                "nextAttemptAt": datetime.now(timezone.utc) + timedelta(seconds=delay)
+            }, "$unset": {"lockedUntil": ""}}
+        )
+
+
+def start_outbox_sender(db, config):
+    """Start this process's sender thread using the MAIL_* settings in config."""
+    global _sender
+    if _sender is not None:
+        return _sender
+    _sender = OutboxSender(
+        db,
+        host=config['MAIL_SERVER'],
+        port=config['MAIL_PORT'],
+        use_tls=config['MAIL_USE_TLS'],
+        username=config['MAIL_USERNAME'],
+        password=config['MAIL_PASSWORD'],
+        sender_email=config['MAIL_DEFAULT_SENDER']
+    )
+    _sender.start()
+    return _sender
@@ -0,0 +1,140 @@
+from flask import request
+from bson import ObjectId
+from datetime import datetime
+import base64
+import json
+
+# Keyset (cursor) pagination. A cursor encodes the sort-key values of one item,
+# so the next page is a range query on an index instead of a skip over history.
+# The last sort field must make the order unique (usually _id).
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _encode_value(value):
+    if isinstance(value, ObjectId):
+        return ["o", str(value)]
+    if isinstance(value, datetime):
+        return ["d", value.isoformat()]
+    return ["v", value]
+
+
+def _decode_value(tagged):
+    tag, value = tagged
+    if tag == "o":
+        return ObjectId(value)
+    if tag == "d":
+        return datetime.fromisoformat(value)
+    return value
+
+
+def encode_cursor(item, sort):
+    values = [_encode_value(item.get(field)) for field, _ in sort]
+    return base64.urlsafe_b64encode(json.dumps(values, separators=(",", ":")).encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor, sort):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        values = [_decode_value(v) for v in json.loads(base64.urlsafe_b64decode(padded))]
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+    if len(values) != len(sort):
+        raise InvalidCursor("Invalid cursor")
+    return values
+
+
+def _keyset_filter(sort, values, forward):
+    """Items strictly after (forward) or before the cursor position in sort order."""
+    clauses = []
+    for i, (field, direction) in enumerate(sort):
+        clause = {prev_field: values[j] for j, (prev_field, _) in enumerate(sort[:i])}
+        clause[field] = {"$gt" if (direction == 1) == forward else "$lt": values[i]}
+        clauses.append(clause)
+    return {"$or": clauses}
+
+
+def page_limit(default_limit=50, max_limit=200):
+    try:
+        limit = int(request.args.get("limit", default_limit))
+    except ValueError:
+        raise InvalidCursor("Invalid limit")
+    return max(1, min(limit, max_limit))
+
+
+def _page_window(sort, default_limit, max_limit, from_end):
+    """Parse limit/after/before into (limit, keyset condition or None, forward)."""
+    limit = page_limit(default_limit, max_limit)
+    after = request.args.get("after")
+    before = request.args.get("before")
+
+    if after:
+        return limit, _keyset_filter(sort, decode_cursor(after, sort), forward=True), True
+    if before:
+        return limit, _keyset_filter(sort, decode_cursor(before, sort), forward=False), False
+    return limit, None, not from_end
+
+
+def _page_result(items, sort, limit, forward):
+    has_more = len(items) > limit
+    items = items[:limit]
+    if not forward:
+        items.reverse()
+
+    cursor = request.args.get("after") or request.args.get("before")
+    return items, {
+        "limit": limit,
+        "has_more": has_more,
+        "next_cursor": encode_cursor(items[-1], sort) if items else cursor,
+        "prev_cursor": encode_cursor(items[0], sort) if items else cursor
+    }
+
+
+def paginate(collection, query, sort, projection=None, default_limit=50, max_limit=200, from_end=False):
+    """
+    Return one page of collection.find(query) in `sort` order, driven by the
+    request's limit, after and before arguments:
+
+    - after=<cursor>: the items following the cursor
+    - before=<cursor>: the items preceding the cursor
+    - neither: the first page, or the last page when from_end is set
+      (e.g. the latest messages of a conversation sorted oldest first)
+
+    has_more says whether more items exist beyond this page in the direction
+    that was requested. Raises InvalidCursor for malformed arguments.
+    """
+    limit, keyset, forward = _page_window(sort, default_limit, max_limit, from_end)
+
+    if projection is not None:
+        projection = dict(projection, **{field: 1 for field, _ in sort})
+
+    walk = sort if forward else [(field, -direction) for field, direction in sort]
+    cursor = collection.find({"$and": [query, keyset]} if keyset else query, projection)
+    return _page_result(list(cursor.sort(walk).limit(limit + 1)), sort, limit, forward)
+
+
+def paginate_pipeline(collection, pipeline, sort, default_limit=50, max_limit=200, **aggregate_options):
+    """
+    paginate() for an aggregation: the keyset filter, sort and limit are
+    appended to `pipeline`, whose output documents must carry the sort fields.
+    """
+    limit, keyset, forward = _page_window(sort, default_limit, max_limit, False)
+
+    walk = sort if forward else [(field, -direction) for field, direction in sort]
+    stages = list(pipeline)
+    if keyset:
+        stages.append({"$match": keyset})
+    stages += [{"$sort": dict(walk)}, {"$limit": limit + 1}]
+    return _page_result(list(collection.aggregate(stages, **aggregate_options)), sort, limit, forward)
+
+
+def page_headers(response, page):
+    """For endpoints whose body is a bare list, expose the page info as headers."""
+    response.headers["X-Has-More"] = "true" if page["has_more"] else "false"
+    if page["next_cursor"]:
+        response.headers["X-Next-Cursor"] = page["next_cursor"]
+    if page["prev_cursor"]:
+        response.headers["X-Prev-Cursor"] = page["prev_cursor"]
+    return response
@@ -0,0 +1,55 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+import threading
+import os
+import bcrypt
+
+# bcrypt work factor for new hashes. Existing hashes with a different cost are
+# upgraded on the user's next successful login.
+BCRYPT_ROUNDS = int(os.getenv('BCRYPT_ROUNDS', 12))
+BCRYPT_WORKERS = int(os.getenv('BCRYPT_WORKERS', 4))
+# Jobs allowed to wait for a worker before new requests are rejected
+BCRYPT_QUEUE_SIZE = int(os.getenv('BCRYPT_QUEUE_SIZE', 32))
+BCRYPT_TIMEOUT = float(os.getenv('BCRYPT_TIMEOUT', 10))
+
+_executor = ThreadPoolExecutor(max_workers=BCRYPT_WORKERS, thread_name_prefix="bcrypt")
+_slots = threading.BoundedSemaphore(BCRYPT_WORKERS + BCRYPT_QUEUE_SIZE)
+
+
+class PasswordHasherBusy(Exception):
+    """Raised when the bcrypt executor is saturated; handlers should answer 503."""
+
+
+def _run(fn, *args):
+    if not _slots.acquire(blocking=False):
+        raise PasswordHasherBusy("Password hashing queue is full")
+    try:
+        future = _executor.submit(fn, *args)
+    except Exception:
+        _slots.release()
+        raise
+    future.add_done_callback(lambda _: _slots.release())
+    try:
+        return future.result(timeout=BCRYPT_TIMEOUT)
+    except FutureTimeoutError:
+        raise PasswordHasherBusy("Password hashing timed out")
+
+
+def _to_bytes(value):
+    return value.encode('utf-8') if isinstance(value, str) else value
+
+
+def hash_password(password):
+    return _run(lambda: bcrypt.hashpw(_to_bytes(password), bcrypt.gensalt(rounds=BCRYPT_ROUNDS)))
+
+
+def check_password(password, hashed):
+    return _run(bcrypt.checkpw, _to_bytes(password), _to_bytes(hashed))
+
+
+def needs_rehash(hashed):
+    """True when the stored hash was made with a different work factor."""
+    try:
+        # bcrypt hashes look like b"$2b$12$<salt+hash>"
+        return int(_to_bytes(hashed).split(b"$")[2]) != BCRYPT_ROUNDS
+    except (IndexError, ValueError):
+        return True
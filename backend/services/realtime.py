@@ -0,0 +1,92 @@
+from flask import request, session, current_app
+from flask_socketio import SocketIO, join_room, leave_room
+from bson import ObjectId
+import os
+from services.auth import authenticate_token, AuthError
+from services.json_provider import json_safe
+
+# Chat push channel. Clients connect with {"auth": {"token": <access token>}}
+# (or ?token=...) and are put in a room for their own email; they join a room per
+# open conversation with "join_conversation". Socket.IO negotiates WebSocket and
+# falls back to HTTP long-polling on its own.
+#
+# With several worker processes set SOCKETIO_MESSAGE_QUEUE (e.g. redis://...) so
+# that events published by one worker reach clients connected to another.
+#
+# Allowed origins are set in app.py from CORS_ORIGINS, like the HTTP API's.
+socketio = SocketIO(message_queue=os.getenv('SOCKETIO_MESSAGE_QUEUE') or None)
+
+
+def user_room(email):
+    return f"user:{email}"
+
+
+def conversation_room(conversation_id):
+    return f"conversation:{conversation_id}"
+
+
+@socketio.on("connect")
+def handle_connect(auth=None):
+    token = (auth or {}).get("token") or request.args.get("token")
+    if not token:
+        return False
+    try:
+        current_user = authenticate_token(token)
+    except AuthError:
+        return False
+
+    session["email"] = current_user.get("email")
+    session["role"] = current_user.get("role")
+    join_room(user_room(session["email"]))
+
+
+@socketio.on("join_conversation")
+def handle_join_conversation(data):
+    conversation_id = (data or {}).get("conversation_id")
+    email = session.get("email")
+    if not email or not conversation_id or not ObjectId.is_valid(conversation_id):
+        return {"error": "Invalid conversation ID"}
+
+    conversation = current_app.db.conversations.find_one(
+        {"_id": ObjectId(conversation_id)},
+        {"doctor_email": 1, "patient_email": 1}
+    )
+    if not conversation or email not in (conversation.get("doctor_email"), conversation.get("patient_email")):
+        return {"error": "Access denied"}
+
+    join_room(conversation_room(conversation_id))
+    return {"joined": conversation_id}
+
+
+@socketio.on("leave_conversation")
+def handle_leave_conversation(data):
+    conversation_id = (data or {}).get("conversation_id")
+    if conversation_id:
+        leave_room(conversation_room(conversation_id))
+
+
+def publish_message(conversation, message_item, recipient_email, recipient_unread):
+    """
+    Push a newly sent message to everyone viewing the conversation, and the
+    inbox update (with the recipient's new unread count) to both participants.
+    """
+    conversation_id = str(conversation["_id"])
+    socketio.emit("new_message", json_safe({"conversation_id": conversation_id, **message_item}),
+                  to=conversation_room(conversation_id))
+
+    summary = json_safe({
+        "conversation_id": conversation_id,
+        "last_message": conversation.get("last_message", ""),
+        "last_message_time": conversation.get("last_message_time"),
+        "last_message_sender_email": conversation.get("last_message_sender_email", "")
+    })
+    socketio.emit("conversation_updated", summary, to=user_room(message_item["sender_email"]))
+    socketio.emit("conversation_updated", {**summary, "unread_count": recipient_unread, "unread_delta": 1},
+                  to=user_room(recipient_email))
+
+
+def publish_read(conversation_id, reader_email):
+    """Tell the reader's other tabs/devices that the conversation is now read."""
+    socketio.emit("conversation_updated",
+                  {"conversation_id": str(conversation_id), "unread_count": 0},
+                  to=user_room(reader_email))
@@ -0,0 +1,118 @@
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timedelta, timezone
+from time import monotonic
+import os
+
+# How long a patient keeps a slot while filling in the booking form
+SLOT_HOLD_SECONDS = int(os.getenv('SLOT_HOLD_SECONDS', 300))
+# The hold taken while a booking is being written
+BOOKING_CLAIM_SECONDS = 30
+# How often a worker re-checks that the unique slot indexes still exist
+SLOT_INDEX_CHECK_SECONDS = int(os.getenv('SLOT_INDEX_CHECK_SECONDS', 300))
+
+# Both slot_holds and appointment have a unique (doctorUserId, date, time) index
+# (see services/indexes.py), so the database decides who gets a slot. Without
+# them nothing prevents double booking, so holds and bookings are refused
+# (SlotIndexMissing) until they exist.
+SLOT_INDEXES = {"appointment": "doctor_slot_unique", "slot_holds": "slot_unique"}
+
+_slot_indexes_checked_at = None
+
+
+class SlotUnavailable(Exception):
+    pass
+
+
+class SlotIndexMissing(Exception):
+    """Raised when a unique slot index is missing; handlers should answer 503."""
+
+
+def _require_slot_indexes(db):
+    global _slot_indexes_checked_at
+    now = monotonic()
+    if _slot_indexes_checked_at is not None and now - _slot_indexes_checked_at < SLOT_INDEX_CHECK_SECONDS:
+        return
+    for collection_name, index_name in SLOT_INDEXES.items():
+        info = db[collection_name].index_information().get(index_name)
+        if not info or not info.get("unique"):
+            _slot_indexes_checked_at = None
+            raise SlotIndexMissing(f"Unique index {collection_name}.{index_name} is missing")
+    _slot_indexes_checked_at = now
+
+
+def _slot(doctor_user_id, date, time):
+    return {"doctorUserId": doctor_user_id, "date": date, "time": time}
+
+
+def _claim(db, slot, holder_email, seconds):
+    """
+    Take or extend the hold on slot in one upsert. When someone else holds it
+    the filter does not match, the upsert inserts instead and the unique index
+    rejects it, so a live hold can never be overtaken.
+    """
+    now = datetime.now(timezone.utc)
+    expires_at = now + timedelta(seconds=seconds)
+    try:
+        db.slot_holds.update_one(
+            {**slot, "$or": [{"holderEmail": holder_email}, {"expiresAt": {"$lte": now}}]},
+            {"$set": {"holderEmail": holder_email, "heldAt": now, "expiresAt": expires_at}},
+            upsert=True
+        )
+    except DuplicateKeyError:
+        raise SlotUnavailable()
+    return expires_at
+
+
+def hold_slot(db, doctor_user_id, date, time, holder_email):
+    """
+    Reserve a slot for SLOT_HOLD_SECONDS. Holding a slot you already hold
+    extends it, and an expired hold can be taken over before the TTL monitor
+    removes it. Raises SlotUnavailable if the slot is booked or held by someone else.
+    """
+    _require_slot_indexes(db)
+    slot = _slot(doctor_user_id, date, time)
+    if db.appointment.find_one(slot, {"_id": 1}):
+        raise SlotUnavailable()
+    return _claim(db, slot, holder_email, SLOT_HOLD_SECONDS)
+
+
+def held_times(db, doctor_user_id, date):
+    """Times on date under a live hold (expired holds may linger until the TTL monitor runs)."""
+    return [
+        hold["time"] for hold in db.slot_holds.find(
+            {"doctorUserId": doctor_user_id, "date": date, "expiresAt": {"$gt": datetime.now(timezone.utc)}},
+            {"time": 1}
+        )
+    ]
+
+
+def _release(db, slot, holder_email):
+    db.slot_holds.delete_one({**slot, "holderEmail": holder_email})
+
+
+def release_slot(db, doctor_user_id, date, time, holder_email):
+    _release(db, _slot(doctor_user_id, date, time), holder_email)
+
+
+def book_slot(db, appointment_doc, holder_email):
+    """
+    Commit a booking. The slot's hold is claimed atomically first (failing if
+    another patient holds it), then the appointment is inserted; the unique
+    slot index makes a concurrent booking fail with SlotUnavailable.
+    """
+    _require_slot_indexes(db)
+    slot = _slot(appointment_doc["doctorUserId"], appointment_doc["date"], appointment_doc["time"])
+    _claim(db, slot, holder_email, BOOKING_CLAIM_SECONDS)
+
+    try:
+        result = db.appointment.insert_one(appointment_doc)
+    except DuplicateKeyError:
+        _release(db, slot, holder_email)
+        raise SlotUnavailable()
+    except Exception:
+        _release(db, slot, holder_email)
+        raise
+
+    # Best-effort cleanup; the TTL index removes it otherwise
+    _release(db, slot, holder_email)
+    return result.inserted_id
@@ -0,0 +1,93 @@
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+from datetime import datetime, timezone
+
+# doctor_patients holds one row per (doctor, patient) pair so a doctor's patient
+# list is a range scan on an index rather than a $group over every appointment:
+#
+#   {doctorUserId, patientEmail, patientName, firstVisit, lastVisit, totalVisits,
+#    phone, dateOfBirth, bloodGroup}
+#
+# Booking maintains the visit fields; patient profile writes copy the profile
+# fields to every row of that patient.
+
+PROFILE_PROJECTION = {"contactNumber": 1, "dateOfBirth": 1, "bloodGroup": 1}
+
+
+def profile_fields(profile):
+    profile = profile or {}
+    return {
+        "phone": profile.get("contactNumber"),
+        "dateOfBirth": profile.get("dateOfBirth"),
+        "bloodGroup": profile.get("bloodGroup"),
+    }
+
+
+def record_visit(db, doctor_user_id, patient_email, patient_name, date):
+    """Add a booked appointment to the roster. Returns True for the pair's first appointment."""
+    profile = db.patient_profiles.find_one({"email": patient_email}, PROFILE_PROJECTION)
+    key = {"doctorUserId": doctor_user_id, "patientEmail": patient_email}
+    update = {
+        "$inc": {"totalVisits": 1},
+        "$max": {"lastVisit": date},
+        "$min": {"firstVisit": date},
+        "$set": {"patientName": patient_name, "updatedAt": datetime.now(timezone.utc), **profile_fields(profile)}
+    }
+    try:
+        result = db.doctor_patients.update_one(key, update, upsert=True)
+    except DuplicateKeyError:
+        # A concurrent first booking inserted the row between our match and
+        # insert; the retry matches that row and updates it
+        result = db.doctor_patients.update_one(key, update, upsert=True)
+    return result.upserted_id is not None
+
+
+def sync_patient(db, patient_email, profile=None, patient_name=None):
+    """Copy changed patient profile fields and/or name to the patient's roster rows."""
+    update = profile_fields(profile) if profile is not None else {}
+    if patient_name:
+        update["patientName"] = patient_name
+    if update:
+        db.doctor_patients.update_many({"patientEmail": patient_email}, {"$set": update})
+
+
+def rebuild_roster(db, batch_size=500, log=print):
+    """Recompute doctor_patients from appointments and patient profiles."""
+    pipeline = [
+        {"$match": {"doctorUserId": {"$type": "string"}}},
+        {"$sort": {"date": 1}},
+        {"$group": {
+            "_id": {"doctor": "$doctorUserId", "patient": "$patientEmail"},
+            "patientName": {"$last": "$patientName"},
+            "firstVisit": {"$min": "$date"},
+            "lastVisit": {"$max": "$date"},
+            "totalVisits": {"$sum": 1}
+        }},
+        {"$lookup": {"from": "patient_profiles", "localField": "_id.patient", "foreignField": "email", "as": "profile"}}
+    ]
+
+    now = datetime.now(timezone.utc)
+    rows = 0
+    batch = []
+    for row in db.appointment.aggregate(pipeline, allowDiskUse=True):
+        key = {"doctorUserId": row["_id"]["doctor"], "patientEmail": row["_id"]["patient"]}
+        batch.append(UpdateOne(key, {"$set": {
+            "patientName": row["patientName"],
+            "firstVisit": row["firstVisit"],
+            "lastVisit": row["lastVisit"],
+            "totalVisits": row["totalVisits"],
+            "updatedAt": now,
+            **profile_fields(row["profile"][0] if row["profile"] else None)
+        }}, upsert=True))
+        if len(batch) >= batch_size:
+            db.doctor_patients.bulk_write(batch, ordered=False)
+            rows += len(batch)
+            batch = []
+    if batch:
+        db.doctor_patients.bulk_write(batch, ordered=False)
+        rows += len(batch)
+
+    # Rows whose appointments no longer exist
+    removed = db.doctor_patients.delete_many({"updatedAt": {"$lt": now}}).deleted_count
+    log(f"Roster rebuilt: {rows} rows written, {removed} removed")
+    return rows
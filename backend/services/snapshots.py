@@ -0,0 +1,67 @@
+from flask import request, current_app, Response
+import threading
+import hashlib
+import os
+from services.conditional import get_version
+from services.compression import choose_encoding, compress, brotli, encoded_etag, if_none_match_contains
+
+# Responses that are identical for every caller and change only on known writes
+# (e.g. the doctor directory) are kept encoded in memory, as JSON plus gzip and
+# brotli bytes, tagged with the resource_versions counter they were built at. Serving
+# one costs a counter lookup; the body is rebuilt after the counter moves.
+
+# Compressed once per version, so use the strongest settings
+SNAPSHOT_GZIP_LEVEL = int(os.getenv('SNAPSHOT_GZIP_LEVEL', 9))
+SNAPSHOT_BROTLI_QUALITY = int(os.getenv('SNAPSHOT_BROTLI_QUALITY', 11))
+
+
+class Snapshot:
+    def __init__(self, version, data):
+        self.version = version
+        self.body = current_app.json.dumps(data).encode()
+        self.encoded = {"gzip": compress(self.body, "gzip", gzip_level=SNAPSHOT_GZIP_LEVEL)}
+        if brotli is not None:
+            self.encoded["br"] = compress(self.body, "br", brotli_quality=SNAPSHOT_BROTLI_QUALITY)
+        self.etag = hashlib.sha1(self.body).hexdigest()
+
+
+class VersionedSnapshot:
+    """build(db) returns the JSON-serializable response data for version_key."""
+
+    def __init__(self, version_key, build, cache_control="public, no-cache"):
+        self.version_key = version_key
+        self.build = build
+        self.cache_control = cache_control
+        self._current = None
+        self._lock = threading.Lock()
+
+    def get(self, db):
+        version = get_version(db, self.version_key)
+        current = self._current
+        if current is not None and current.version == version:
+            return current
+        with self._lock:
+            # Another request may have rebuilt it while we waited
+            current = self._current
+            if current is None or current.version != version:
+                # The version is read before the data, so a write racing with
+                # the build only causes one more rebuild later
+                current = self._current = Snapshot(version, self.build(db))
+        return current
+
+    def response(self, db):
+        snapshot = self.get(db)
+        encoding = choose_encoding(request.accept_encodings)
+        if if_none_match_contains(snapshot.etag):
+            response = Response(status=304)
+        elif encoding:
+            response = Response(snapshot.encoded[encoding], mimetype="application/json")
+            response.headers["Content-Encoding"] = encoding
+        else:
+            response = Response(snapshot.body, mimetype="application/json")
+
+        # Each encoding is a different byte sequence, so it gets its own strong tag
+        response.set_etag(encoded_etag(snapshot.etag, encoding) if encoding else snapshot.etag)
+        response.headers["Cache-Control"] = self.cache_control
+        response.vary.add("Accept-Encoding")
+        return response
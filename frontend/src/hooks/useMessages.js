@@ -1,5 +1,6 @@
-import { useState, useEffect, useCallback } from 'react';
+import { useState, useEffect, useCallback, useRef } from 'react';
 import { messageService } from '../services/messageService';
+import { getSocket } from '../services/socket';
 
 export const useMessages = () => {
   const [conversations, setConversations] = useState([]);
@@ -8,6 +9,18 @@ export const useMessages = () => {
   const [loading, setLoading] = useState(false);
   const [error, setError] = useState(null);
   const [initialLoadComplete, setInitialLoadComplete] = useState(false);
+  const [loadingMore, setLoadingMore] = useState(false);
+
+  // Lists are paged by the server: conversations newest first (more via the
+  // next cursor), messages as the latest page (older ones via the prev cursor)
+  const [conversationsCursor, setConversationsCursor] = useState(null);
+  const [hasMoreConversations, setHasMoreConversations] = useState(false);
+  const [olderMessagesCursor, setOlderMessagesCursor] = useState(null);
+  const [hasOlderMessages, setHasOlderMessages] = useState(false);
+  // Once more pages are loaded, refreshes merge the first page into the list
+  // instead of replacing it
+  const moreConversationsLoaded = useRef(false);
+  const olderMessagesLoadedFor = useRef(null);
 
   // Load conversations on component mount
   const loadConversations = useCallback(async (showLoading = true) => {
@@ -17,7 +30,15 @@ export const useMessages = () => {
       }
       setError(null);
       const response = await messageService.getConversations();
-      setConversations(response.conversations || []);
+      const fresh = response.conversations || [];
+      if (moreConversationsLoaded.current) {
+        const freshIds = new Set(fresh.map(conversation => conversation.id));
+        setConversations(prev => [...fresh, ...prev.filter(conversation => !freshIds.has(conversation.id))]);
+      } else {
+        setConversations(fresh);
+        setConversationsCursor(response.page?.next_cursor || null);
+        setHasMoreConversations(Boolean(response.page?.has_more));
+      }
       if (!initialLoadComplete) {
         setInitialLoadComplete(true);
       }
@@ -44,7 +65,15 @@ export const useMessages = () => {
       }
       setError(null);
       const response = await messageService.getMessages(conversationId, otherUserEmail);
-      setMessages(response.messages || []);
+      const fresh = response.messages || [];
+      if (olderMessagesLoadedFor.current === conversationId) {
+        const freshIds = new Set(fresh.map(message => message.id));
+        setMessages(prev => [...prev.filter(message => !freshIds.has(message.id)), ...fresh]);
+      } else {
+        setMessages(fresh);
+        setOlderMessagesCursor(response.page?.prev_cursor || null);
+        setHasOlderMessages(Boolean(response.page?.has_more));
+      }
     } catch (err) {
       setError('Failed to load messages');
       console.error('Error loading messages:', err);
@@ -55,6 +84,55 @@ export const useMessages = () => {
     }
   }, []);
 
+  // Append the next page of conversations
+  const loadMoreConversations = useCallback(async () => {
+    if (!conversationsCursor) return;
+
+    try {
+      setLoadingMore(true);
+      const response = await messageService.getConversations(conversationsCursor);
+      const more = response.conversations || [];
+      moreConversationsLoaded.current = true;
+      setConversations(prev => {
+        const loadedIds = new Set(prev.map(conversation => conversation.id));
+        return [...prev, ...more.filter(conversation => !loadedIds.has(conversation.id))];
+      });
+      setConversationsCursor(response.page?.next_cursor || null);
+      setHasMoreConversations(Boolean(response.page?.has_more));
+    } catch (err) {
+      setError('Failed to load conversations');
+      console.error('Error loading more conversations:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [conversationsCursor]);
+
+  // Prepend the page of messages before the oldest one loaded
+  const loadOlderMessages = useCallback(async () => {
+    if (!activeConversation || !olderMessagesCursor) return;
+    const conversationId = activeConversation.conversation_id;
+
+    try {
+      setLoadingMore(true);
+      const response = await messageService.getMessages(
+        conversationId, activeConversation.other_user_email, olderMessagesCursor
+      );
+      const older = response.messages || [];
+      olderMessagesLoadedFor.current = conversationId;
+      setMessages(prev => {
+        const loadedIds = new Set(prev.map(message => message.id));
+        return [...older.filter(message => !loadedIds.has(message.id)), ...prev];
+      });
+      setOlderMessagesCursor(response.page?.prev_cursor || null);
+      setHasOlderMessages(Boolean(response.page?.has_more));
+    } catch (err) {
+      setError('Failed to load messages');
+      console.error('Error loading older messages:', err);
+    } finally {
+      setLoadingMore(false);
+    }
+  }, [activeConversation, olderMessagesCursor]);
+
   // Send a message
   const sendMessage = useCallback(async (conversationId, messageText, otherUserEmail, imageAttachment = null) => {
     if (!conversationId || (!messageText.trim() && !imageAttachment)) return;
@@ -104,6 +182,9 @@ export const useMessages = () => {
   // Select a conversation
   const selectConversation = useCallback((conversation) => {
     setActiveConversation(conversation);
+    olderMessagesLoadedFor.current = null;
+    setOlderMessagesCursor(null);
+    setHasOlderMessages(false);
     if (conversation) {
       loadMessages(conversation.conversation_id, conversation.other_user_email);
     } else {
@@ -116,27 +197,56 @@ export const useMessages = () => {
     return conversations.reduce((total, conv) => total + (conv.unread_count || 0), 0);
   }, [conversations]);
 
-  // Auto-refresh functionality
+  // Conversations: reload when the server pushes an inbox update
   useEffect(() => {
     loadConversations();
 
-    // Set up auto-refresh interval for conversations
+    const socket = getSocket();
+    const handleConversationUpdated = () => loadConversations(false); // Silent refresh
+    socket.on('conversation_updated', handleConversationUpdated);
+
+    // Fall back to polling while the socket is disconnected
     const conversationInterval = setInterval(() => {
-      loadConversations(false); // Silent refresh
-    }, 5000); // Refresh every 5 seconds
+      if (!socket.connected) {
+        loadConversations(false);
+      }
+    }, 5000);
 
-    return () => clearInterval(conversationInterval);
+    return () => {
+      socket.off('conversation_updated', handleConversationUpdated);
+      clearInterval(conversationInterval);
+    };
   }, [loadConversations]);
 
-  // Auto-refresh messages for active conversation
+  // Active conversation: join its room and reload when a message arrives
   useEffect(() => {
     if (!activeConversation) return;
 
+    const socket = getSocket();
+    const conversationId = activeConversation.conversation_id;
+    const join = () => socket.emit('join_conversation', { conversation_id: conversationId });
+    const handleNewMessage = (message) => {
+      if (message.conversation_id === conversationId) {
+        loadMessages(conversationId, activeConversation.other_user_email, false); // Silent refresh
+      }
+    };
+
+    join();
+    socket.on('connect', join); // Rooms are lost on reconnect
+    socket.on('new_message', handleNewMessage);
+
     const messageInterval = setInterval(() => {
-      loadMessages(activeConversation.conversation_id, activeConversation.other_user_email, false); // Silent refresh
-    }, 3000); // Refresh every 3 seconds
+      if (!socket.connected) {
+        loadMessages(conversationId, activeConversation.other_user_email, false);
+      }
+    }, 3000);
 
-    return () => clearInterval(messageInterval);
+    return () => {
+      socket.emit('leave_conversation', { conversation_id: conversationId });
+      socket.off('connect', join);
+      socket.off('new_message', handleNewMessage);
+      clearInterval(messageInterval);
+    };
   }, [activeConversation, loadMessages]);
 
   return {
@@ -144,9 +254,14 @@ export const useMessages = () => {
     activeConversation,
     messages,
     loading,
+    loadingMore,
     error,
+    hasMoreConversations,
+    hasOlderMessages,
     loadConversations,
+    loadMoreConversations,
     loadMessages,
+    loadOlderMessages,
     sendMessage,
     uploadImage,
     startConversation,
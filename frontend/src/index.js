@@ -1,12 +1,15 @@
 import React from 'react';
 import ReactDOM from 'react-dom/client';
 import App from './App';
+import { installAuthRefresh } from './services/authRefresh';
 import './assets/css/styles.css';
 
 // Global styles
 import 'bootstrap/dist/css/bootstrap.min.css';
 import '@fortawesome/fontawesome-free/css/all.min.css';
 
+installAuthRefresh();
+
 const root = ReactDOM.createRoot(document.getElementById('root'));
 
 root.render(
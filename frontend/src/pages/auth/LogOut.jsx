@@ -3,7 +3,19 @@ import React from 'react';
 const LogOut = ({ buttonText = "Logout", buttonStyle = "", showIcon = true }) => {
     const handleLogout = () => {
 
+        const refreshToken = localStorage.getItem('refreshToken');
+        if (refreshToken) {
+            // Best effort; the page is left either way
+            fetch('https://mediconnect-backend-xe6f.onrender.com/api/token/revoke', {
+                method: 'POST',
+                headers: { 'Content-Type': 'application/json' },
+                body: JSON.stringify({ refreshToken }),
+                keepalive: true
+            }).catch(() => {});
+        }
+
         localStorage.removeItem('token');
+        localStorage.removeItem('refreshToken');
         localStorage.removeItem('role');
         
         window.location.href = '/login';
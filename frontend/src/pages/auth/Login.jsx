@@ -21,10 +21,11 @@ const Login = ({ toggleForm }) => {
 
     try {
       const res = await axios.post("https://mediconnect-backend-xe6f.onrender.com/api/login", formData);
-      const { token, role, doctorId, name, email } = res.data;
+      const { token, refreshToken, role, doctorId, name, email } = res.data;
       const decoded = jwtDecode(token);
 
       localStorage.setItem("token", token);
+      localStorage.setItem("refreshToken", refreshToken);
       localStorage.setItem("role", role);
       localStorage.setItem("name", name);
       localStorage.setItem("email", email);
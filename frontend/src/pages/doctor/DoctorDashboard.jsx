@@ -23,7 +23,12 @@ const DoctorDashboard = () => {
         activeConversation,
         messages,
         loading: messagesLoading,
+        loadingMore: messagesLoadingMore,
         error: messagesError,
+        hasMoreConversations,
+        hasOlderMessages,
+        loadMoreConversations,
+        loadOlderMessages,
         sendMessage,
         uploadImage,
         selectConversation,
@@ -40,6 +45,9 @@ const DoctorDashboard = () => {
     const [todayAppointments, setTodayAppointments] = useState([]);
     const [upcomingAppointments, setUpcomingAppointments] = useState([]);
     const [patientsList, setPatientsList] = useState([]);
+    // Patients come a page at a time; the cursor for the next page is sent in X-Next-Cursor
+    const [patientsCursor, setPatientsCursor] = useState(null);
+    const [loadingMorePatients, setLoadingMorePatients] = useState(false);
     const [loading, setLoading] = useState(true);
     const [error, setError] = useState(null);
 
@@ -99,6 +107,25 @@ const DoctorDashboard = () => {
         }
     };
 
+    const fetchMorePatients = async () => {
+        if (!patientsCursor) return;
+        try {
+            setLoadingMorePatients(true);
+            const token = localStorage.getItem('token');
+            const doctorId = localStorage.getItem('doctorId');
+            const response = await axios.get(`https://mediconnect-backend-xe6f.onrender.com/api/doctor/${doctorId}/patients`, {
+                headers: { Authorization: `Bearer ${token}` },
+                params: { after: patientsCursor }
+            });
+            setPatientsList(prev => [...prev, ...(response.data || [])]);
+            setPatientsCursor(response.headers['x-has-more'] === 'true' ? response.headers['x-next-cursor'] : null);
+        } catch (error) {
+            console.error('Error fetching more patients:', error);
+        } finally {
+            setLoadingMorePatients(false);
+        }
+    };
+
     const fetchDoctorData = async () => {
     try {
         setLoading(true);
@@ -112,7 +139,7 @@ const DoctorDashboard = () => {
         const fetchWithErrorHandling = async (url, config) => {
             try {
                 const response = await axios.get(url, config);
-                return { success: true, data: response.data };
+                return { success: true, data: response.data, headers: response.headers };
             } catch (err) {
                 console.error(`Error fetching ${url}:`, err.response?.data || err.message);
                 return { success: false, error: err.response?.data?.message || err.message, status: err.response?.status };
@@ -151,6 +178,8 @@ const DoctorDashboard = () => {
         setTodayAppointments(appointmentsRes.success ? appointmentsRes.data.today || [] : []);
         setUpcomingAppointments(appointmentsRes.success ? appointmentsRes.data.upcoming || [] : []);
         setPatientsList(patientsRes.success ? patientsRes.data || [] : []);
+        setPatientsCursor(patientsRes.success && patientsRes.headers['x-has-more'] === 'true'
+            ? patientsRes.headers['x-next-cursor'] : null);
         console.log(patientsList)
         setDoctorProfile(profileRes.success ? profileRes.data || {} : {
             specialization: 'Not specified',
@@ -287,7 +316,8 @@ const DoctorDashboard = () => {
         license: doctorProfile?.medicalLicense || "Not specified",
         experience: doctorProfile?.experience ? `${doctorProfile.experience} years` : "Not specified",
         rating: doctorProfile?.rating || 0,
-        totalPatients: patientsList.length
+        // Only the loaded pages are known here
+        totalPatients: patientsCursor ? `${patientsList.length}+` : patientsList.length
     };
 
     const renderOverview = () => (
@@ -694,6 +724,13 @@ const DoctorDashboard = () => {
                                         </div>
                                     </div>
                                 ))}
+                                {patientsCursor && (
+                                    <div className="col-12 text-center">
+                                        <button className="btn btn-sm btn-link" onClick={fetchMorePatients} disabled={loadingMorePatients}>
+                                            {loadingMorePatients ? 'Loading...' : 'Load more patients'}
+                                        </button>
+                                    </div>
+                                )}
                             </div>
                         )}
                     </div>
@@ -912,6 +949,13 @@ const DoctorDashboard = () => {
                                 </div>
                             ))
                         )}
+                        {!messagesLoading && hasMoreConversations && (
+                            <div className="text-center p-2">
+                                <button className="btn btn-sm btn-link" onClick={loadMoreConversations} disabled={messagesLoadingMore}>
+                                    {messagesLoadingMore ? 'Loading...' : 'Load more conversations'}
+                                </button>
+                            </div>
+                        )}
                     </div>
                 </div>
             </div>
@@ -976,7 +1020,15 @@ const DoctorDashboard = () => {
                                         <small className="text-muted">Start the conversation by sending a message</small>
                                     </div>
                                 ) : (
-                                    messages.map(message => {
+                                    <>
+                                    {hasOlderMessages && (
+                                        <div className="text-center mb-3">
+                                            <button className="btn btn-sm btn-link" onClick={loadOlderMessages} disabled={messagesLoadingMore}>
+                                                {messagesLoadingMore ? 'Loading...' : 'Load older messages'}
+                                            </button>
+                                        </div>
+                                    )}
+                                    {messages.map(message => {
                                         const isCurrentUser = message.sender_email === localStorage.getItem('userEmail') || message.sender_role === 'doctor';
                                         return (
                                             <div key={message.id} className={`d-flex mb-3 ${isCurrentUser ? 'justify-content-end' : ''}`}>
@@ -1009,7 +1061,7 @@ const DoctorDashboard = () => {
                                                     {message.image_attachment && (
                                                         <div className="mb-1">
                                                             <img
-                                                                src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${message.image_attachment.file_id}`}
+                                                                src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${message.image_attachment.file_id}?size=medium`}
                                                                 alt={message.image_attachment.original_name}
                                                                 style={{
                                                                     maxWidth: '200px',
@@ -1032,7 +1084,8 @@ const DoctorDashboard = () => {
                                                 </div>
                                             </div>
                                         );
-                                    })
+                                    })}
+                                    </>
                                 )}
                             </div>
                             <div className="card-footer" style={{ background: 'white', borderRadius: '0 0 20px 20px' }}>
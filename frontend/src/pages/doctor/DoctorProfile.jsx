@@ -139,7 +139,20 @@ const DoctorProfile = () => {
           'Content-Type': 'multipart/form-data'
         }
       });
-      return response.data.file_id;
+
+      // The image is compressed in the background; wait until it is stored
+      let job = response.data;
+      while (job.status === 'pending') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const status = await axios.get(`https://mediconnect-backend-xe6f.onrender.com/api/upload/${job.job_id}`, {
+          headers: { 'Authorization': `Bearer ${token}` }
+        });
+        job = status.data;
+      }
+      if (job.status !== 'ready') {
+        throw new Error(job.error || 'Image processing failed');
+      }
+      return job.file_id;
     } catch (error) {
       console.error('Error uploading photo:', error);
       setMessage({ type: 'error', text: 'Failed to upload photo' });
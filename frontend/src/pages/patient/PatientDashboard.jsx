@@ -27,6 +27,9 @@ const PatientDashboard = () => {
   const [showConfirmModal, setShowConfirmModal] = useState(false);
   const [selectedEvent, setSelectedEvent] = useState(null);
   const [appointments, setAppointments] = useState([]);
+  // Appointments come a page at a time, newest first
+  const [appointmentsCursor, setAppointmentsCursor] = useState(null);
+  const [hasMoreAppointments, setHasMoreAppointments] = useState(false);
   const [appointloading, setappointLoading] = useState(true);
 
 
@@ -36,7 +39,12 @@ const PatientDashboard = () => {
     activeConversation,
     messages,
     loading,
+    loadingMore,
     error,
+    hasMoreConversations,
+    hasOlderMessages,
+    loadMoreConversations,
+    loadOlderMessages,
     sendMessage,
     uploadImage,
     selectConversation,
@@ -315,10 +323,11 @@ const handleEventClick = ({ event }) => {
     emergencyContact: patientProfile?.emergencyContact || "Not specified",
   };
 
-  const fetchAppointments = async () => {
+  const fetchAppointments = async (after = null) => {
   try {
     const token = localStorage.getItem("token");
-    const response = await fetch("https://mediconnect-backend-xe6f.onrender.com/api/appointments", {
+    const query = after ? `?after=${encodeURIComponent(after)}` : "";
+    const response = await fetch(`https://mediconnect-backend-xe6f.onrender.com/api/appointments${query}`, {
       headers: {
         Authorization: `Bearer ${token}`,
       },
@@ -327,7 +336,10 @@ const handleEventClick = ({ event }) => {
     const result = await response.json();
     if (!response.ok) throw new Error(result.error || "Failed to fetch appointments");
 
-    setAppointments(result.appointments || []);
+    const page = result.appointments || [];
+    setAppointments((prev) => (after ? [...prev, ...page] : page));
+    setAppointmentsCursor(result.page?.next_cursor || null);
+    setHasMoreAppointments(Boolean(result.page?.has_more));
   } catch (err) {
     console.error("Error fetching appointments:", err);
   } finally {
@@ -689,7 +701,7 @@ useEffect(() => {
         }}
       >
         <img
-          src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${appointment.avatar}`}
+          src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${appointment.avatar}?size=thumb`}
           alt={appointment.doctorName}
           className="rounded-circle border border-white"
           style={{
@@ -760,6 +772,16 @@ useEffect(() => {
     </div>
   ))
 )}
+              {!appointloading && hasMoreAppointments && (
+                <div className="col-12 text-center">
+                  <button
+                    className="btn btn-sm btn-link"
+                    onClick={() => fetchAppointments(appointmentsCursor)}
+                  >
+                    Load more appointments
+                  </button>
+                </div>
+              )}
 
             </div>
           </div>
@@ -936,7 +958,7 @@ useEffect(() => {
               <div className="card-body p-4">
                 <div className="d-flex align-items-start gap-3">
                   <img
-                    src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${doctor.profilePhoto}`}
+                    src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${doctor.profilePhoto}?size=thumb`}
                     alt={doctor.name}
                     className="rounded-circle"
                     style={{
@@ -1113,6 +1135,17 @@ useEffect(() => {
                 </div>
               ))
             )}
+            {!loading && hasMoreConversations && (
+              <div className="text-center p-2">
+                <button
+                  className="btn btn-sm btn-link"
+                  onClick={loadMoreConversations}
+                  disabled={loadingMore}
+                >
+                  {loadingMore ? "Loading..." : "Load more conversations"}
+                </button>
+              </div>
+            )}
           </div>
         </div>
       </div>
@@ -1177,7 +1210,19 @@ useEffect(() => {
                     </small>
                   </div>
                 ) : (
-                  messages.map((message) => {
+                  <>
+                  {hasOlderMessages && (
+                    <div className="text-center mb-3">
+                      <button
+                        className="btn btn-sm btn-link"
+                        onClick={loadOlderMessages}
+                        disabled={loadingMore}
+                      >
+                        {loadingMore ? "Loading..." : "Load older messages"}
+                      </button>
+                    </div>
+                  )}
+                  {messages.map((message) => {
                     const isCurrentUser =
                       message.sender_email ===
                         localStorage.getItem("userEmail") ||
@@ -1228,7 +1273,7 @@ useEffect(() => {
                           {message.image_attachment && (
                             <div className="mb-1">
                               <img
-                                src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${message.image_attachment.file_id}`}
+                                src={`https://mediconnect-backend-xe6f.onrender.com/api/files/${message.image_attachment.file_id}?size=medium`}
                                 alt={message.image_attachment.original_name}
                                 style={{
                                   maxWidth: "200px",
@@ -1266,7 +1311,8 @@ useEffect(() => {
                         </div>
                       </div>
                     );
-                  })
+                  })}
+                  </>
                 )}
               </div>
               <div
@@ -0,0 +1,70 @@
+import axios from 'axios';
+
+const API_ORIGIN = 'https://mediconnect-backend-xe6f.onrender.com';
+const REFRESH_URL = `${API_ORIGIN}/api/token/refresh`;
+
+// Access tokens are short-lived; when an API call comes back 401 the stored
+// refresh token is exchanged for a new pair and the call is retried once.
+// Concurrent 401s share a single refresh request.
+let refreshing = null;
+
+export const refreshAccessToken = () => {
+  if (!refreshing) {
+    const refreshToken = localStorage.getItem('refreshToken');
+    refreshing = (async () => {
+      if (!refreshToken) return null;
+      const response = await window.fetch(REFRESH_URL, {
+        method: 'POST',
+        headers: { 'Content-Type': 'application/json' },
+        body: JSON.stringify({ refreshToken })
+      });
+      if (!response.ok) {
+        localStorage.removeItem('refreshToken');
+        return null;
+      }
+      const data = await response.json();
+      localStorage.setItem('token', data.token);
+      localStorage.setItem('refreshToken', data.refreshToken);
+      return data.token;
+    })()
+      .catch(() => null)
+      .finally(() => { refreshing = null; });
+  }
+  return refreshing;
+};
+
+const isApiCall = (url) => typeof url === 'string' && url.startsWith(API_ORIGIN) && url !== REFRESH_URL;
+
+const withToken = (headers, token) => {
+  const updated = new Headers(headers || {});
+  updated.set('Authorization', `Bearer ${token}`);
+  return updated;
+};
+
+const hasBearer = (headers) => Boolean(new Headers(headers || {}).get('Authorization'));
+
+export const installAuthRefresh = () => {
+  axios.interceptors.response.use(undefined, async (error) => {
+    const config = error.config;
+    if (error.response?.status !== 401 || !config || config._retried || !isApiCall(config.url)
+        || !config.headers?.Authorization) {
+      throw error;
+    }
+    const token = await refreshAccessToken();
+    if (!token) throw error;
+    config._retried = true;
+    config.headers.Authorization = `Bearer ${token}`;
+    return axios.request(config);
+  });
+
+  const originalFetch = window.fetch.bind(window);
+  window.fetch = async (input, init = {}) => {
+    const response = await originalFetch(input, init);
+    if (response.status !== 401 || !isApiCall(input) || !hasBearer(init.headers)) {
+      return response;
+    }
+    const token = await refreshAccessToken();
+    if (!token) return response;
+    return originalFetch(input, { ...init, headers: withToken(init.headers, token) });
+  };
+};
@@ -11,10 +11,12 @@ const getAuthHeaders = () => {
 };
 
 export const messageService = {
-  // Get all conversations for current user
-  getConversations: async () => {
+  // Get a page of the current user's conversations, most recent first;
+  // pass page.next_cursor as `after` for the next one
+  getConversations: async (after = null) => {
     try {
-      const response = await fetch(`${API_BASE_URL}/conversations`, {
+      const query = after ? `?after=${encodeURIComponent(after)}` : '';
+      const response = await fetch(`${API_BASE_URL}/conversations${query}`, {
         method: 'GET',
         headers: getAuthHeaders()
       });
@@ -60,8 +62,9 @@ export const messageService = {
     }
   },
 
-  // Get messages for a specific conversation
-  getMessages: async (conversationId, otherUserEmail) => {
+  // Get the latest page of messages for a conversation, oldest first; pass
+  // page.prev_cursor as `before` for the page of older messages
+  getMessages: async (conversationId, otherUserEmail, before = null) => {
     try {
       // Setup DH encryption for this conversation if possible
       if (encryptionManager.isEncryptionSupported()) {
@@ -72,7 +75,8 @@ export const messageService = {
         }
       }
 
-      const response = await fetch(`${API_BASE_URL}/conversations/${conversationId}/messages`, {
+      const query = before ? `?before=${encodeURIComponent(before)}` : '';
+      const response = await fetch(`${API_BASE_URL}/conversations/${conversationId}/messages${query}`, {
         method: 'GET',
         headers: getAuthHeaders()
       });
@@ -167,7 +171,24 @@ export const messageService = {
         throw new Error(`Failed to upload image: ${response.status} ${errorData}`);
       }
 
-      return await response.json();
+      // The image is compressed in the background; wait until it is stored
+      let job = await response.json();
+      while (job.status === 'pending') {
+        await new Promise(resolve => setTimeout(resolve, 1000));
+        const statusResponse = await fetch(`${API_BASE_URL}/upload/${job.job_id}`, {
+          method: 'GET',
+          headers: getAuthHeaders()
+        });
+        if (!statusResponse.ok) {
+          throw new Error(`Failed to check upload status: ${statusResponse.status}`);
+        }
+        job = await statusResponse.json();
+      }
+      if (job.status !== 'ready') {
+        throw new Error(job.error || 'Image processing failed');
+      }
+
+      return job;
     } catch (error) {
       console.error('Error uploading image:', error);
       throw error;
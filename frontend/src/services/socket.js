@@ -0,0 +1,29 @@
+import { io } from 'socket.io-client';
+import { refreshAccessToken } from './authRefresh';
+
+const SOCKET_URL = 'https://mediconnect-backend-xe6f.onrender.com';
+
+let socket = null;
+
+// One shared connection for the chat push events (new_message, conversation_updated).
+// The token is read on every (re)connect, so a refreshed access token is picked up.
+export const getSocket = () => {
+  if (!socket) {
+    socket = io(SOCKET_URL, {
+      auth: (cb) => cb({ token: localStorage.getItem('token') })
+    });
+
+    // A rejected handshake (e.g. expired access token) is not retried by the
+    // client; refresh the token and reconnect once
+    let retried = false;
+    socket.on('connect', () => { retried = false; });
+    socket.on('connect_error', async () => {
+      if (socket.active || retried) return;
+      retried = true;
+      if (await refreshAccessToken()) {
+        socket.connect();
+      }
+    });
+  }
+  return socket;
+};